@@ -1,9 +1,57 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, abort
 import json
 import os
+import re
+import uuid
+import threading
+from buda.utils import open_data
+from buda.progress import ProgressBroker, ProgressTracker
+from buda.analysis.likes import get_activity
+from buda.analysis.events import EventTable
+from buda.analysis.heavy_hitters import get_like_stream_statistics
+from buda.analysis.population import PopulationSketches, user_metrics, summarize_rank
+from buda.analysis.sessions import extract_timestamps, detect_sessions
+from buda.analysis.advice import AdviceCache, advice_statistics, generate_advice, on_demand_rewriter
+from buda.results_store import ResultsStore, JobResults
+from buda.snapshots import save_snapshot, load_snapshot, clear_snapshot
 
 app = Flask(__name__)
 app.secret_key = b"concon/"
+app.config.setdefault("JOBS_FOLDER", "jobs")
+app.config.setdefault("RESULTS_DB", os.path.join(app.config["JOBS_FOLDER"], "results.sqlite"))
+app.config.setdefault("POPULATION_SKETCHES", os.path.join(app.config["JOBS_FOLDER"], "population_sketches.json"))
+# Users are only compared with the population once it has this many users
+app.config.setdefault("MIN_POPULATION", 10)
+# Advice is generated locally; with an API key its wording is rewritten once per set of triggered rules
+app.config.setdefault("ADVICE_API_KEY", None)
+app.config.setdefault("ADVICE_CACHE", os.path.join(app.config["JOBS_FOLDER"], "advice_cache.json"))
+
+# Uploads are not tied to accounts yet, so all jobs belong to one user
+DEFAULT_USER = "local"
+
+# Latest progress event of every analysis job, streamed to the loading page
+progress_broker = ProgressBroker()
+
+# Results of all jobs, keyed by user, job and stage
+os.makedirs(os.path.dirname(app.config["RESULTS_DB"]) or ".", exist_ok=True)
+results_store = ResultsStore(app.config["RESULTS_DB"])
+
+# Quantile sketches of the metrics of all users, used to rank new users
+population = PopulationSketches.load(app.config["POPULATION_SKETCHES"])
+
+# Reworded advice templates, shared by all users who trigger the same rules
+advice_cache = AdviceCache(app.config["ADVICE_CACHE"])
+
+# Stages shown on the results page and the keys the template expects them under
+RESULT_STAGES = {
+    "summary": "summary",
+    "summary_categories": "watchers",
+    "day_of_week_activity": "daily_activity",
+    "hourly_activity": "hourly_activity",
+    "top_liked_accounts": "watching",
+    "liked_content_types": "content_types",
+    "advice": "advice",
+}
 
 # Mock data (in a real application, this would come from a database)
 mock_data = {
@@ -88,57 +136,177 @@ def insta_login():
     # return redirect(url_for("login"))  # You can also redirect to a different page
 
 
+def job_folder(job_id):
+    """Return the folder of a job, rejecting ids that are not ours."""
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id or ""):
+        abort(404)
+    return os.path.join(app.config["JOBS_FOLDER"], job_id)
+
+
+def run_job(job_id, file_path):
+    """Run the local analytics of an uploaded export and publish progress events."""
+    sink = progress_broker.sink(job_id)
+    try:
+        # A snapshot of earlier results must not outlive their regeneration
+        clear_snapshot(os.path.dirname(file_path))
+        # The archive handles of a ZIP export are closed when the analysis is done
+        with open_data(file_path) as data:
+            # All results of the job are written to the store in one transaction
+            with JobResults(results_store, DEFAULT_USER, job_id) as results:
+                tracker = ProgressTracker("activity", 1, sink)
+                # The export is normalized once and shared by all time analytics; this loads
+                # the datasets of a ZIP export concurrently, before any analysis reads them
+                events = EventTable.from_export(data)
+                hourly_activity, day_of_week_activity = get_activity(events)
+                results.add("hourly_activity", hourly_activity)
+                results.add("day_of_week_activity", day_of_week_activity)
+                tracker.advance()
+
+                tracker = ProgressTracker("top_liked_accounts", 1, sink)
+                statistics = get_like_stream_statistics(data)
+                results.add("top_liked_accounts", statistics.top_accounts(10))
+                results.add("liked_content_types", dict(statistics.content_types))
+                tracker.advance()
+
+                tracker = ProgressTracker("population_rank", 1, sink)
+                # The app does not classify the liked accounts, so users are ranked without category shares
+                metrics = user_metrics(events)
+                # Rank against the users before this one, then add this user for the next ones
+                ranks, users = population.rank_and_add(metrics, app.config["POPULATION_SKETCHES"])
+                results.add("population_rank", ranks)
+                results.add("summary", summarize_rank(ranks, app.config["MIN_POPULATION"], users))
+                tracker.advance()
+
+                tracker = ProgressTracker("advice", 1, sink)
+                advice = advice_statistics(
+                    hourly_activity, day_of_week_activity,
+                    sessions=detect_sessions(extract_timestamps(data)),
+                )
+                rewrite = on_demand_rewriter(app.config["ADVICE_API_KEY"]) if app.config["ADVICE_API_KEY"] else None
+                results.add("advice", generate_advice(advice, rewrite=rewrite, cache=advice_cache))
+                tracker.advance()
+
+        save_results_snapshot(job_id)
+        progress_broker.publish(job_id, {"stage": "done", "finished": True}, final=True)
+    except Exception as e:
+        app.logger.exception(f"Job {job_id} failed")
+        progress_broker.publish(job_id, {"stage": "error", "message": str(e), "finished": True}, final=True)
+
+
 @app.route("/upload", methods=["GET", "POST"])
 def upload():
     if request.method == "POST":
         if request.files["file"].filename == "":
             flash("No file uploaded")
             return render_template("upload.html")
-        return redirect(url_for("loading"))
+        job_id = uuid.uuid4().hex
+        folder = job_folder(job_id)
+        os.makedirs(folder)
+        # ZIP archives are read in place, without extracting them
+        extension = ".zip" if request.files["file"].filename.lower().endswith(".zip") else ".json"
+        file_path = os.path.join(folder, "export" + extension)
+        request.files["file"].save(file_path)
+        progress_broker.publish(job_id, {"stage": "queued", "finished": False})
+        threading.Thread(target=run_job, args=(job_id, file_path), daemon=True).start()
+        return redirect(url_for("loading", job=job_id))
     return render_template("upload.html")
 
 
 @app.route("/loading")
 def loading():
-    # In a real application, you would start processing the data here
-    # For now, we'll just render the loading template
-    return render_template("loading.html")
+    return render_template("loading.html", job=request.args.get("job"))
 
 
-@app.route("/results")
-def results():
-    data_dict = mock_data
-    file_names = [
-        "summary_categories.json",
-        "day_of_week_activity.json",
-        "hourly_activity.json",
-    ]
-    data_names = ["watchers", "daily_activity", "hourly_activity"]
-    data_directory = "data/"
-
-    # Iterate over each file path in the provided list
-    for i, file_name in enumerate(file_names):
-        file_path = os.path.join(data_directory, file_name)
-        if os.path.exists(
-            os.path.join(data_directory, file_name)
-        ) and file_name.endswith(".json"):
+@app.route("/progress/<job_id>")
+def progress(job_id):
+    job_folder(job_id)
+    if progress_broker.latest(job_id) is None:
+        abort(404)
+
+    def stream():
+        seen = 0
+        while True:
+            seen, event = progress_broker.wait(job_id, seen, timeout=15)
+            if event is None:
+                # Comment lines keep proxies from closing idle connections
+                yield ": keep-alive\n\n"
+                continue
+            yield f"data: {json.dumps(event)}\n\n"
+            if event["stage"] in ("done", "error"):
+                return
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def results_data(job_id=None):
+    """
+    Collect the data shown on the results page, or None if the job has no results.
+    """
+    data_dict = dict(mock_data, stats=dict(mock_data["stats"]))
+    if job_id:
+        stored = results_store.read(DEFAULT_USER, job_id, RESULT_STAGES)
+        if not stored:
+            return None
+        for stage, value in stored.items():
+            data_dict[RESULT_STAGES[stage]] = value
+    else:
+        # Without a job, show the results of the example analysis in data/;
+        # its advice and summary files predate the stored formats and keep the mock texts
+        for stage, name in RESULT_STAGES.items():
+            if stage in ("advice", "summary"):
+                continue
+            file_path = os.path.join("data", f"{stage}.json")
+            if not os.path.exists(file_path):
+                app.logger.warning(f"File does not exist or is not a JSON file: {file_path}")
+                continue
             try:
                 with open(file_path, "r") as f:
-                    # Load the JSON data from the file
-                    data = json.load(f)
+                    data_dict[name] = json.load(f)
+            except json.JSONDecodeError:
+                app.logger.warning(f"Error decoding JSON in file: {file_path}")
 
-                    # Append the data to the dictionary
-                    # Assuming data is a dictionary or key-value pairs
-                    data_dict[data_names[i]] = data
+    # Show the post vs reel breakdown next to the other stats
+    for kind, count in data_dict.pop("content_types", {}).items():
+        data_dict["stats"][f"{kind}s liked"] = count
+    return data_dict
 
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON in file: {file_name}")
-            except Exception as e:
-                print(f"An error occurred with file {file_name}: {e}")
-        else:
-            print(f"File does not exist or is not a JSON file: {file_name}")
 
-    return render_template("results.html", data=data_dict)
+def save_results_snapshot(job_id):
+    """Render the results page of a finished job once and store it compressed."""
+    # A fresh request context keeps flashed messages of the current visitor out of the snapshot
+    with app.test_request_context("/results", query_string={"job": job_id}):
+        data_dict = results_data(job_id)
+        if data_dict is None:
+            return None
+        html = render_template("results.html", data=data_dict)
+        return save_snapshot(job_folder(job_id), html)
+
+
+@app.route("/results")
+def results():
+    job_id = request.args.get("job")
+    if not job_id:
+        return render_template("results.html", data=results_data())
+
+    folder = job_folder(job_id)
+    snapshot = load_snapshot(folder, request.headers.get("Accept-Encoding"))
+    if snapshot is None:
+        # Jobs finished before snapshots existed are rendered on their first visit
+        if save_results_snapshot(job_id) is None:
+            abort(404)
+        snapshot = load_snapshot(folder, request.headers.get("Accept-Encoding"))
+        if snapshot is None:
+            abort(404)
+
+    body, encoding, etag = snapshot
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    # Results only change when a job is regenerated, so clients revalidate with the ETag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
 
 
 if __name__ == "__main__":
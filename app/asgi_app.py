@@ -0,0 +1,135 @@
+"""
+ASGI variant of the dashboard, serving the same routes and templates as `app.py`.
+
+Uploads are streamed to disk, results and snapshots are read off the event
+loop, and progress streams await job events instead of holding a thread,
+so thousands of idle connections cost one coroutine each. Run it with an
+ASGI server from the repository root, e.g.
+
+    pip install .[asgi]
+    hypercorn app.asgi_app:app --bind 0.0.0.0:5000
+
+Analysis jobs, results and snapshots are shared with the Flask app.
+"""
+import asyncio
+import functools
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, Response, render_template, request, redirect, url_for, flash, abort
+from buda.snapshots import load_snapshot
+from . import app as flask_app
+
+app = Quart(__name__)
+app.secret_key = flask_app.app.secret_key
+# Uploads may be large and progress streams stay open until their job is done
+app.config["BODY_TIMEOUT"] = 600
+app.config["RESPONSE_TIMEOUT"] = None
+# Number of analysis jobs running at once
+app.config.setdefault("JOB_WORKERS", 4)
+
+# Jobs run for seconds to minutes; they get their own threads, so that they
+# never hold the default pool that serves the short reads of page requests
+job_executor = ThreadPoolExecutor(max_workers=app.config["JOB_WORKERS"], thread_name_prefix="job")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function in the default thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+@app.route("/")
+async def index():
+    return await render_template("login.html")
+
+
+@app.route("/insta_login", methods=["POST"])
+async def insta_login():
+    await flash("Functionality not ready")
+    return await render_template("login.html")
+
+
+@app.route("/upload", methods=["GET", "POST"])
+async def upload():
+    if request.method == "POST":
+        # The form parser spools file parts to disk while the body arrives
+        files = await request.files
+        upload = files.get("file")
+        if upload is None or upload.filename == "":
+            await flash("No file uploaded")
+            return await render_template("upload.html")
+        job_id = uuid.uuid4().hex
+        folder = flask_app.job_folder(job_id)
+        os.makedirs(folder)
+        extension = ".zip" if upload.filename.lower().endswith(".zip") else ".json"
+        file_path = os.path.join(folder, "export" + extension)
+        await upload.save(file_path)
+        flask_app.progress_broker.publish(job_id, {"stage": "queued", "finished": False})
+        asyncio.get_running_loop().run_in_executor(job_executor, flask_app.run_job, job_id, file_path)
+        return redirect(url_for("loading", job=job_id))
+    return await render_template("upload.html")
+
+
+@app.route("/loading")
+async def loading():
+    return await render_template("loading.html", job=request.args.get("job"))
+
+
+@app.route("/progress/<job_id>")
+async def progress(job_id):
+    flask_app.job_folder(job_id)
+    if flask_app.progress_broker.latest(job_id) is None:
+        abort(404)
+
+    async def stream():
+        seen = 0
+        while True:
+            seen, event = await flask_app.progress_broker.wait_async(job_id, seen, timeout=15)
+            if event is None:
+                # Comment lines keep proxies from closing idle connections
+                yield b": keep-alive\n\n"
+                continue
+            yield f"data: {json.dumps(event)}\n\n".encode("utf-8")
+            if event["stage"] in ("done", "error"):
+                return
+
+    response = Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    response.timeout = None
+    return response
+
+
+@app.route("/results")
+async def results():
+    job_id = request.args.get("job")
+    if not job_id:
+        data_dict = await run_blocking(flask_app.results_data)
+        return await render_template("results.html", data=data_dict)
+
+    folder = flask_app.job_folder(job_id)
+    accept_encoding = request.headers.get("Accept-Encoding")
+    snapshot = await run_blocking(load_snapshot, folder, accept_encoding)
+    if snapshot is None:
+        # Jobs finished before snapshots existed are rendered on their first visit
+        if await run_blocking(flask_app.save_results_snapshot, job_id) is None:
+            abort(404)
+        snapshot = await run_blocking(load_snapshot, folder, accept_encoding)
+        if snapshot is None:
+            abort(404)
+
+    body, encoding, etag = snapshot
+    headers = {
+        "ETag": f'"{etag}"',
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "private, no-cache",
+    }
+    if request.if_none_match.contains(etag):
+        return Response(b"", status=304, headers=headers)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype="text/html", headers=headers)
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,302 @@
+"""
+Load generator for the dashboard routes.
+
+Start the app locally, then run e.g.
+
+    python loadtest.py --url http://127.0.0.1:5000 --scenario upload --concurrency 8 \
+        --duration 30 --likes 5000 --server-pid $(pgrep -f app.py) --report loadtest.json
+
+Scenarios:
+
+* upload   every virtual user uploads a synthetic export, follows the job's
+           progress stream until it is done and fetches its results page
+* results  the results pages of a few finished jobs are fetched repeatedly
+* loading  the loading page of a finished job is fetched repeatedly
+
+The report holds throughput, latency percentiles and error rates per route,
+and the server's resident memory before, during and after the run.
+"""
+import io
+import json
+import time
+import random
+import zipfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+SCENARIOS = ("upload", "results", "loading")
+PERCENTILES = (50, 90, 95, 99)
+
+
+def synthetic_export(n_likes, n_accounts=None, seed=0):
+    """
+    Generate liked posts in the layout of an Instagram export.
+
+    Parameters
+    ----------
+    n_likes : int
+        Number of liked posts.
+    n_accounts : int, optional
+        Number of distinct liked accounts, by default a tenth of the likes.
+    seed : int, optional
+        Seed of the random number generator, by default 0.
+
+    Returns
+    -------
+    dict
+        The export data with a 'likes_media_likes' list.
+    """
+    rng = random.Random(seed)
+    n_accounts = n_accounts or max(n_likes // 10, 1)
+    end = int(time.time())
+    likes = []
+    for i in range(n_likes):
+        kind = "reel" if rng.random() < 0.3 else "p"
+        likes.append({
+            "title": f"account{int(rng.paretovariate(1.2)) % n_accounts}",
+            "media_list_data": [],
+            "string_list_data": [{
+                "href": f"https://www.instagram.com/{kind}/{i:x}/",
+                "value": "\U0001f44d",
+                "timestamp": end - rng.randrange(365 * 24 * 3600),
+            }],
+        })
+    return {"likes_media_likes": likes}
+
+
+def export_file(data, compress=False):
+    """Return the name and content of an upload of the export."""
+    content = json.dumps(data).encode("utf-8")
+    if not compress:
+        return "liked_posts.json", content
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("your_instagram_activity/likes/liked_posts.json", content)
+    return "instagram-export.zip", buffer.getvalue()
+
+
+def server_rss(pid):
+    """Return the resident memory of a process in bytes, or None if unknown."""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+class Recorder:
+    """
+    Thread-safe record of request latencies and errors per route.
+    """
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        """Record one request."""
+        with self._lock:
+            self._samples.setdefault(route, []).append((seconds, ok))
+
+    def timed(self, route, func, *args, **kwargs):
+        """
+        Run a request and record its latency; errors and non-2xx/3xx answers count as failed.
+        """
+        start = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+        except requests.RequestException:
+            self.record(route, time.perf_counter() - start, False)
+            return None
+        self.record(route, time.perf_counter() - start, response.status_code < 400)
+        return response
+
+    def summary(self, elapsed):
+        """
+        Summarize the recorded requests.
+
+        Parameters
+        ----------
+        elapsed : float
+            Duration of the run in seconds.
+
+        Returns
+        -------
+        dict
+            Per route the number of requests, throughput, error rate and latency
+            percentiles in milliseconds.
+        """
+        with self._lock:
+            samples = {route: list(values) for route, values in self._samples.items()}
+        summary = {}
+        for route, values in sorted(samples.items()):
+            latencies = np.array([seconds for seconds, _ in values]) * 1000
+            errors = sum(not ok for _, ok in values)
+            summary[route] = {
+                "requests": len(values),
+                "throughput": len(values) / elapsed if elapsed else None,
+                "error_rate": errors / len(values),
+                **{f"p{q}_ms": float(np.percentile(latencies, q)) for q in PERCENTILES},
+                "max_ms": float(latencies.max()),
+            }
+        return summary
+
+
+def follow_progress(session, base_url, job_id, recorder, timeout):
+    """Read the progress stream of a job until it is done; return whether it succeeded."""
+    start = time.perf_counter()
+    try:
+        with session.get(f"{base_url}/progress/{job_id}", stream=True, timeout=timeout) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    stage = json.loads(line[5:])["stage"]
+                    if stage in ("done", "error"):
+                        recorder.record("progress", time.perf_counter() - start, stage == "done")
+                        return stage == "done"
+    except requests.RequestException:
+        pass
+    recorder.record("progress", time.perf_counter() - start, False)
+    return False
+
+
+def upload_job(session, base_url, upload, recorder, timeout):
+    """Upload an export, wait for its job and fetch the results; return the job id."""
+    name, content = upload
+    response = recorder.timed(
+        "upload", session.post, f"{base_url}/upload",
+        files={"file": (name, content)}, allow_redirects=False, timeout=timeout,
+    )
+    if response is None or "job=" not in response.headers.get("Location", ""):
+        return None
+    job_id = response.headers["Location"].split("job=")[1]
+    if not follow_progress(session, base_url, job_id, recorder, timeout):
+        return None
+    recorder.timed("results", session.get, f"{base_url}/results", params={"job": job_id}, timeout=timeout)
+    return job_id
+
+
+def run(base_url, scenario="upload", concurrency=4, duration=10.0, likes=1000, compress=False,
+        jobs=4, server_pid=None, timeout=60.0):
+    """
+    Run a load test scenario against a running app.
+
+    Parameters
+    ----------
+    base_url : str
+        The URL of the app, e.g. "http://127.0.0.1:5000".
+    scenario : str, optional
+        One of `SCENARIOS`, by default "upload".
+    concurrency : int, optional
+        Number of concurrent virtual users, by default 4.
+    duration : float, optional
+        Seconds during which new requests are started, by default 10.
+    likes : int, optional
+        Number of liked posts in each synthetic export, by default 1000.
+    compress : bool, optional
+        Whether exports are uploaded as ZIP archives, by default False.
+    jobs : int, optional
+        Number of jobs prepared for the results and loading scenarios, by default 4.
+    server_pid : int, optional
+        Process id of the app, used to sample its resident memory, by default None.
+    timeout : float, optional
+        Timeout of each request in seconds, by default 60.
+
+    Returns
+    -------
+    dict
+        The report, see `Recorder.summary`, with the scenario settings and the
+        server's resident memory in bytes.
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario {scenario!r}, expected one of {SCENARIOS}")
+    base_url = base_url.rstrip("/")
+    upload = export_file(synthetic_export(likes), compress)
+
+    prepared = []
+    if scenario != "upload":
+        with requests.Session() as session:
+            prepared = [upload_job(session, base_url, upload, Recorder(), timeout) for _ in range(jobs)]
+        prepared = [job_id for job_id in prepared if job_id]
+        if not prepared:
+            raise RuntimeError("No job could be prepared, is the app running?")
+
+    recorder = Recorder()
+    memory = {"before": server_rss(server_pid), "peak": server_rss(server_pid)}
+    stop = threading.Event()
+
+    def sample_memory():
+        while not stop.wait(0.5):
+            rss = server_rss(server_pid)
+            if rss is not None and (memory["peak"] is None or rss > memory["peak"]):
+                memory["peak"] = rss
+
+    def virtual_user(seed):
+        rng = random.Random(seed)
+        deadline = time.monotonic() + duration
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                if scenario == "upload":
+                    upload_job(session, base_url, upload, recorder, timeout)
+                else:
+                    route = "results" if scenario == "results" else "loading"
+                    recorder.timed(route, session.get, f"{base_url}/{route}",
+                                   params={"job": rng.choice(prepared)}, timeout=timeout)
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(virtual_user, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    memory["after"] = server_rss(server_pid)
+    if memory["before"] is not None and memory["after"] is not None:
+        memory["growth"] = memory["after"] - memory["before"]
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "duration": elapsed,
+        "likes_per_export": likes,
+        "routes": recorder.summary(elapsed),
+        "server_memory": memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the dashboard routes of a running app.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="URL of the app")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="upload")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds during which requests are started")
+    parser.add_argument("--likes", type=int, default=1000, help="liked posts per synthetic export")
+    parser.add_argument("--zip", action="store_true", help="upload exports as ZIP archives")
+    parser.add_argument("--jobs", type=int, default=4, help="jobs prepared for the results and loading scenarios")
+    parser.add_argument("--server-pid", type=int, help="process id of the app, to sample its memory")
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout of each request in seconds")
+    parser.add_argument("--report", help="path of a JSON file the report is written to")
+    args = parser.parse_args()
+
+    report = run(args.url, args.scenario, args.concurrency, args.duration, args.likes, args.zip,
+                 args.jobs, args.server_pid, args.timeout)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
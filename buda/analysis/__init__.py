@@ -1,2 +1,3 @@
 from .likes import *
-from .companies import *
\ No newline at end of file
+from .companies import *
+from .sessions import *
\ No newline at end of file
@@ -0,0 +1,320 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from string import Formatter
+from collections import namedtuple
+import numpy as np
+from ..answers import UNRESOLVED
+from ..transport import RequestPolicy
+
+# A piece of advice shown when `condition(statistics)` holds. The text is a
+# format string over the statistics, e.g. "{peak_hour}:00".
+Rule = namedtuple("Rule", ["name", "condition", "text"])
+
+RULES = [
+    Rule(
+        "night_owl",
+        lambda s: s["night_share"] >= 0.25,
+        "{night_percent}% of your likes happen between midnight and 6am. Winding down earlier could improve your sleep.",
+    ),
+    Rule(
+        "peak_hour",
+        lambda s: s["total"] > 0,
+        "Your activity peaks around {peak_hour}:00. Post during this window to reach people with habits like yours.",
+    ),
+    Rule(
+        "weekend_scroller",
+        lambda s: s["weekend_share"] >= 0.4,
+        "{weekend_percent}% of your likes fall on weekends. Schedule posts for Saturday and Sunday to match.",
+    ),
+    Rule(
+        "weekday_regular",
+        lambda s: s["total"] > 0 and s["weekend_share"] < 0.15,
+        "You are mostly active on weekdays, with {busiest_day} the busiest. Plan your content around the work week.",
+    ),
+    Rule(
+        "category_focus",
+        lambda s: s["top_category_share"] >= 0.5,
+        "{top_category_percent}% of the accounts you like are {top_category}. Following accounts from other categories diversifies your feed.",
+    ),
+    Rule(
+        "long_sessions",
+        lambda s: s["median_session_minutes"] >= 30,
+        "Your typical scrolling session lasts {median_session_minutes:.0f} minutes. Setting a daily time limit can help.",
+    ),
+    Rule(
+        "frequent_checks",
+        lambda s: s["sessions_per_day"] >= 10,
+        "You open Instagram about {sessions_per_day:.0f} times on an active day. Batching your visits saves time.",
+    ),
+    Rule(
+        "quiet_user",
+        lambda s: 0 < s["total"] < 50,
+        "You rarely like posts. Engaging more with your favourite accounts boosts your visibility.",
+    ),
+]
+
+DEFAULT_ADVICE = ["Engage more with your top followers to boost your account's visibility."]
+
+_DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def _histogram(counts, size):
+    histogram = np.zeros(size, dtype=np.int64)
+    for key, count in (counts or {}).items():
+        histogram[int(key)] += count
+    return histogram
+
+
+def advice_statistics(hourly_activity, day_of_week_activity, category_shares=None, sessions=None):
+    """
+    Compute the statistics the advice rules are evaluated on.
+
+    Parameters
+    ----------
+    hourly_activity : dict
+        Number of likes by hour of the day (keys may be strings, as stored in JSON).
+    day_of_week_activity : dict
+        Number of likes by day of the week, 0 is Monday.
+    category_shares : dict, optional
+        Counts or shares of the liked accounts by category, e.g. the liked posts
+        category counts, by default None.
+    sessions : pandas.DataFrame, optional
+        Sessions as returned by `buda.analysis.sessions.detect_sessions`, by default None.
+
+    Returns
+    -------
+    dict
+        Totals, shares (0-1) and their rounded percentages, the peak hour,
+        the busiest day, the top category and session metrics.
+    """
+    hours = _histogram(hourly_activity, 24)
+    days = _histogram(day_of_week_activity, 7)
+    total = int(hours.sum())
+    day_total = int(days.sum())
+    statistics = {
+        "total": total,
+        "peak_hour": int(hours.argmax()),
+        "night_share": float(hours[:6].sum() / total) if total else 0.0,
+        "weekend_share": float(days[5:].sum() / day_total) if day_total else 0.0,
+        "busiest_day": _DAYS[int(days.argmax())],
+        "top_category": None,
+        "top_category_share": 0.0,
+        "median_session_minutes": 0.0,
+        "sessions_per_day": 0.0,
+    }
+
+    if category_shares:
+        category_total = sum(category_shares.values())
+        top = max(category_shares, key=category_shares.get)
+        if category_total and top != "Other" and top not in UNRESOLVED:
+            statistics["top_category"] = top
+            statistics["top_category_share"] = category_shares[top] / category_total
+
+    if sessions is not None and len(sessions):
+        statistics["median_session_minutes"] = float(sessions["duration"].median() / 60)
+        active_days = len(np.unique(sessions["start"].to_numpy() // 86400))
+        statistics["sessions_per_day"] = len(sessions) / active_days
+
+    for share in ("night", "weekend", "top_category"):
+        statistics[f"{share}_percent"] = round(100 * statistics[f"{share}_share"])
+    return statistics
+
+
+def evaluate_rules(statistics, rules=RULES, limit=4):
+    """
+    Return the rules that apply to a user.
+
+    Parameters
+    ----------
+    statistics : dict
+        Statistics as returned by `advice_statistics`.
+    rules : list of Rule, optional
+        The rule set, in order of importance, by default `RULES`.
+    limit : int, optional
+        Maximum number of rules, by default 4.
+
+    Returns
+    -------
+    list of Rule
+        The triggered rules, most important first.
+    """
+    return [rule for rule in rules if rule.condition(statistics)][:limit]
+
+
+class AdviceCache:
+    """
+    Reworded advice templates, keyed by the set of triggered rules.
+
+    Templates keep their placeholders, so one cached rewording serves every
+    user who triggers the same rules.
+
+    Parameters
+    ----------
+    file_path : str, optional
+        JSON file the cache is persisted to, by default the cache lives in memory.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self._templates = {}
+        self._lock = threading.Lock()
+        if file_path is not None and os.path.exists(file_path):
+            with open(file_path, "r") as f:
+                self._templates = json.load(f)
+
+    @staticmethod
+    def key(rules):
+        """Return the cache key of a set of rules."""
+        names = "\n".join(sorted(rule.name for rule in rules))
+        return hashlib.sha256(names.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, rules):
+        """Return the cached templates of a set of rules, or None."""
+        with self._lock:
+            return self._templates.get(self.key(rules))
+
+    def put(self, rules, templates):
+        """Cache the templates of a set of rules."""
+        with self._lock:
+            self._templates[self.key(rules)] = templates
+            if self.file_path is not None:
+                temporary = f"{self.file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporary, "w") as f:
+                    json.dump(self._templates, f, indent=4)
+                os.replace(temporary, self.file_path)
+
+    def __len__(self):
+        return len(self._templates)
+
+
+def _fields(template):
+    """
+    Return the field names and format specs of a template.
+
+    Raises
+    ------
+    ValueError
+        If the template is malformed, e.g. has an unmatched brace.
+    """
+    return sorted((field, spec) for _, field, spec, _ in Formatter().parse(template) if field is not None)
+
+
+def _valid_rewording(template, rewording, statistics):
+    """
+    Whether a reworded template uses exactly the fields of the original and formats.
+
+    Fields must be bare names, so attribute or item access and conversions
+    cannot be injected; the format specs must be those of the original.
+    """
+    if not isinstance(rewording, str):
+        return False
+    try:
+        fields = _fields(rewording)
+        if fields != _fields(template) or any(not field.isidentifier() for field, _ in fields):
+            return False
+        if any(conversion for _, _, _, conversion in Formatter().parse(rewording)):
+            return False
+        rewording.format(**statistics)
+    except (ValueError, KeyError, IndexError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def generate_advice(statistics, rules=RULES, rewrite=None, cache=None, limit=4):
+    """
+    Generate advice for a user from their statistics.
+
+    The rules are evaluated locally. If a `rewrite` function is given, the
+    templates of the triggered rules are reworded by it once per set of rules
+    and cached; a rewording that is malformed or does not use exactly the
+    fields of the original is replaced by the original.
+
+    Parameters
+    ----------
+    statistics : dict
+        Statistics as returned by `advice_statistics`.
+    rules : list of Rule, optional
+        The rule set, by default `RULES`.
+    rewrite : callable, optional
+        Function taking a list of templates and returning reworded templates,
+        e.g. from `on_demand_rewriter`, by default the templates are used as is.
+    cache : AdviceCache, optional
+        Cache of reworded templates, by default a new in-memory cache.
+    limit : int, optional
+        Maximum number of pieces of advice, by default 4.
+
+    Returns
+    -------
+    list of str
+        The advice.
+    """
+    triggered = evaluate_rules(statistics, rules, limit)
+    if not triggered:
+        return list(DEFAULT_ADVICE)
+
+    templates = [rule.text for rule in triggered]
+    if rewrite is not None:
+        cache = cache if cache is not None else AdviceCache()
+        reworded = cache.get(triggered)
+        if reworded is None:
+            try:
+                reworded = rewrite(templates)
+            except Exception as e:
+                logging.warning(f"Advice rewording failed, using the rule texts: {e}")
+                reworded = None
+            if reworded is not None and len(reworded) == len(templates):
+                reworded = [
+                    new if _valid_rewording(old, new, statistics) else old
+                    for old, new in zip(templates, reworded)
+                ]
+                cache.put(triggered, reworded)
+        if reworded is not None and len(reworded) == len(templates):
+            # Cached rewordings are checked again, the cache file may predate these checks
+            templates = [
+                new if _valid_rewording(old, new, statistics) else old
+                for old, new in zip(templates, reworded)
+            ]
+    return [template.format(**statistics) for template in templates]
+
+
+def on_demand_rewriter(api_key, policy=None, external_user_id="advice_writer"):
+    """
+    Return a function that rewords advice templates with the on-demand API.
+
+    Parameters
+    ----------
+    api_key : str
+        API key for authentication.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, deadline and cassette of the requests, by default the default timeouts.
+    external_user_id : str, optional
+        An identifier for the user making the request, by default "advice_writer".
+
+    Returns
+    -------
+    callable
+        A function taking a list of templates and returning the reworded templates.
+    """
+    policy = policy or RequestPolicy()
+    headers = {"apikey": api_key}
+
+    def rewrite(templates):
+        session = policy.post(
+            "https://api.on-demand.io/chat/v1/sessions", headers,
+            {"pluginIds": [], "externalUserId": external_user_id},
+        )
+        query = (
+            "Reword each of the following pieces of advice for a social media dashboard to sound friendly and "
+            "concise. Keep every placeholder in curly braces exactly as it is. Answer with one piece of advice "
+            "per line, in the same order, and nothing else.\n\n" + "\n".join(templates)
+        )
+        answer = policy.post(
+            f"https://api.on-demand.io/chat/v1/sessions/{session['data']['id']}/query", headers,
+            {"endpointId": "predefined-openai-gpt4o", "query": query, "pluginIds": [], "responseMode": "sync"},
+        )
+        return [line.strip() for line in answer["data"]["answer"].splitlines() if line.strip()]
+
+    return rewrite
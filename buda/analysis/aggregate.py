@@ -0,0 +1,264 @@
+import os
+import json
+import zlib
+import shutil
+import logging
+import tempfile
+import numpy as np
+from ..answers import UNRESOLVED
+from .categories import COMPANY_CATEGORIES, ACCOUNT_CATEGORIES
+
+# Vocabularies of the categorized names of each user
+KINDS = {"companies": COMPANY_CATEGORIES, "accounts": ACCOUNT_CATEGORIES}
+
+# Rough memory use in bytes of one buffered name vote, on top of the name itself
+_ENTRY_SIZE = 200
+
+
+def _histogram(counts, size):
+    """
+    Return a histogram with integer keys, checked to be in range(size).
+
+    Raises
+    ------
+    ValueError
+        If a key is not an integer in range(size).
+    """
+    histogram = {}
+    for key, count in (counts or {}).items():
+        index = int(key)
+        if not 0 <= index < size:
+            raise ValueError(f"Histogram key {key!r} is not in range({size})")
+        histogram[index] = int(count)
+    return histogram
+
+
+class PopulationAggregator:
+    """
+    Exact category counts and activity histograms over many users, out of core.
+
+    Users are added one at a time and processed in chunks. Per-user counts
+    are summed into fixed-size arrays, so they need constant memory however
+    many users are added. The votes on the category of every distinct name
+    grow with the number of names instead; they are buffered up to a memory
+    budget and then spilled to disk, hash-partitioned by name, so that each
+    partition can later be merged on its own.
+
+    Parameters
+    ----------
+    memory_budget : int, optional
+        Approximate bytes of buffered name votes before they are spilled, by
+        default 256 MiB.
+    chunk_size : int, optional
+        Number of users processed at once, by default 1000.
+    n_partitions : int, optional
+        Number of spill partitions, by default 64.
+    spill_dir : str, optional
+        Folder of the spill files, by default a temporary folder that is
+        removed by `close`.
+    """
+
+    def __init__(self, memory_budget=256 * 2 ** 20, chunk_size=1000, n_partitions=64, spill_dir=None):
+        self.memory_budget = memory_budget
+        self.chunk_size = chunk_size
+        self.n_partitions = n_partitions
+        self._owns_spill_dir = spill_dir is None
+        self.spill_dir = tempfile.mkdtemp(prefix="buda-aggregate-") if spill_dir is None else spill_dir
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+        self.users = 0
+        self.spills = 0
+        self.hourly = np.zeros(24, dtype=np.int64)
+        self.daily = np.zeros(7, dtype=np.int64)
+        self.counts = {kind: np.zeros(len(vocabulary.categories), dtype=np.int64) for kind, vocabulary in KINDS.items()}
+        self._chunk = []
+        self._votes = {}
+        self._buffered = 0
+
+    def add_user(self, company_categories=None, account_categories=None, hourly_activity=None, day_of_week_activity=None):
+        """
+        Add the partial aggregates of one user.
+
+        Parameters
+        ----------
+        company_categories : dict, optional
+            A dictionary mapping the companies advertising to the user to categories.
+        account_categories : dict, optional
+            A dictionary mapping the accounts the user liked to categories.
+        hourly_activity : dict, optional
+            Number of likes by hour of the day (keys may be strings, as stored in JSON).
+        day_of_week_activity : dict, optional
+            Number of likes by day of the week, 0 is Monday.
+
+        Notes
+        -----
+        A user whose activity has a key that is not an hour (0-23) or a day
+        of the week (0-6) is skipped with a warning, so one corrupt result
+        cannot fail or skew the whole aggregation.
+        """
+        try:
+            hourly = _histogram(hourly_activity, len(self.hourly))
+            daily = _histogram(day_of_week_activity, len(self.daily))
+        except (ValueError, TypeError) as e:
+            logging.warning(f"Skipping a user with invalid activity: {e}")
+            return
+        self._chunk.append({
+            "companies": company_categories or {},
+            "accounts": account_categories or {},
+            "hourly": hourly,
+            "daily": daily,
+        })
+        if len(self._chunk) >= self.chunk_size:
+            self._process_chunk()
+
+    def _process_chunk(self):
+        chunk, self._chunk = self._chunk, []
+        if not chunk:
+            return
+        self.users += len(chunk)
+
+        for field, histogram in (("hourly", self.hourly), ("daily", self.daily)):
+            keys = np.array([key for user in chunk for key in user[field]], dtype=np.int64)
+            values = np.array([value for user in chunk for value in user[field].values()], dtype=np.int64)
+            histogram += np.bincount(keys, weights=values, minlength=len(histogram)).astype(np.int64)
+
+        for kind, vocabulary in KINDS.items():
+            names = [name for user in chunk for name in user[kind]]
+            answers = [answer for user in chunk for answer in user[kind].values()]
+            if not names:
+                continue
+            codes = vocabulary.encode(answers)
+            self.counts[kind] += vocabulary.count(codes)
+            votes = self._votes.setdefault(kind, {})
+            for name, answer, code in zip(names, answers, codes.tolist()):
+                if answer in UNRESOLVED:
+                    continue
+                name_votes = votes.get(name)
+                if name_votes is None:
+                    name_votes = votes[name] = {}
+                    self._buffered += _ENTRY_SIZE + len(name)
+                name_votes[code] = name_votes.get(code, 0) + 1
+
+        if self._buffered > self.memory_budget:
+            self._spill()
+
+    def _partition(self, name):
+        return zlib.crc32(name.encode("utf-8")) % self.n_partitions
+
+    def _spill(self):
+        lines = [[] for _ in range(self.n_partitions)]
+        for kind, votes in self._votes.items():
+            for name, name_votes in votes.items():
+                lines[self._partition(name)].append(json.dumps([kind, name, name_votes]) + "\n")
+        for partition, partition_lines in enumerate(lines):
+            if partition_lines:
+                with open(os.path.join(self.spill_dir, f"partition-{partition}.jsonl"), "a", encoding="utf-8") as f:
+                    f.writelines(partition_lines)
+        self.spills += 1
+        logging.info(f"Spilled {self._buffered} bytes of name votes to {self.spill_dir}")
+        self._votes = {}
+        self._buffered = 0
+
+    def _distinct_counts(self):
+        """Count distinct names per majority category, one partition at a time."""
+        distinct = {kind: np.zeros(len(vocabulary.categories), dtype=np.int64) for kind, vocabulary in KINDS.items()}
+
+        def add(votes):
+            for kind, names in votes.items():
+                for name_votes in names.values():
+                    # Ties go to the lowest category code, so the result does not depend on the input order
+                    code = max(name_votes.items(), key=lambda vote: (vote[1], -int(vote[0])))[0]
+                    distinct[kind][int(code)] += 1
+
+        if not self.spills:
+            add(self._votes)
+            return distinct
+
+        self._spill()
+        for partition in range(self.n_partitions):
+            path = os.path.join(self.spill_dir, f"partition-{partition}.jsonl")
+            if not os.path.exists(path):
+                continue
+            votes = {}
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    kind, name, name_votes = json.loads(line)
+                    merged = votes.setdefault(kind, {}).setdefault(name, {})
+                    for code, count in name_votes.items():
+                        merged[code] = merged.get(code, 0) + count
+            add(votes)
+        return distinct
+
+    def result(self):
+        """
+        Finish the aggregation.
+
+        Returns
+        -------
+        dict
+            The number of users; for companies and accounts the category counts,
+            the broad category counts and the number of distinct names per
+            category (by majority vote over the users, names never resolved left
+            out); and the hourly and day-of-week activity histograms.
+        """
+        self._process_chunk()
+        distinct = self._distinct_counts()
+        result = {"users": self.users}
+        for kind, vocabulary in KINDS.items():
+            counts = self.counts[kind]
+            broad = np.bincount(vocabulary.to_broad(np.arange(len(counts))), weights=counts,
+                                minlength=len(vocabulary.broad_categories)).astype(np.int64)
+            result[f"{kind}_categories"] = vocabulary.counts_to_dict(counts)
+            result[f"{kind}_broad_categories"] = vocabulary.counts_to_dict(broad, broad=True)
+            result[f"distinct_{kind}"] = vocabulary.counts_to_dict(distinct[kind])
+        result["hourly_activity"] = {str(hour): int(count) for hour, count in enumerate(self.hourly) if count}
+        result["day_of_week_activity"] = {str(day): int(count) for day, count in enumerate(self.daily) if count}
+        return result
+
+    def close(self):
+        """Remove the spill files."""
+        if self._owns_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+        else:
+            for partition in range(self.n_partitions):
+                path = os.path.join(self.spill_dir, f"partition-{partition}.jsonl")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def aggregate_results_store(store, output_folder=None, **kwargs):
+    """
+    Aggregate the latest job of every user in a results store.
+
+    Parameters
+    ----------
+    store : buda.results_store.ResultsStore
+        The store with the per-user results.
+    output_folder : str, optional
+        The folder where 'population_statistics.json' will be saved, by default
+        the statistics are not saved.
+    **kwargs
+        Arguments of `PopulationAggregator`, e.g. `memory_budget`.
+
+    Returns
+    -------
+    dict
+        The population statistics, see `PopulationAggregator.result`.
+    """
+    stages = ("company_categories", "account_categories", "hourly_activity", "day_of_week_activity")
+    with PopulationAggregator(**kwargs) as aggregator:
+        for user, job in store.latest_jobs():
+            aggregator.add_user(**store.read(user, job, stages))
+        result = aggregator.result()
+
+    if output_folder is not None:
+        os.makedirs(output_folder, exist_ok=True)
+        with open(os.path.join(output_folder, "population_statistics.json"), "w") as f:
+            json.dump(result, f, indent=4)
+    return result
@@ -0,0 +1,251 @@
+import re
+import numpy as np
+import pandas as pd
+from ..answers import PENDING
+
+# Leading list numbering ("3. ") and label prefixes ("Category: ") the LLM sometimes adds
+_ANSWER_PREFIX = re.compile(r"^\s*(?:\d+\s*[.)]\s*|category\s*:\s*)", re.IGNORECASE)
+_ANSWER_STRIP = " \t\r\n.,;:!'\"`*"
+
+
+def _canonical(text):
+    text = _ANSWER_PREFIX.sub("", str(text)).strip(_ANSWER_STRIP)
+    return " ".join(text.replace("&", "and").split()).casefold()
+
+
+class CategoryVocabulary:
+    """
+    Fixed set of categories with small integer codes.
+
+    Free-text answers are normalized onto the vocabulary once per distinct
+    answer and stored as `uint8` codes, so counting categories and mapping
+    them to broad categories are vectorized `bincount` and gather operations.
+
+    Parameters
+    ----------
+    categories : sequence of str
+        The category names, in code order.
+    broad_mapping : dict
+        Mapping from category names to broad category names.
+    broad_default : str
+        Broad category of categories missing from `broad_mapping`.
+    fallback : str, optional
+        Category assigned to answers that match no category, by default "Other".
+    """
+
+    def __init__(self, categories, broad_mapping, broad_default, fallback="Other"):
+        self.categories = tuple(categories)
+        self._codes = {_canonical(category): code for code, category in enumerate(self.categories)}
+        self.fallback = self._codes[_canonical(fallback)]
+
+        broad = [broad_mapping.get(category, broad_default) for category in self.categories]
+        self.broad_categories = tuple(sorted(set(broad)))
+        broad_codes = {category: code for code, category in enumerate(self.broad_categories)}
+        self._broad_table = np.array([broad_codes[category] for category in broad], dtype=np.uint8)
+
+    def normalize(self, answer):
+        """
+        Map a free-text answer onto the vocabulary.
+
+        Parameters
+        ----------
+        answer : str
+            The raw answer, e.g. "Technology." or "category: technology".
+
+        Returns
+        -------
+        int
+            The code of the matching category, or of the fallback category.
+        """
+        text = _canonical(answer)
+        if text in self._codes:
+            return self._codes[text]
+        # Answers like "The company is in Technology" contain the category name
+        matches = [name for name in self._codes if re.search(rf"\b{re.escape(name)}\b", text)]
+        if matches:
+            return self._codes[max(matches, key=len)]
+        return self.fallback
+
+    def encode(self, answers):
+        """
+        Encode answers as category codes.
+
+        Parameters
+        ----------
+        answers : iterable of str
+            The raw answers.
+
+        Returns
+        -------
+        numpy.ndarray
+            A `uint8` array with one category code per answer.
+        """
+        inverse, uniques = pd.factorize(pd.Series(list(answers), dtype=object))
+        table = np.array([self.normalize(answer) for answer in uniques], dtype=np.uint8)
+        return table[inverse]
+
+    def count(self, codes):
+        """
+        Count category codes.
+
+        Parameters
+        ----------
+        codes : numpy.ndarray
+            Category codes as returned by `encode`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The number of occurrences of each category, indexed by code.
+        """
+        return np.bincount(codes, minlength=len(self.categories))
+
+    def count_broad(self, codes):
+        """
+        Count broad categories of category codes.
+
+        Parameters
+        ----------
+        codes : numpy.ndarray
+            Category codes as returned by `encode`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The number of occurrences of each broad category, indexed like `broad_categories`.
+        """
+        return np.bincount(self.to_broad(codes), minlength=len(self.broad_categories))
+
+    def to_broad(self, codes):
+        """
+        Map category codes to broad category codes.
+
+        Parameters
+        ----------
+        codes : numpy.ndarray
+            Category codes as returned by `encode`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The broad category codes, indexing `broad_categories`.
+        """
+        return self._broad_table[codes]
+
+    def counts_to_dict(self, counts, broad=False):
+        """
+        Convert a count array to a dictionary of the non-zero counts.
+
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            Counts as returned by `count` or `count_broad`.
+        broad : bool, optional
+            Whether the counts are broad category counts, by default False.
+
+        Returns
+        -------
+        dict
+            A dictionary mapping category names to counts.
+        """
+        names = self.broad_categories if broad else self.categories
+        return {names[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+
+COMPANY_CATEGORIES = CategoryVocabulary(
+    [
+        "E-commerce",
+        "Healthcare",
+        "Technology",
+        "Education",
+        "Finance",
+        "Hospitality",
+        "Real Estate",
+        "Media and Entertainment",
+        "Consulting",
+        "Non-profit",
+        "Food and Beverage",
+        "Retail",
+        "Transportation",
+        "Energy",
+        "Fashion and Beauty",
+        "Photography",
+        "Sports and Fitness",
+        "Gaming",
+        "Travel",
+        "Advertising",
+        # The API answers with this brand name instead of a category
+        "PetSafe Brand",
+        "Other",
+        "Unknown",
+        PENDING,
+    ],
+    broad_mapping={
+        'Media and Entertainment': 'Media',
+        'Fashion and Beauty': 'Media',
+        'Gaming': 'Media',
+        'Photography': 'Media',
+        'Sports and Fitness': 'Media',
+        'Consulting': 'Business',
+        'Real Estate': 'Business',
+        'Advertising': 'Business',
+        'Finance': 'Business',
+        'Non-profit': 'Business',
+        'Technology': 'Technology',
+        'E-commerce': 'Technology',
+        'Retail': 'Technology',
+        'Healthcare': 'Health',
+        'Food and Beverage': 'Health',
+        'PetSafe Brand': 'Health',
+        'Travel': 'Travel',
+        'Hospitality': 'Travel',
+        'Transportation': 'Travel',
+        'Energy': 'Energy',
+        'Unknown': 'Uncategorized',
+        'Other': 'Uncategorized',
+        PENDING: PENDING,
+    },
+    broad_default="Uncategorized",
+)
+
+ACCOUNT_CATEGORIES = CategoryVocabulary(
+    [
+        "Influencer",
+        "Brand",
+        "Personal Blog",
+        "Art",
+        "Technology",
+        "Education",
+        "Fashion",
+        "Health and Wellness",
+        "Food and Beverage",
+        "Travel",
+        "Fitness",
+        "Entertainment",
+        "Non-profit",
+        "Sports",
+        "Photography",
+        "Gaming",
+        "Business",
+        "Cats",
+        "Dogs",
+        "Music",
+        "Personal",
+        "Other",
+        "Unknown",
+        PENDING,
+    ],
+    broad_mapping={
+        "Cats": "Pets",
+        "Photography": "Art",
+        "Influencer": "Lifestyle",
+        "Personal Blog": "Lifestyle",
+        "Music": "Art",
+        "Unknown": "Friends",
+        "Food and Beverage": "Lifestyle",
+        "Art": "Art",
+        "Fitness": "Lifestyle",
+        PENDING: PENDING,
+    },
+    broad_default="Other",
+)
@@ -1,11 +1,27 @@
 import os
 import json
-import requests
 import logging
-from collections import defaultdict, Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 from tqdm import tqdm
 import pandas as pd
+from ..category_index import CategoryIndex
+from ..profiling import StageProfiler
+from ..progress import ProgressTracker
+from ..transport import RequestPolicy, DeadlineExceeded, CassetteMiss
+from ..cancellation import CancelToken, cancel_on_signals
+from ..scheduling import prioritize, plan_requests, save_coverage_report
+from .categories import COMPANY_CATEGORIES, PENDING
+from .sampling import (
+    required_sample_size,
+    stratify,
+    stratified_sample,
+    save_sampling_design,
+    load_sampling_design,
+    clear_sampling_design,
+    estimate_category_counts,
+    save_estimates,
+)
 
 # Define the predefined categories prompt for matching
 predefined_categories = """
@@ -35,7 +51,7 @@ If the company does not fit into these categories, please respond with 'Other'.
 Answer with just the category name (e.g., 'Technology').
 """
 
-def query_on_demand_api(api_key, company_name, external_user_id="anonymous_user"):
+def query_on_demand_api(api_key, company_name, external_user_id="anonymous_user", policy=None):
     """
     Interact with the on-demand API to categorize a company.
 
@@ -49,6 +65,8 @@ def query_on_demand_api(api_key, company_name, external_user_id="anonymous_user"
         The name of the company to be categorized.
     external_user_id : str, optional
         An identifier for the user making the request, by default "anonymous_user".
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts and run deadline of the requests, by default the default timeouts.
 
     Returns
     -------
@@ -57,15 +75,17 @@ def query_on_demand_api(api_key, company_name, external_user_id="anonymous_user"
 
     Notes
     -----
-    If an error occurs during the API request, the function logs the error and returns "Unknown".
+    If an error occurs during the API request or a deadline is hit, the function
+    logs the error and returns "Unknown".
     """
+    if policy is None:
+        policy = RequestPolicy()
     create_session_url = 'https://api.on-demand.io/chat/v1/sessions'
     create_session_headers = {'apikey': api_key}
     create_session_body = {"pluginIds": [], "externalUserId": external_user_id}
 
     try:
-        response = requests.post(create_session_url, headers=create_session_headers, json=create_session_body)
-        response_data = response.json()
+        response_data = policy.post(create_session_url, create_session_headers, create_session_body)
         session_id = response_data['data']['id']
         
         query = predefined_categories + "Company: " + company_name
@@ -78,15 +98,20 @@ def query_on_demand_api(api_key, company_name, external_user_id="anonymous_user"
             "responseMode": "sync"
         }
 
-        query_response = requests.post(submit_query_url, headers=submit_query_headers, json=submit_query_body)
-        query_response_data = query_response.json()
+        query_response_data = policy.post(submit_query_url, submit_query_headers, submit_query_body)
         return query_response_data["data"]["answer"]
 
+    except CassetteMiss:
+        # A replayed run must not turn missing recordings into categories
+        raise
+    except DeadlineExceeded as e:
+        logging.warning(f"Deadline exceeded querying API for {company_name}: {e}")
+        return "Unknown"
     except Exception as e:
         logging.error(f"Error querying API for {company_name}: {e}")
         return "Unknown"
 
-def identify_market_category(company_name, api_key):
+def identify_market_category(company_name, api_key, index=None, policy=None):
     """
     Identify the market category of a company using the on-demand API.
 
@@ -96,6 +121,10 @@ def identify_market_category(company_name, api_key):
         The name of the company to categorize.
     api_key : str
         API key for authentication.
+    index : buda.category_index.CategoryIndex, optional
+        Index of past classifications that is consulted before the API, by default None.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, run deadline and hedging of the requests, by default the default timeouts.
 
     Returns
     -------
@@ -106,13 +135,21 @@ def identify_market_category(company_name, api_key):
     -----
     This function wraps the `query_on_demand_api` function and handles exceptions.
     """
+    if policy is None:
+        policy = RequestPolicy()
+    if index is not None:
+        category = index.lookup(company_name)
+        if category is not None:
+            return category
     try:
-        return query_on_demand_api(api_key, company_name)
+        return policy.call(query_on_demand_api, api_key, company_name, policy=policy)
+    except CassetteMiss:
+        raise
     except Exception as e:
         logging.error(f"Error in identify_market_category for {company_name}: {e}")
         return "Unknown"
 
-def assign_categories_async(data, api_key, debug, output_folder, save_frequency=10):
+def assign_categories_async(data, api_key, debug, output_folder, save_frequency=10, index=None, progress=None, budget=None, priority=None, policy=None, cancel=None):
     """
     Assign categories to companies asynchronously, with intermediate JSON updates.
 
@@ -131,29 +168,80 @@ def assign_categories_async(data, api_key, debug, output_folder, save_frequency=
         The folder where output files will be saved.
     save_frequency : int, optional
         Frequency at which intermediate results are saved, by default 10.
+    index : buda.category_index.CategoryIndex, optional
+        Index of past classifications that is consulted before the API, by default None.
+    progress : callable, optional
+        Sink receiving progress events, see `buda.progress.ProgressTracker`, by default None.
+    budget : buda.scheduling.RequestBudget, optional
+        Maximum number of companies sent to the API or cost of the run. Companies beyond the budget are
+        left out of the result, by default no limit.
+    priority : dict, optional
+        Weight of each company name. Heavier companies are classified first,
+        by default the order of `data`.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, run deadline and hedging of the requests, by default the default timeouts.
+    cancel : buda.cancellation.CancelToken, optional
+        Token that stops the classification when cancelled or out of time. SIGINT and
+        SIGTERM cancel it as well, by default a token without time limit.
 
     Returns
     -------
     dict
-        A dictionary mapping company names to their assigned categories.
+        A dictionary mapping company names to their assigned categories. Companies
+        whose classification was cancelled are marked as 'Pending'.
+
+    Raises
+    ------
+    buda.transport.CassetteMiss
+        If requests of a replayed run were not on the cassette.
 
     Notes
     -----
     The function logs progress and errors, and saves intermediate results
-    to 'categorized_data.json' in the specified output folder.
+    to 'categorized_data.json' in the specified output folder. The share of the
+    total priority covered by the classified companies is saved to
+    'classification_coverage.json' and the request statistics, including deadline
+    hits, to 'run_statistics.json'.
     """
     logging.info("Starting category assignment")
-    categorized_data = {}
-    json_file_path = os.path.join(output_folder, "categorized_data.json")
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    if policy is None:
+        policy = RequestPolicy()
+    if cancel is None:
+        cancel = CancelToken()
+    # In-flight requests stop at the time limit instead of outliving the run
+    policy.start_run(cancel)
+    # Recorded answers are saved even if the run fails
+    try:
+        categorized_data = {}
+        json_file_path = os.path.join(output_folder, "categorized_data.json")
+
+        companies = prioritize((item["advertiser_name"] for item in data), priority)
+        weights = {company_name: 1 if priority is None else priority.get(company_name, 0) for company_name in companies}
+
+        # Companies in the index cost no request, so they are resolved before the budget is applied
+        if index is not None:
+            pending = []
+            for company_name in companies:
+                category = index.lookup(company_name)
+                if category is None:
+                    pending.append(company_name)
+                else:
+                    categorized_data[company_name] = category
+            companies = pending
+
+        companies, skipped = plan_requests(companies, budget)
+
+        # The executor is shut down without waiting, so that a cancelled run returns at once
+        executor = ThreadPoolExecutor(max_workers=10)
+        # The executor starts work in submission order, i.e. highest priority first
         futures = {
-            executor.submit(identify_market_category, item["advertiser_name"], api_key): item
-            for item in data
+            executor.submit(identify_market_category, company_name, api_key, policy=policy): company_name
+            for company_name in companies
         }
-        for i, future in enumerate(tqdm(as_completed(futures), total=len(futures))):
-            item = futures[future]
-            company_name = item["advertiser_name"]
+        tracker = ProgressTracker("assign_categories", len(futures), progress)
+
+        def record(future):
+            company_name = futures[future]
             try:
                 category = future.result()
                 categorized_data[company_name] = category
@@ -162,24 +250,59 @@ def assign_categories_async(data, api_key, debug, output_folder, save_frequency=
             except Exception as e:
                 categorized_data[company_name] = "Unknown"
                 logging.error(f"Error processing {company_name}: {e}")
+            tracker.advance()
 
-            # Save intermediate results every 'save_frequency' items
-            if (i + 1) % save_frequency == 0:
-                with open(json_file_path, "w") as f:
-                    json.dump(categorized_data, f, indent=4)
-                logging.info(f"Intermediate data saved after processing {i + 1} items")
-
-    # Final save of categorized data
-    with open(json_file_path, "w") as f:
-        json.dump(categorized_data, f, indent=4)
+        pending = set(futures)
+        processed = 0
+        with cancel_on_signals(cancel), tqdm(total=len(futures)) as progress_bar:
+            try:
+                while pending and not cancel.cancelled:
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future)
+                        progress_bar.update()
+                        processed += 1
+
+                        # Save intermediate results every 'save_frequency' items
+                        if processed % save_frequency == 0:
+                            with open(json_file_path, "w") as f:
+                                json.dump(categorized_data, f, indent=4)
+                            logging.info(f"Intermediate data saved after processing {processed} items")
+            except KeyboardInterrupt:
+                cancel.cancel("interrupted")
+            finally:
+                for future in pending:
+                    if future.done() and not future.cancelled():
+                        record(future)
+                    else:
+                        future.cancel()
+                        categorized_data[futures[future]] = PENDING
+                executor.shutdown(wait=False)
+
+        if cancel.cancelled:
+            unfinished = sum(category == PENDING for category in categorized_data.values())
+            logging.warning(f"Category assignment stopped ({cancel.reason}), {unfinished} companies left pending")
+            tracker.finish()
+
+        # Final save of categorized data
+        with open(json_file_path, "w") as f:
+            json.dump(categorized_data, f, indent=4)
+        save_coverage_report(categorized_data, weights, skipped, output_folder)
+        policy.save_statistics(output_folder)
+        misses = policy.statistics.as_dict().get("cassette_misses")
+        if misses:
+            raise CassetteMiss(f"{misses} requests were not on the cassette, the replayed categories are incomplete")
+    finally:
+        policy.close()
     
     return categorized_data
 
-def generate_statistics(data, output_folder):
+def generate_statistics(data, output_folder, design=None):
     """
     Generate statistics from the categorized data and save them to a CSV file.
 
-    Counts the number of companies per category and saves the statistics.
+    Normalizes the answers onto `COMPANY_CATEGORIES`, counts the number of
+    companies per category and saves the statistics.
 
     Parameters
     ----------
@@ -187,6 +310,10 @@ def generate_statistics(data, output_folder):
         A dictionary mapping company names to categories.
     output_folder : str
         The folder where the statistics CSV will be saved.
+    design : dict, optional
+        Sampling design if `data` only covers a sample of the companies. The counts
+        are then extrapolated and saved with 'Lower' and 'Upper' confidence bounds,
+        by default None.
 
     Returns
     -------
@@ -197,9 +324,15 @@ def generate_statistics(data, output_folder):
     -----
     The statistics are saved to 'category_statistics.csv' in the specified output folder.
     """
-    category_count = defaultdict(int)
-    for category in data.values():
-        category_count[category] += 1
+    if design is not None:
+        category_df = estimate_category_counts(data, design, COMPANY_CATEGORIES)
+        category_df = category_df.rename(columns={"Estimate": "Number of Companies"})
+        category_df.to_csv(os.path.join(output_folder, "category_statistics.csv"), index=False)
+        logging.info("Estimated statistics generated successfully")
+        return category_df
+
+    codes = COMPANY_CATEGORIES.encode(data.values())
+    category_count = COMPANY_CATEGORIES.counts_to_dict(COMPANY_CATEGORIES.count(codes))
 
     # Convert results to DataFrame for display
     category_df = pd.DataFrame({
@@ -234,47 +367,32 @@ def create_broad_category_summary(folder):
     Notes
     -----
     The summary is saved to 'summary_categories.json' in the specified folder.
+    If the folder holds the sampling design of an approximate run, the counts are
+    extrapolated to all companies and their confidence intervals are saved to
+    'summary_categories_intervals.json'.
     """
-    category_mapping = {
-        'Media and Entertainment': 'Media',
-        'Fashion and Beauty': 'Media',
-        'Gaming': 'Media',
-        'Photography': 'Media',
-        'Sports and Fitness': 'Media',
-        'Consulting': 'Business',
-        'Real Estate': 'Business',
-        'Advertising': 'Business',
-        'Finance': 'Business',
-        'Non-profit': 'Business',
-        'Technology': 'Technology',
-        'E-commerce': 'Technology',
-        'Retail': 'Technology',
-        'Healthcare': 'Health',
-        'Food and Beverage': 'Health',
-        'PetSafe Brand': 'Health',
-        'Travel': 'Travel',
-        'Hospitality': 'Travel',
-        'Transportation': 'Travel',
-        'Energy': 'Energy',
-        'Unknown': 'Uncategorized',
-        'Other': 'Uncategorized'
-    }
-    
     # Load data from JSON
     with open(os.path.join(folder, "categorized_data.json"), 'r') as f:
         data = json.load(f)
+
+    design = load_sampling_design(folder)
+    if design is not None:
+        estimates = estimate_category_counts(data, design, COMPANY_CATEGORIES, broad=True)
+        result = save_estimates(
+            estimates,
+            os.path.join(folder, "summary_categories.json"),
+            os.path.join(folder, "summary_categories_intervals.json"),
+        )
+        logging.info("Estimated broad category summary saved to JSON successfully")
+        return estimates.rename(columns={"Category": "Broad Category", "Estimate": "Count"})
     
-    # Count occurrences in each category
-    category_counts = Counter(data.values())
-    df = pd.DataFrame(list(category_counts.items()), columns=["Category", "Count"])
-    
-    # Map to broad categories
-    df['Broad Category'] = df['Category'].map(category_mapping)
-    summary_df = df.groupby('Broad Category')['Count'].sum().reset_index()
+    # Count occurrences in each broad category
+    codes = COMPANY_CATEGORIES.encode(data.values())
+    result = COMPANY_CATEGORIES.counts_to_dict(COMPANY_CATEGORIES.count_broad(codes), broad=True)
+    summary_df = pd.DataFrame(list(result.items()), columns=["Broad Category", "Count"])
 
     # Save summary to JSON
     summary_path = os.path.join(folder, "summary_categories.json")
-    result = summary_df.set_index('Broad Category')['Count'].to_dict()
     with open(summary_path, 'w') as f:
         json.dump(result, f, indent=4)
     
@@ -303,7 +421,7 @@ def get_company_ad_statistics(file_path="summary_categories.json"):
         summary = json.load(f)
     return summary
 
-def map_companies(data, api_key, output_folder="company_analysis_output_ufuk", logging_level=logging.INFO, debug=True):
+def map_companies(data, api_key, output_folder="company_analysis_output_ufuk", logging_level=logging.INFO, debug=True, index_path=None, profile=None, progress=None, budget=None, priority=None, approximate=False, margin=0.05, confidence=0.95, policy=None, time_limit=None, cancel=None, results=None, index=None):
     """
     Main function to map companies to categories and generate statistics.
 
@@ -322,6 +440,40 @@ def map_companies(data, api_key, output_folder="company_analysis_output_ufuk", l
         Logging level to control the verbosity, by default logging.INFO.
     debug : bool, optional
         Flag to enable debug mode, by default True.
+    index_path : str, optional
+        Path to a category index built with `buda.category_index.build_category_index`.
+        Companies found in the index are not sent to the API, by default None.
+    profile : str, optional
+        Path of a JSON report with the wall time, CPU time and memory use of each
+        stage. Profiling is disabled if None, by default None.
+    progress : callable, optional
+        Sink receiving progress events, see `buda.progress.ProgressTracker`, by default None.
+    budget : buda.scheduling.RequestBudget, optional
+        Maximum number of companies sent to the API or cost of the classification, by default no limit.
+    priority : dict, optional
+        Weight of each advertiser name. Heavier advertisers are classified first,
+        by default the order of the input data.
+    approximate : bool, optional
+        Classify only a stratified random sample of the companies and extrapolate the
+        category counts, by default False.
+    margin : float, optional
+        Target half-width of the confidence interval of category shares in approximate
+        mode, by default 0.05.
+    confidence : float, optional
+        Confidence level of the intervals in approximate mode, by default 0.95.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, run deadline and hedging of the requests, by default the default timeouts.
+    time_limit : float, optional
+        Seconds after which the classification stops. Unfinished companies are marked
+        as 'Pending' and the statistics are computed from the partial results, by default
+        no limit.
+    cancel : buda.cancellation.CancelToken, optional
+        Token to stop the classification from another thread, by default None.
+    results : buda.results_store.JobResults, optional
+        Collects the categories and statistics for the results store, by default None.
+    index : buda.category_index.CategoryIndex, optional
+        An open category index, used instead of `index_path` and left open,
+        e.g. one mapped once by a worker server, by default None.
 
     Returns
     -------
@@ -340,11 +492,31 @@ def map_companies(data, api_key, output_folder="company_analysis_output_ufuk", l
         format='%(asctime)s - %(levelname)s - %(message)s',
         level=logging_level
     )
+    # The time limit applies to this run only, the caller's token is not changed
+    cancel = CancelToken(time_limit) if cancel is None else cancel.child(time_limit)
     data = data["ig_custom_audiences_all_types"]
-    categorized_data = assign_categories_async(data, api_key, debug=debug, output_folder=output_folder)
-    generate_statistics(categorized_data, output_folder=output_folder)
-
-def analyze_companies(input_folder, output_folder="company_analysis_output_ufuk", filename="ad_companies_data_statistics", logging_level=logging.INFO, debug=True):
+    with StageProfiler(profile) as profiler:
+        design = None
+        if approximate:
+            with profiler.stage("sample_companies"):
+                names = {item["advertiser_name"]: 1 for item in data}
+                strata = stratify(names if priority is None else {name: priority.get(name, 0) for name in names})
+                sample = stratified_sample(strata, required_sample_size(len(strata), margin, confidence))
+                design = save_sampling_design(strata, sample, output_folder, confidence)
+                data = [item for item in data if item["advertiser_name"] in design["strata"]]
+        else:
+            clear_sampling_design(output_folder)
+        with profiler.stage("assign_categories"):
+            # An index passed in is left open for its owner, one opened from its path is closed here
+            with nullcontext(index) if index is not None or index_path is None else CategoryIndex(index_path) as index:
+                categorized_data = assign_categories_async(data, api_key, debug=debug, output_folder=output_folder, index=index, progress=progress, budget=budget, priority=priority, policy=policy, cancel=cancel)
+        with profiler.stage("generate_statistics"):
+            statistics = generate_statistics(categorized_data, output_folder=output_folder, design=design)
+    if results is not None:
+        results.add("company_categories", categorized_data)
+        results.add("company_category_statistics", statistics)
+
+def analyze_companies(input_folder, output_folder="company_analysis_output_ufuk", filename="ad_companies_data_statistics", logging_level=logging.INFO, debug=True, profile=None, results=None):
     """
     Analyze companies by creating a broad category summary and saving statistics.
 
@@ -360,6 +532,11 @@ def analyze_companies(input_folder, output_folder="company_analysis_output_ufuk"
         Logging level to control the verbosity, by default logging.INFO.
     debug : bool, optional
         Flag to enable debug mode, by default True.
+    profile : str, optional
+        Path of a JSON report with the wall time, CPU time and memory use of each
+        stage. Profiling is disabled if None, by default None.
+    results : buda.results_store.JobResults, optional
+        Collects the summary for the results store, by default None.
 
     Returns
     -------
@@ -370,16 +547,21 @@ def analyze_companies(input_folder, output_folder="company_analysis_output_ufuk"
     -----
     This function generates a broad category summary, saves it, and logs the process.
     """
-    # Generate the broad category summary and save it in the output folder
-    create_broad_category_summary(folder=input_folder)
-    
-    # Load the summary statistics JSON from the input folder and save to the specified output path
-    summary = get_company_ad_statistics(file_path=os.path.join(input_folder, "summary_categories.json"))
-    
-    # Save the output JSON in the specified output folder with the given filename
-    output_path = os.path.join(output_folder, f"{filename}.json")
-    with open(output_path, 'w') as f:
-        json.dump(summary, f, indent=4)
+    with StageProfiler(profile) as profiler:
+        # Generate the broad category summary and save it in the output folder
+        with profiler.stage("broad_category_summary"):
+            create_broad_category_summary(folder=input_folder)
+
+        # Load the summary statistics JSON from the input folder and save to the specified output path
+        with profiler.stage("save_summary"):
+            summary = get_company_ad_statistics(file_path=os.path.join(input_folder, "summary_categories.json"))
+
+            # Save the output JSON in the specified output folder with the given filename
+            output_path = os.path.join(output_folder, f"{filename}.json")
+            with open(output_path, 'w') as f:
+                json.dump(summary, f, indent=4)
     
+    if results is not None:
+        results.add("summary_categories", summary)
     logging.info(f"Company ad statistics saved to {output_path}")
     return summary
\ No newline at end of file
@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+from dateutil import tz
+from ..export import InstagramExport
+from .heavy_hitters import content_type
+
+# Event kinds, in code order
+EVENT_KINDS = (
+    "post_like",
+    "comment_like",
+    "comment",
+    "saved",
+    "story_interaction",
+    "post_seen",
+    "video_watched",
+    "ad_seen",
+    "ad_clicked",
+    "ad_audience",
+)
+
+# Kinds of the URL an event points to, in code order
+URL_KINDS = ("none", "post", "reel", "igtv", "story", "other")
+
+# Timestamp of events without a time, e.g. advertisers that uploaded a custom audience
+NO_TIMESTAMP = -1
+
+# Top-level keys of the JSON files of an Instagram export and the kind of their events
+EXPORT_KINDS = {
+    "likes_media_likes": "post_like",
+    "likes_comment_likes": "comment_like",
+    "comments_media_comments": "comment",
+    "comments_reels_comments": "comment",
+    "saved_saved_media": "saved",
+    "saved_saved_collections": "saved",
+    "impressions_history_posts_seen": "post_seen",
+    "impressions_history_videos_watched": "video_watched",
+    "impressions_history_ads_seen": "ad_seen",
+    "impressions_history_ads_clicked": "ad_clicked",
+    "ig_custom_audiences_all_types": "ad_audience",
+}
+
+# All story_activities_* files (likes, polls, quizzes, ...) are story interactions
+_STORY_PREFIX = "story_activities_"
+
+# Labels of string_map_data entries that name the account an event refers to
+_ACCOUNT_LABELS = ("Media Owner", "Author", "Username", "Owner")
+
+
+def local_time(timestamps):
+    """
+    Return hour of day and day of week of Unix timestamps in local time.
+
+    Parameters
+    ----------
+    timestamps : numpy.ndarray
+        Unix timestamps; `NO_TIMESTAMP` marks missing ones.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        Hours (0-23) and days of the week (0 is Monday), -1 for missing timestamps.
+    """
+    timed = timestamps != NO_TIMESTAMP
+    hours = np.full(len(timestamps), -1, dtype=np.int8)
+    days = np.full(len(timestamps), -1, dtype=np.int8)
+    times = pd.DatetimeIndex(pd.to_datetime(timestamps[timed], unit="s", utc=True)).tz_convert(tz.tzlocal())
+    hours[timed] = times.hour
+    days[timed] = times.dayofweek
+    return hours, days
+
+
+def export_kind(key):
+    """
+    Return the event kind of a top-level export key, or None if it holds no events.
+
+    Parameters
+    ----------
+    key : str
+        A top-level key of an export JSON file, e.g. "likes_media_likes".
+
+    Returns
+    -------
+    str or None
+        One of `EVENT_KINDS`.
+    """
+    if key.startswith(_STORY_PREFIX):
+        return "story_interaction"
+    return EXPORT_KINDS.get(key)
+
+
+def _parse_item(item):
+    """
+    Return the account, timestamp and URL of one export entry.
+    """
+    account = item.get("title") or item.get("advertiser_name") or ""
+    timestamp = NO_TIMESTAMP
+    href = ""
+
+    for entry in item.get("string_list_data", [])[:1]:
+        timestamp = entry.get("timestamp", NO_TIMESTAMP)
+        href = entry.get("href", "")
+
+    for label, entry in item.get("string_map_data", {}).items():
+        if timestamp == NO_TIMESTAMP and entry.get("timestamp"):
+            timestamp = entry["timestamp"]
+        if not href and entry.get("href"):
+            href = entry["href"]
+        if not account and label in _ACCOUNT_LABELS:
+            account = entry.get("value", "")
+
+    return account or "Unknown", timestamp, href
+
+
+def _url_kind(href):
+    if not href:
+        return "none"
+    if "/stories/" in href:
+        return "story"
+    return content_type(href)
+
+
+class EventTable:
+    """
+    Columnar table of all interactions in an Instagram export.
+
+    Every row is one event with a kind (code into `EVENT_KINDS`), an account
+    (code into `accounts`), a Unix timestamp (`NO_TIMESTAMP` if unknown)
+    and the kind of URL it points to (code into `URL_KINDS`).
+
+    Parameters
+    ----------
+    kind, account, timestamp, url_kind : numpy.ndarray
+        The columns.
+    accounts : tuple of str
+        The account names, indexed by account code.
+    """
+
+    def __init__(self, kind, account, timestamp, url_kind, accounts):
+        self.kind = kind
+        self.account = account
+        self.timestamp = timestamp
+        self.url_kind = url_kind
+        self.accounts = accounts
+
+    @classmethod
+    def from_export(cls, data):
+        """
+        Normalize the datasets of an export into one event table.
+
+        Parameters
+        ----------
+        data : Mapping
+            Top-level export keys (e.g. "likes_media_likes") mapped to their
+            list of entries. Keys that hold no events are ignored. The event
+            datasets of an `InstagramExport` are loaded concurrently first.
+
+        Returns
+        -------
+        EventTable
+            The events of all known datasets.
+        """
+        kind_codes = {kind: code for code, kind in enumerate(EVENT_KINDS)}
+        url_codes = {kind: code for code, kind in enumerate(URL_KINDS)}
+        account_codes = {}
+        kinds, accounts, timestamps, url_kinds = [], [], [], []
+
+        if isinstance(data, InstagramExport):
+            # Decompress and parse the members in parallel instead of one at a time on access
+            data.load([key for key in data.keys() if export_kind(key) is not None])
+        for key in list(data.keys()):
+            kind = export_kind(key)
+            if kind is None:
+                continue
+            for item in data[key]:
+                account, timestamp, href = _parse_item(item)
+                kinds.append(kind_codes[kind])
+                accounts.append(account_codes.setdefault(account, len(account_codes)))
+                timestamps.append(timestamp)
+                url_kinds.append(url_codes[_url_kind(href)])
+
+        return cls(
+            np.array(kinds, dtype=np.uint8),
+            np.array(accounts, dtype=np.int32),
+            np.array(timestamps, dtype=np.int64),
+            np.array(url_kinds, dtype=np.uint8),
+            tuple(account_codes),
+        )
+
+    def __len__(self):
+        return len(self.kind)
+
+    def select(self, kinds=None, timed=False):
+        """
+        Select the events of some kinds.
+
+        Parameters
+        ----------
+        kinds : iterable of str, optional
+            The event kinds to keep, by default all kinds.
+        timed : bool, optional
+            Whether to drop events without a timestamp, by default False.
+
+        Returns
+        -------
+        EventTable
+            A table with the selected rows, sharing the account names.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if kinds is not None:
+            mask &= np.isin(self.kind, [EVENT_KINDS.index(kind) for kind in kinds])
+        if timed:
+            mask &= self.timestamp != NO_TIMESTAMP
+        return EventTable(self.kind[mask], self.account[mask], self.timestamp[mask], self.url_kind[mask], self.accounts)
+
+    def local_time(self):
+        """
+        Return hour of day and day of week of each event in local time.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            Hours (0-23) and days of the week (0 is Monday). Events without a
+            timestamp get -1 in both.
+        """
+        return local_time(self.timestamp)
+
+    def to_frame(self):
+        """
+        Convert the table to a DataFrame with categorical columns.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns 'kind', 'account', 'timestamp' and 'url_kind'.
+        """
+        return pd.DataFrame({
+            "kind": pd.Categorical.from_codes(self.kind, EVENT_KINDS),
+            "account": pd.Categorical.from_codes(self.account, self.accounts),
+            "timestamp": self.timestamp,
+            "url_kind": pd.Categorical.from_codes(self.url_kind, URL_KINDS),
+        })
@@ -0,0 +1,226 @@
+import os
+import json
+import heapq
+import logging
+from collections import Counter
+from collections.abc import Mapping
+from itertools import count
+
+# Inputs with at most this many likes are counted exactly
+EXACT_THRESHOLD = 100_000
+
+
+class SpaceSaving:
+    """
+    Space-Saving sketch of the most frequent items in a stream.
+
+    At most `capacity` items are monitored. When a new item arrives and the
+    sketch is full, the item with the smallest count is replaced and the new
+    item inherits that count as its error bound. Every item whose true count
+    exceeds `total / capacity` is guaranteed to be monitored.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        Maximum number of monitored items. None counts every item exactly,
+        by default None.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # Min-heap of (count, tiebreak, item). Entries may lag behind the
+        # true count and are refreshed lazily when they reach the top.
+        self._heap = []
+        self._tiebreak = count()
+
+    def update(self, item, increment=1):
+        """
+        Count an occurrence of an item.
+
+        Parameters
+        ----------
+        item : hashable
+            The item, e.g. an account name.
+        increment : int, optional
+            The number of occurrences, by default 1.
+        """
+        self.total += increment
+        if item in self._counts:
+            self._counts[item] += increment
+            return
+        if self.capacity is None or len(self._counts) < self.capacity:
+            self._counts[item] = increment
+            self._errors[item] = 0
+            if self.capacity is not None:
+                heapq.heappush(self._heap, (increment, next(self._tiebreak), item))
+            return
+
+        minimum = self._pop_minimum()
+        self._counts[item] = minimum + increment
+        self._errors[item] = minimum
+        heapq.heappush(self._heap, (minimum + increment, next(self._tiebreak), item))
+
+    def _pop_minimum(self):
+        while True:
+            recorded, _, item = heapq.heappop(self._heap)
+            current = self._counts[item]
+            if recorded == current:
+                del self._counts[item]
+                del self._errors[item]
+                return current
+            heapq.heappush(self._heap, (current, next(self._tiebreak), item))
+
+    def top(self, k):
+        """
+        Return the most frequent items.
+
+        Parameters
+        ----------
+        k : int
+            The number of items to return.
+
+        Returns
+        -------
+        list of tuple
+            Up to `k` tuples of (item, estimated count, maximum overestimation),
+            most frequent first. The error is always 0 in exact mode.
+        """
+        items = heapq.nlargest(k, self._counts.items(), key=lambda entry: entry[1])
+        return [(item, estimate, self._errors[item]) for item, estimate in items]
+
+    def __len__(self):
+        return len(self._counts)
+
+
+def content_type(href):
+    """
+    Determine the kind of content a liked URL points to.
+
+    Parameters
+    ----------
+    href : str
+        The URL of the liked content, e.g. "https://www.instagram.com/reel/abc/".
+
+    Returns
+    -------
+    str
+        One of "post", "reel", "igtv" or "other".
+    """
+    path = href.split("instagram.com", 1)[-1]
+    if path.startswith("/p/"):
+        return "post"
+    if path.startswith("/reel/") or path.startswith("/reels/"):
+        return "reel"
+    if path.startswith("/tv/"):
+        return "igtv"
+    return "other"
+
+
+class LikeStreamStatistics:
+    """
+    Streaming statistics over liked items with bounded memory.
+
+    Tracks the most liked accounts with a `SpaceSaving` sketch and counts
+    the kinds of liked content.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        Number of accounts monitored by the sketch. None counts exactly, by default None.
+    """
+
+    def __init__(self, capacity=None):
+        self.accounts = SpaceSaving(capacity)
+        self.content_types = Counter()
+
+    def update(self, item):
+        """
+        Add one entry of 'likes_media_likes' to the statistics.
+
+        Parameters
+        ----------
+        item : dict
+            A liked item with a 'title' and 'string_list_data'.
+        """
+        self.accounts.update(item.get("title", "Unknown"))
+        for entry in item.get("string_list_data", [])[:1]:
+            self.content_types[content_type(entry.get("href", ""))] += 1
+
+    def top_accounts(self, k=10, others=True):
+        """
+        Return the most liked accounts in the format of the dashboard panels.
+
+        Parameters
+        ----------
+        k : int, optional
+            The number of accounts, by default 10.
+        others : bool, optional
+            Whether to append an 'Others' entry with the remaining likes, by default True.
+
+        Returns
+        -------
+        list of dict
+            Entries with the keys 'name' and 'value'.
+        """
+        top = [{"name": name, "value": estimate} for name, estimate, _ in self.accounts.top(k)]
+        rest = self.accounts.total - sum(entry["value"] for entry in top)
+        if others and rest > 0:
+            top.append({"name": "Others", "value": rest})
+        return top
+
+
+def get_like_stream_statistics(data, capacity=None, exact_threshold=EXACT_THRESHOLD):
+    """
+    Compute streaming like statistics, exactly for small inputs.
+
+    Parameters
+    ----------
+    data : dict or iterable
+        The data containing likes information, or any iterable of liked items.
+    capacity : int, optional
+        Number of accounts monitored when the input is large, by default 1000.
+    exact_threshold : int, optional
+        Inputs of known length up to this many likes are counted exactly,
+        by default `EXACT_THRESHOLD`.
+
+    Returns
+    -------
+    LikeStreamStatistics
+        The statistics over all liked items.
+    """
+    likes = data["likes_media_likes"] if isinstance(data, Mapping) else data
+    exact = hasattr(likes, "__len__") and len(likes) <= exact_threshold
+    statistics = LikeStreamStatistics(None if exact else (capacity or 1000))
+    for item in likes:
+        statistics.update(item)
+    return statistics
+
+
+def save_like_stream_statistics(data, output_folder, k=10):
+    """
+    Compute the most liked accounts and content types and save them to JSON.
+
+    Parameters
+    ----------
+    data : dict or iterable
+        The data containing likes information, or any iterable of liked items.
+    output_folder : str
+        The folder where 'top_liked_accounts.json' and 'liked_content_types.json' are saved.
+    k : int, optional
+        The number of top accounts, by default 10.
+
+    Returns
+    -------
+    LikeStreamStatistics
+        The statistics over all liked items.
+    """
+    statistics = get_like_stream_statistics(data)
+    with open(os.path.join(output_folder, "top_liked_accounts.json"), "w") as f:
+        json.dump(statistics.top_accounts(k), f, indent=4)
+    with open(os.path.join(output_folder, "liked_content_types.json"), "w") as f:
+        json.dump(dict(statistics.content_types), f, indent=4)
+    logging.info("Top liked accounts and content types saved")
+    return statistics
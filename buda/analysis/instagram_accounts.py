@@ -1,11 +1,28 @@
 import os
 import json
-import requests
 import logging
-from collections import defaultdict, Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 from tqdm import tqdm
 import pandas as pd
+from ..category_index import CategoryIndex
+from ..profiling import StageProfiler
+from ..progress import ProgressTracker
+from ..transport import RequestPolicy, DeadlineExceeded, CassetteMiss
+from ..cancellation import CancelToken, cancel_on_signals
+from ..scheduling import prioritize, plan_requests, save_coverage_report
+from .categories import ACCOUNT_CATEGORIES, PENDING
+from .heavy_hitters import save_like_stream_statistics
+from .sampling import (
+    required_sample_size,
+    stratify,
+    stratified_sample,
+    save_sampling_design,
+    clear_sampling_design,
+    estimate_category_counts,
+    save_estimates,
+)
 
 # Define categories for Instagram accounts
 predefined_categories = """
@@ -35,7 +52,7 @@ Please categorize the following Instagram account into one of these categories:
 Answer with just the category name (e.g., 'Influencer').
 """
 
-def query_instagram_api(api_key, account_name, external_user_id="instagram_user"):
+def query_instagram_api(api_key, account_name, external_user_id="instagram_user", policy=None):
     """
     Query the Instagram API to categorize an account.
 
@@ -49,23 +66,22 @@ def query_instagram_api(api_key, account_name, external_user_id="instagram_user"
         The Instagram account name to be categorized.
     external_user_id : str, optional
         An identifier for the user making the request, by default "instagram_user".
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts and run deadline of the requests, by default the default timeouts.
 
     Returns
     -------
     str
-        The predicted category for the Instagram account.
-
-    Raises
-    ------
-    Exception
-        If there is an error during the API request.
+        The predicted category for the Instagram account, or "Unknown" if the
+        request failed or hit its deadline.
     """
+    if policy is None:
+        policy = RequestPolicy()
     session_url = 'https://api.on-demand.io/chat/v1/sessions'
     headers = {'apikey': api_key}
     body = {"pluginIds": [], "externalUserId": external_user_id}
     try:
-        response = requests.post(session_url, headers=headers, json=body)
-        session_id = response.json()['data']['id']
+        session_id = policy.post(session_url, headers, body)['data']['id']
         
         query = predefined_categories + f"Account: {account_name}"
         query_url = f'https://api.on-demand.io/chat/v1/sessions/{session_id}/query'
@@ -76,18 +92,25 @@ def query_instagram_api(api_key, account_name, external_user_id="instagram_user"
             "pluginIds": ["plugin-1716164040"]
         }
         
-        query_response = requests.post(query_url, headers=headers, json=query_body)
-        return query_response.json()["data"]["answer"]
+        return policy.post(query_url, headers, query_body)["data"]["answer"]
     
+    except CassetteMiss:
+        # A replayed run must not turn missing recordings into categories
+        raise
+    except DeadlineExceeded as e:
+        logging.warning(f"Deadline exceeded querying API for {account_name}: {e}")
+        return "Unknown"
     except Exception as e:
         logging.error(f"Error querying API for {account_name}: {e}")
         return "Unknown"
 
-def assign_categories(data, api_key, output_folder, save_frequency=10):
+def assign_categories(data, api_key, output_folder, save_frequency=10, index=None, progress=None, budget=None, policy=None, cancel=None):
     """
     Assign categories to Instagram accounts using the API.
 
     Processes a list of data, queries the API for each account, and saves the results periodically.
+    Accounts are classified in order of their number of likes, so that a limited budget
+    is spent on the accounts that matter most for the statistics.
 
     Parameters
     ----------
@@ -99,49 +122,130 @@ def assign_categories(data, api_key, output_folder, save_frequency=10):
         The folder where output files will be saved.
     save_frequency : int, optional
         Frequency at which intermediate results are saved, by default 10.
+    index : buda.category_index.CategoryIndex, optional
+        Index of past classifications. Accounts found in it are not sent to the API, by default None.
+    progress : callable, optional
+        Sink receiving progress events, see `buda.progress.ProgressTracker`, by default None.
+    budget : buda.scheduling.RequestBudget, optional
+        Maximum number of accounts sent to the API or cost of the run. Accounts beyond the budget are
+        left out of the result, by default no limit.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, run deadline and hedging of the requests, by default the default timeouts.
+    cancel : buda.cancellation.CancelToken, optional
+        Token that stops the classification when cancelled or out of time. SIGINT and
+        SIGTERM cancel it as well, by default a token without time limit.
 
     Returns
     -------
     dict
-        A dictionary mapping account names to their assigned categories.
+        A dictionary mapping account names to their assigned categories. Accounts
+        whose classification was cancelled are marked as 'Pending'.
 
     Raises
     ------
     Exception
         If there is an error during processing.
+    buda.transport.CassetteMiss
+        If requests of a replayed run were not on the cassette.
+
+    Notes
+    -----
+    The share of likes covered by the classified accounts is saved to
+    'classification_coverage.json' in the output folder, and the request statistics,
+    including deadline hits, to 'run_statistics.json'.
     """
-    categorized_data = {}
-    json_file_path = os.path.join(output_folder, "categorized_data.json")
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
+    if policy is None:
+        policy = RequestPolicy()
+    if cancel is None:
+        cancel = CancelToken()
+    # In-flight requests stop at the time limit instead of outliving the run
+    policy.start_run(cancel)
+    # Recorded answers are saved even if the run fails
+    try:
+        categorized_data = {}
+        json_file_path = os.path.join(output_folder, "categorized_data.json")
+
+        likes_per_account = Counter(item.get("title", "Unknown") for item in data)
+        accounts = prioritize(likes_per_account, likes_per_account)
+
+        if index is not None:
+            pending = []
+            for account_name in accounts:
+                category = index.lookup(account_name)
+                if category is None:
+                    pending.append(account_name)
+                else:
+                    categorized_data[account_name] = category
+            accounts = pending
+
+        accounts, skipped = plan_requests(accounts, budget)
+
+        # The executor is shut down without waiting, so that a cancelled run returns at once
+        executor = ThreadPoolExecutor(max_workers=5)
+        # The executor starts work in submission order, i.e. most liked accounts first
         futures = {
-            executor.submit(query_instagram_api, api_key, item.get("title", "Unknown")): item
-            for item in data
+            executor.submit(policy.call, query_instagram_api, api_key, account_name, policy=policy): account_name
+            for account_name in accounts
         }
-        for i, future in enumerate(tqdm(as_completed(futures), total=len(futures))):
-            item = futures[future]
-            account_name = item.get("title", "Unknown")
+        tracker = ProgressTracker("assign_categories", len(futures), progress)
+
+        def record(future):
+            account_name = futures[future]
             try:
                 category = future.result()
                 categorized_data[account_name] = category
             except Exception as e:
                 categorized_data[account_name] = "Unknown"
                 logging.error(f"Error processing {account_name}: {e}")
+            tracker.advance()
 
-            if (i + 1) % save_frequency == 0:
-                with open(json_file_path, "w") as f:
-                    json.dump(categorized_data, f, indent=4)
+        pending = set(futures)
+        processed = 0
+        with cancel_on_signals(cancel), tqdm(total=len(futures)) as progress_bar:
+            try:
+                while pending and not cancel.cancelled:
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future)
+                        progress_bar.update()
+                        processed += 1
+                        if processed % save_frequency == 0:
+                            with open(json_file_path, "w") as f:
+                                json.dump(categorized_data, f, indent=4)
+            except KeyboardInterrupt:
+                cancel.cancel("interrupted")
+            finally:
+                for future in pending:
+                    if future.done() and not future.cancelled():
+                        record(future)
+                    else:
+                        future.cancel()
+                        categorized_data[futures[future]] = PENDING
+                executor.shutdown(wait=False)
+
+        if cancel.cancelled:
+            unfinished = sum(category == PENDING for category in categorized_data.values())
+            logging.warning(f"Classification stopped ({cancel.reason}), {unfinished} accounts left pending")
+            tracker.finish()
+
+        with open(json_file_path, "w") as f:
+            json.dump(categorized_data, f, indent=4)
+        save_coverage_report(categorized_data, likes_per_account, skipped, output_folder)
+        policy.save_statistics(output_folder)
+        misses = policy.statistics.as_dict().get("cassette_misses")
+        if misses:
+            raise CassetteMiss(f"{misses} requests were not on the cassette, the replayed categories are incomplete")
+    finally:
+        policy.close()
 
-    with open(json_file_path, "w") as f:
-        json.dump(categorized_data, f, indent=4)
-    
     return categorized_data
 
-def generate_statistics(data, output_folder):
+def generate_statistics(data, output_folder, design=None):
     """
     Generate statistics from categorized data and save to CSV.
 
-    Counts the number of accounts per category and saves the statistics.
+    Normalizes the answers onto `ACCOUNT_CATEGORIES`, counts the number of
+    accounts per category and saves the statistics.
 
     Parameters
     ----------
@@ -149,15 +253,24 @@ def generate_statistics(data, output_folder):
         A dictionary mapping account names to categories.
     output_folder : str
         The folder where the statistics CSV will be saved.
+    design : dict, optional
+        Sampling design if `data` only covers a sample of the accounts. The counts
+        are then extrapolated and saved with 'Lower' and 'Upper' confidence bounds,
+        by default None.
 
     Returns
     -------
     pandas.DataFrame
         A DataFrame containing category statistics.
     """
-    category_count = defaultdict(int)
-    for category in data.values():
-        category_count[category] += 1
+    if design is not None:
+        category_df = estimate_category_counts(data, design, ACCOUNT_CATEGORIES)
+        category_df = category_df.rename(columns={"Estimate": "Number of Accounts"})
+        category_df.to_csv(os.path.join(output_folder, "category_statistics.csv"), index=False)
+        return category_df
+
+    codes = ACCOUNT_CATEGORIES.encode(data.values())
+    category_count = ACCOUNT_CATEGORIES.counts_to_dict(ACCOUNT_CATEGORIES.count(codes))
 
     category_df = pd.DataFrame({
         "Category": list(category_count.keys()),
@@ -167,7 +280,7 @@ def generate_statistics(data, output_folder):
     category_df.to_csv(os.path.join(output_folder, "category_statistics.csv"), index=False)
     return category_df
 
-def analyze_categories(data, output_folder):
+def analyze_categories(data, output_folder, design=None):
     """
     Analyze and remap categories to broader categories.
 
@@ -179,42 +292,38 @@ def analyze_categories(data, output_folder):
         A dictionary mapping account names to categories.
     output_folder : str
         The folder where the analyzed category counts will be saved.
+    design : dict, optional
+        Sampling design if `data` only covers a sample of the accounts. The counts
+        are then extrapolated, and their confidence intervals are saved to
+        'liked_posts_category_intervals.json', by default None.
 
     Returns
     -------
     dict
         A dictionary mapping broader categories to counts.
     """
-    category_mapping = {
-        "Cats": "Pets",
-        "Photography": "Art",
-        "Influencer": "Lifestyle",
-        "Personal Blog": "Lifestyle",
-        "Music": "Art",
-        "Unknown": "Friends",
-        "Food and Beverage": "Lifestyle",
-        "Art": "Art",
-        "Fitness": "Lifestyle",
-    }
-
-    category_counts = {}
-
-    for user, category in data.items():
-        # Map the existing category to one of the broader categories
-        mapped_category = category_mapping.get(category, "Other")
-        # Increment the count for the mapped category
-        category_counts[mapped_category] = category_counts.get(mapped_category, 0) + 1
+    if design is not None:
+        return save_estimates(
+            estimate_category_counts(data, design, ACCOUNT_CATEGORIES, broad=True),
+            os.path.join(output_folder, "liked_posts_category_counts.json"),
+            os.path.join(output_folder, "liked_posts_category_intervals.json"),
+        )
+
+    # Map the existing categories to the broader categories and count them
+    codes = ACCOUNT_CATEGORIES.encode(data.values())
+    category_counts = ACCOUNT_CATEGORIES.counts_to_dict(ACCOUNT_CATEGORIES.count_broad(codes), broad=True)
 
     # Save the category counts to a JSON file
     with open(os.path.join(output_folder, "liked_posts_category_counts.json"), "w") as f:
         json.dump(category_counts, f, indent=4)
     return category_counts
 
-def analyze_instagram_accounts(data, api_key, output_folder="instagram_analysis_output", debug=True):
+def analyze_instagram_accounts(data, api_key, output_folder="instagram_analysis_output", debug=True, index_path=None, profile=None, progress=None, budget=None, approximate=False, margin=0.05, confidence=0.95, policy=None, time_limit=None, cancel=None, results=None, index=None):
     """
     Main function to analyze Instagram accounts.
 
     Processes the data to assign categories, generate statistics, and analyze categories.
+    The most liked accounts and liked content types are computed while the likes are read.
 
     Parameters
     ----------
@@ -226,24 +335,88 @@ def analyze_instagram_accounts(data, api_key, output_folder="instagram_analysis_
         The folder where output files will be saved, by default "instagram_analysis_output".
     debug : bool, optional
         Flag to enable debug mode, by default True.
+    index_path : str, optional
+        Path to a category index built with `buda.category_index.build_category_index`.
+        Accounts found in the index are not sent to the API, by default None.
+    profile : str, optional
+        Path of a JSON report with the wall time, CPU time and memory use of each
+        stage. Profiling is disabled if None, by default None.
+    progress : callable, optional
+        Sink receiving progress events, see `buda.progress.ProgressTracker`, by default None.
+    budget : buda.scheduling.RequestBudget, optional
+        Maximum number of accounts sent to the API or cost of the classification. The most liked
+        accounts are classified first, by default no limit.
+    approximate : bool, optional
+        Classify only a stratified random sample of the accounts and extrapolate the
+        category counts, by default False.
+    margin : float, optional
+        Target half-width of the confidence interval of category shares in approximate
+        mode, by default 0.05.
+    confidence : float, optional
+        Confidence level of the intervals in approximate mode, by default 0.95.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, run deadline and hedging of the requests, by default the default timeouts.
+    time_limit : float, optional
+        Seconds after which the classification stops. Unfinished accounts are marked
+        as 'Pending' and the statistics are computed from the partial results, by default
+        no limit.
+    cancel : buda.cancellation.CancelToken, optional
+        Token to stop the classification from another thread, by default None.
+    results : buda.results_store.JobResults, optional
+        Collects the like statistics, categories and category counts for the
+        results store, by default None.
+    index : buda.category_index.CategoryIndex, optional
+        An open category index, used instead of `index_path` and left open,
+        e.g. one mapped once by a worker server, by default None.
 
     Returns
     -------
     None
+
+    Notes
+    -----
+    The total number of likes is saved to 'liked_posts.json' in the output folder.
     """
+    # The time limit applies to this run only, the caller's token is not changed
+    cancel = CancelToken(time_limit) if cancel is None else cancel.child(time_limit)
     data = data["likes_media_likes"]
     
-    with open(os.path.join('../data', "liked_posts.json"), "w") as f:
-        total_likes = len(data)
+    os.makedirs(output_folder, exist_ok=True)
+    total_likes = len(data)
+    with open(os.path.join(output_folder, "liked_posts.json"), "w") as f:
         json.dump(total_likes, f, indent=4)
     
-    os.makedirs(output_folder, exist_ok=True)
     logging.basicConfig(
         filename=os.path.join(output_folder, 'analysis.log'),
         filemode='w',
         format='%(asctime)s - %(levelname)s - %(message)s',
         level=logging.INFO
     )
-    categorized_data = assign_categories(data, api_key, output_folder)
-    generate_statistics(categorized_data, output_folder)
-    analyze_categories(categorized_data, output_folder)
\ No newline at end of file
+    with StageProfiler(profile) as profiler:
+        with profiler.stage("like_stream_statistics"):
+            like_statistics = save_like_stream_statistics(data, output_folder)
+        design = None
+        if approximate:
+            with profiler.stage("sample_accounts"):
+                # Stratify by number of likes, so rarely and often liked accounts are both represented
+                strata = stratify(Counter(item.get("title", "Unknown") for item in data))
+                sample = stratified_sample(strata, required_sample_size(len(strata), margin, confidence))
+                design = save_sampling_design(strata, sample, output_folder, confidence)
+                data = [item for item in data if item.get("title", "Unknown") in design["strata"]]
+        else:
+            clear_sampling_design(output_folder)
+        with profiler.stage("assign_categories"):
+            # An index passed in is left open for its owner, one opened from its path is closed here
+            with nullcontext(index) if index is not None or index_path is None else CategoryIndex(index_path) as index:
+                categorized_data = assign_categories(data, api_key, output_folder, index=index, progress=progress, budget=budget, policy=policy, cancel=cancel)
+        with profiler.stage("generate_statistics"):
+            statistics = generate_statistics(categorized_data, output_folder, design=design)
+        with profiler.stage("analyze_categories"):
+            category_counts = analyze_categories(categorized_data, output_folder, design=design)
+    if results is not None:
+        results.add("liked_posts", total_likes)
+        results.add("top_liked_accounts", like_statistics.top_accounts(10))
+        results.add("liked_content_types", dict(like_statistics.content_types))
+        results.add("account_categories", categorized_data)
+        results.add("account_category_statistics", statistics)
+        results.add("liked_posts_category_counts", category_counts)
\ No newline at end of file
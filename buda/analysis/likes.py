@@ -1,8 +1,10 @@
 from ..utils import load_data
+from ..profiling import StageProfiler
+from .events import EventTable, EVENT_KINDS
 import matplotlib.pyplot as plt
-from datetime import datetime
 from collections import Counter
 import numpy as np
+import pandas as pd
 import seaborn as sns  # Required for plotting styles
 
 def calculate_total_likes(data):
@@ -21,24 +23,61 @@ def calculate_total_likes(data):
     """
     return len(data["likes_media_likes"])
 
-def extract_hours(data):
+def _timed_events(data, kinds):
+    """
+    Return the events of the given kinds that have a timestamp.
+    """
+    if not isinstance(data, EventTable):
+        data = EventTable.from_export(data)
+    return data.select(kinds, timed=True)
+
+def count_activity(data, kinds=None):
+    """
+    Count events by kind and hour of the day, and by kind and day of the week.
+
+    Both tables are computed in a single vectorized pass over all events.
+
+    Parameters
+    ----------
+    data : dict or buda.analysis.events.EventTable
+        The export data, or its event table.
+    kinds : iterable of str, optional
+        The event kinds to count, by default all kinds.
+
+    Returns
+    -------
+    tuple of pandas.DataFrame
+        Hourly counts (kinds x 24 hours) and daily counts (kinds x 7 days,
+        0 is Monday), indexed by event kind.
+    """
+    kinds = list(EVENT_KINDS if kinds is None else kinds)
+    events = _timed_events(data, kinds)
+    hours, days = events.local_time()
+    position = np.zeros(len(EVENT_KINDS), dtype=np.int64)
+    position[[EVENT_KINDS.index(kind) for kind in kinds]] = np.arange(len(kinds))
+    row = position[events.kind]
+    hourly = np.bincount(row * 24 + hours, minlength=len(kinds) * 24).reshape(len(kinds), 24)
+    daily = np.bincount(row * 7 + days, minlength=len(kinds) * 7).reshape(len(kinds), 7)
+    return pd.DataFrame(hourly, index=kinds), pd.DataFrame(daily, index=kinds)
+
+def extract_hours(data, kinds=("post_like",)):
     """
     Extract hours from timestamps for activity analysis.
 
     Parameters
     ----------
-    data : dict
-        The data containing likes information with timestamps.
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps, or its event table.
+    kinds : iterable of str, optional
+        The event kinds to include, by default post likes. None includes all kinds.
 
     Returns
     -------
     list of int
-        A list of hours when likes occurred.
+        A list of hours when the events occurred.
     """
-    timestamps = [
-        item["string_list_data"][0]["timestamp"] for item in data["likes_media_likes"]
-    ]
-    return [datetime.fromtimestamp(ts).hour for ts in timestamps]
+    hours, _ = _timed_events(data, kinds).local_time()
+    return hours.tolist()
 
 def count_hourly_activity(hours):
     """
@@ -56,24 +95,24 @@ def count_hourly_activity(hours):
     """
     return Counter(hours)
 
-def extract_days_of_week(data):
+def extract_days_of_week(data, kinds=("post_like",)):
     """
     Extract days of the week from timestamps for activity analysis.
 
     Parameters
     ----------
-    data : dict
-        The data containing likes information with timestamps.
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps, or its event table.
+    kinds : iterable of str, optional
+        The event kinds to include, by default post likes. None includes all kinds.
 
     Returns
     -------
     list of int
-        A list of days of the week when likes occurred, where 0 is Monday and 6 is Sunday.
+        A list of days of the week when the events occurred, where 0 is Monday and 6 is Sunday.
     """
-    timestamps = [
-        item["string_list_data"][0]["timestamp"] for item in data["likes_media_likes"]
-    ]
-    return [datetime.fromtimestamp(ts).weekday() for ts in timestamps]
+    _, days = _timed_events(data, kinds).local_time()
+    return days.tolist()
 
 def count_days_of_week_activity(days):
     """
@@ -91,21 +130,23 @@ def count_days_of_week_activity(days):
     """
     return Counter(days)
 
-def get_days_of_week_activity(data):
+def get_days_of_week_activity(data, kinds=("post_like",)):
     """
     Get days of the week activity data for likes.
 
     Parameters
     ----------
-    data : dict
-        The data containing likes information with timestamps.
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps, or its event table.
+    kinds : iterable of str, optional
+        The event kinds to count, by default post likes. None counts all kinds.
 
     Returns
     -------
     collections.Counter
         A Counter object mapping each day of the week to the number of likes.
     """
-    days = extract_days_of_week(data)
+    days = extract_days_of_week(data, kinds)
     days_activity = count_days_of_week_activity(days)
     return days_activity
 
@@ -221,40 +262,79 @@ def plot_hourly_activity_circle(hourly_activity):
     plt.title("Instagram Activity by Hour")
     plt.show()
 
-def get_hourly_activity(data):
+def get_hourly_activity(data, kinds=("post_like",)):
     """
     Get hourly activity data for likes.
 
     Parameters
     ----------
-    data : dict
-        The data containing likes information with timestamps.
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps, or its event table.
+    kinds : iterable of str, optional
+        The event kinds to count, by default post likes. None counts all kinds.
 
     Returns
     -------
     collections.Counter
         A Counter object mapping each hour to the number of likes.
     """
-    hours = extract_hours(data)
+    hours = extract_hours(data, kinds)
     hourly_activity = count_hourly_activity(hours)
     return hourly_activity
 
-def analyze_likes(data):
+def get_activity(data, kinds=("post_like",)):
+    """
+    Get hourly and days of the week activity data in one pass.
+
+    Parameters
+    ----------
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps, or its event table.
+        Pass the table when several analyses run on one export, so it is built once.
+    kinds : iterable of str, optional
+        The event kinds to count, by default post likes. None counts all kinds.
+
+    Returns
+    -------
+    tuple of collections.Counter
+        Counters mapping each hour and each day of the week (0 is Monday) to the
+        number of events, as returned by `get_hourly_activity` and
+        `get_days_of_week_activity`.
+    """
+    hours, days = _timed_events(data, kinds).local_time()
+    return count_hourly_activity(hours.tolist()), count_days_of_week_activity(days.tolist())
+
+def analyze_likes(data, profile=None, results=None):
     """
     Analyze likes data and display statistics and plots.
 
     Parameters
     ----------
-    data : dict
-        The data containing likes information with timestamps.
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps, or its event table.
+    profile : str, optional
+        Path of a JSON report with the wall time, CPU time and memory use of each
+        stage. Profiling is disabled if None, by default None.
+    results : buda.results_store.JobResults, optional
+        Collects the number of likes and the hourly and day of the week
+        activity for the results store, by default None.
 
     Returns
     -------
     None
     """
-    total_likes = calculate_total_likes(data)
-    hours = extract_hours(data)
-    hourly_activity = count_hourly_activity(hours)
-    display_hourly_statistics(total_likes, hourly_activity)
-    plot_hourly_activity(hourly_activity)
-    plot_hourly_activity_circle(hourly_activity)
\ No newline at end of file
+    with StageProfiler(profile) as profiler:
+        with profiler.stage("event_table"):
+            events = data if isinstance(data, EventTable) else EventTable.from_export(data)
+        with profiler.stage("hourly_activity"):
+            total_likes = len(events.select(("post_like",)))
+            hourly_activity, day_of_week_activity = get_activity(events)
+        with profiler.stage("display"):
+            display_hourly_statistics(total_likes, hourly_activity)
+        with profiler.stage("plot"):
+            plot_hourly_activity(hourly_activity)
+            plot_hourly_activity_circle(hourly_activity)
+    if results is not None:
+        results.add("liked_posts", total_likes)
+        results.add("hourly_activity", hourly_activity)
+        results.add("day_of_week_activity", day_of_week_activity)
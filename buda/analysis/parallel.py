@@ -0,0 +1,167 @@
+import os
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from ..utils import open_data
+from .events import EventTable, local_time
+
+# Shape of an activity heatmap: days of the week (0 is Monday) x hours of the day
+HEATMAP_SHAPE = (7, 24)
+
+
+class SharedCounts:
+    """
+    Count arrays of shape (partitions, 7, 24) in shared memory.
+
+    Every worker adds into its own partition, so no locks are needed and no
+    counts are pickled back to the parent; the parent sums the partitions
+    with one vectorized reduction.
+
+    Parameters
+    ----------
+    partitions : int
+        Number of partitions, one per worker.
+    name : str, optional
+        Name of an existing block to attach to, by default a new zeroed block is created.
+    """
+
+    def __init__(self, partitions, name=None):
+        self.shape = (partitions,) + HEATMAP_SHAPE
+        size = int(np.prod(self.shape)) * np.dtype(np.int64).itemsize
+        self._owner = name is None
+        self._memory = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+        self.counts = np.ndarray(self.shape, dtype=np.int64, buffer=self._memory.buf)
+        if self._owner:
+            self.counts[:] = 0
+
+    @property
+    def name(self):
+        """Name of the shared memory block, used by workers to attach."""
+        return self._memory.name
+
+    def add(self, partition, hours, days):
+        """
+        Count events into a partition.
+
+        Parameters
+        ----------
+        partition : int
+            The partition of the calling worker.
+        hours, days : numpy.ndarray
+            Hour of the day and day of the week of each event.
+        """
+        cells = days.astype(np.int64) * HEATMAP_SHAPE[1] + hours
+        self.counts[partition] += np.bincount(cells, minlength=self.counts[partition].size).reshape(HEATMAP_SHAPE)
+
+    def reduce(self):
+        """Return the sum of all partitions as a (7, 24) array."""
+        return self.counts.sum(axis=0)
+
+    def close(self):
+        """Detach from the block; the creator also frees it."""
+        # The array must not outlive the buffer it points into
+        self.counts = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Shared counts and partition of the current worker process, set by `_attach`
+_worker = {}
+
+
+def _attach(name, partitions, next_partition):
+    with next_partition.get_lock():
+        partition = next_partition.value
+        next_partition.value += 1
+    _worker["counts"] = SharedCounts(partitions, name)
+    _worker["partition"] = partition
+
+
+def _count(source, kinds):
+    """
+    Count the events of an export path or an array of timestamps into the worker's partition.
+    """
+    if isinstance(source, str):
+        with open_data(source) as data:
+            source = EventTable.from_export(data).select(kinds, timed=True).timestamp
+    hours, days = local_time(np.asarray(source, dtype=np.int64))
+    _worker["counts"].add(_worker["partition"], hours, days)
+    return len(hours)
+
+
+def split_timestamps(data, chunks, kinds=("post_like",)):
+    """
+    Split the event timestamps of one export into chunks for `parallel_activity`.
+
+    Parameters
+    ----------
+    data : dict or buda.analysis.events.EventTable
+        The export data, or its event table.
+    chunks : int
+        Number of chunks.
+    kinds : iterable of str, optional
+        The event kinds to include, by default post likes. None includes all kinds.
+
+    Returns
+    -------
+    list of numpy.ndarray
+        Timestamps of the timed events, in `chunks` parts.
+    """
+    if not isinstance(data, EventTable):
+        data = EventTable.from_export(data)
+    return np.array_split(data.select(kinds, timed=True).timestamp, chunks)
+
+
+def parallel_activity(sources, kinds=("post_like",), processes=None):
+    """
+    Count activity by hour and day of the week in parallel worker processes.
+
+    Each worker process owns one partition of a shared (processes, 7, 24)
+    count array and adds the heatmap of every source it is given into it;
+    only the number of counted events is sent back. The histograms are the
+    sum over the partitions.
+
+    Parameters
+    ----------
+    sources : iterable
+        Paths to exports (e.g. one per user), loaded by the workers, or arrays
+        of timestamps, e.g. from `split_timestamps`.
+    kinds : iterable of str, optional
+        The event kinds to count in exports, by default post likes. None counts all kinds.
+    processes : int, optional
+        Number of worker processes, by default the number of CPUs.
+
+    Returns
+    -------
+    dict
+        'heatmap' (7 x 24 array of counts by day and hour), and 'hourly_activity'
+        and 'day_of_week_activity' as Counters like `get_hourly_activity` and
+        `get_days_of_week_activity`, and 'events', the number of counted events.
+    """
+    sources = list(sources)
+    kinds = None if kinds is None else tuple(kinds)
+    processes = max(min(processes or os.cpu_count() or 1, len(sources)), 1)
+    next_partition = multiprocessing.Value("i", 0)
+    with SharedCounts(processes) as counts:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_attach,
+                                 initargs=(counts.name, processes, next_partition)) as executor:
+            events = sum(executor.map(_count, sources, [kinds] * len(sources)))
+        heatmap = counts.reduce()
+
+    hourly = heatmap.sum(axis=0)
+    daily = heatmap.sum(axis=1)
+    return {
+        "heatmap": heatmap,
+        "hourly_activity": Counter({hour: int(count) for hour, count in enumerate(hourly) if count}),
+        "day_of_week_activity": Counter({day: int(count) for day, count in enumerate(daily) if count}),
+        "events": events,
+    }
@@ -0,0 +1,359 @@
+import os
+import math
+import json
+import random
+import threading
+from contextlib import contextmanager
+from collections.abc import Mapping
+from bisect import bisect_right
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+from .likes import calculate_total_likes, extract_hours
+from .categories import ACCOUNT_CATEGORIES
+
+# Hours of the day (local time) that count as night-time activity
+NIGHT_HOURS = range(0, 6)
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (KLL) of a stream of numbers.
+
+    Values are kept in a hierarchy of compactors; when a level is full, it
+    is sorted and every other value is promoted to the next level with
+    twice the weight. The sketch keeps O(k) values regardless of the stream
+    length, and the rank error is about 1.7 / k with high probability.
+
+    Parameters
+    ----------
+    k : int, optional
+        Capacity of the top compactor, which controls the accuracy, by default 200.
+    seed : int, optional
+        Seed of the random choice of the promoted values, by default None.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, value):
+        """Add a value to the sketch."""
+        self.compactors[0].append(float(value))
+        self.n += 1
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            compactor = self.compactors[level]
+            if len(compactor) < self._capacity(level):
+                continue
+            if level + 1 == len(self.compactors):
+                self.compactors.append([])
+            compactor.sort()
+            # With an odd number of values, the largest one stays on this level
+            keep = [compactor.pop()] if len(compactor) % 2 else []
+            self.compactors[level + 1].extend(compactor[self._rng.randrange(2)::2])
+            self.compactors[level] = keep
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one.
+
+        Parameters
+        ----------
+        other : KLLSketch
+            A sketch of another stream, e.g. of the users of another process.
+        """
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.n += other.n
+        self._compress()
+
+    def _weighted(self):
+        values = [(value, 2 ** level) for level, compactor in enumerate(self.compactors) for value in compactor]
+        values.sort()
+        return [value for value, _ in values], np.cumsum([weight for _, weight in values])
+
+    def rank(self, value):
+        """
+        Estimate the fraction of values at most `value`.
+
+        Returns
+        -------
+        float
+            The normalized rank in [0, 1], or NaN for an empty sketch.
+        """
+        if self.n == 0:
+            return float("nan")
+        weight = sum(
+            2 ** level * sum(1 for item in compactor if item <= value)
+            for level, compactor in enumerate(self.compactors)
+        )
+        return weight / sum(2 ** level * len(compactor) for level, compactor in enumerate(self.compactors))
+
+    def quantile(self, q):
+        """
+        Estimate the `q`-quantile of the values.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        float
+            The estimate, or NaN for an empty sketch.
+        """
+        if self.n == 0:
+            return float("nan")
+        values, cumulative = self._weighted()
+        position = bisect_right(cumulative, q * cumulative[-1])
+        return values[min(position, len(values) - 1)]
+
+    def __len__(self):
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def to_dict(self):
+        """Return the sketch as a JSON-serializable dictionary."""
+        return {"k": self.k, "n": self.n, "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, state, seed=None):
+        """Restore a sketch saved with `to_dict`."""
+        sketch = cls(state["k"], seed)
+        sketch.n = state["n"]
+        sketch.compactors = [list(compactor) for compactor in state["compactors"]]
+        return sketch
+
+
+def user_metrics(data, account_categories=None):
+    """
+    Compute the metrics a user is ranked by.
+
+    Parameters
+    ----------
+    data : dict or buda.analysis.events.EventTable
+        The data containing likes information with timestamps.
+    account_categories : dict, optional
+        A dictionary mapping liked accounts to categories. If given, the share
+        of likes of every broad category is included, by default None.
+
+    Returns
+    -------
+    dict
+        'total_likes', 'peak_hour' and 'night_share' (fraction of likes in
+        `NIGHT_HOURS`), and 'category_share:<broad category>' for each broad category.
+    """
+    hours = np.bincount(np.array(extract_hours(data), dtype=np.int64), minlength=24)
+    total = int(hours.sum())
+    metrics = {
+        "total_likes": calculate_total_likes(data) if isinstance(data, Mapping) else total,
+        "peak_hour": int(hours.argmax()) if total else 0,
+        "night_share": float(hours[list(NIGHT_HOURS)].sum() / total) if total else 0.0,
+    }
+    if account_categories is not None:
+        likes = [item.get("title", "Unknown") for item in data["likes_media_likes"]]
+        codes = ACCOUNT_CATEGORIES.encode(account_categories.get(account, "Unknown") for account in likes)
+        counts = ACCOUNT_CATEGORIES.count_broad(codes)
+        for code, category in enumerate(ACCOUNT_CATEGORIES.broad_categories):
+            metrics[f"category_share:{category}"] = float(counts[code] / len(likes)) if likes else 0.0
+    return metrics
+
+
+@contextmanager
+def _file_lock(file_path):
+    """Hold an exclusive lock on a file's lock file, where the platform supports it."""
+    with open(f"{file_path}.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class PopulationSketches:
+    """
+    Quantile sketches of per-user metrics over all processed users.
+
+    Only the sketches are kept, never the users' data, so memory and the cost
+    of ranking a user do not grow with the population. Sketches of different
+    processes or machines can be merged, and saving merges the users added
+    since the last save into the file, so several processes can share it.
+
+    Parameters
+    ----------
+    k : int, optional
+        Accuracy parameter of each sketch, see `KLLSketch`, by default 200.
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.sketches = {}
+        # Sketches of the users added since the last save, merged into the file by `save`
+        self._unsaved = {}
+        self._lock = threading.RLock()
+
+    def add(self, metrics):
+        """
+        Add the metrics of one user.
+
+        Parameters
+        ----------
+        metrics : dict
+            The metrics of the user, e.g. from `user_metrics`.
+        """
+        with self._lock:
+            for name, value in metrics.items():
+                self.sketches.setdefault(name, KLLSketch(self.k)).update(value)
+                self._unsaved.setdefault(name, KLLSketch(self.k)).update(value)
+
+    def rank_and_add(self, metrics, file_path=None):
+        """
+        Rank a user against the population before them, then add them.
+
+        The population is locked throughout, so concurrent users neither rank
+        against each other's half-added metrics nor miss each other's saves.
+
+        Parameters
+        ----------
+        metrics : dict
+            The metrics of the user, e.g. from `user_metrics`.
+        file_path : str, optional
+            The file the population is saved to after adding the user, by default it is not saved.
+
+        Returns
+        -------
+        tuple of (dict, int)
+            The ranks of the user, see `rank`, and the number of users they were ranked against.
+        """
+        with self._lock:
+            users = self.users()
+            ranks = self.rank(metrics)
+            self.add(metrics)
+            if file_path is not None:
+                self.save(file_path)
+        return ranks, users
+
+    def rank(self, metrics):
+        """
+        Rank a user against the population.
+
+        Parameters
+        ----------
+        metrics : dict
+            The metrics of the user.
+
+        Returns
+        -------
+        dict
+            A dictionary mapping each metric with population data to the
+            percentage of users with at most the user's value.
+        """
+        with self._lock:
+            return {
+                name: 100 * self.sketches[name].rank(value)
+                for name, value in metrics.items()
+                if name in self.sketches and self.sketches[name].n
+            }
+
+    def users(self, metric="total_likes"):
+        """Return the number of users with a value of a metric."""
+        with self._lock:
+            sketch = self.sketches.get(metric)
+            return 0 if sketch is None else sketch.n
+
+    def merge(self, other):
+        """Merge the sketches of another population into this one."""
+        with self._lock:
+            for name, sketch in other.sketches.items():
+                self.sketches.setdefault(name, KLLSketch(self.k)).merge(sketch)
+                self._unsaved.setdefault(name, KLLSketch(self.k)).merge(sketch)
+
+    def save(self, file_path):
+        """
+        Save the sketches to a JSON file.
+
+        If the file exists, the users added since the last save are merged
+        into the population in the file, which may include users added by
+        other processes, and this population is replaced by the result. The
+        file is locked while it is read and replaced, where the platform
+        supports it.
+
+        Parameters
+        ----------
+        file_path : str
+            The path of the file.
+        """
+        with self._lock, _file_lock(file_path):
+            if os.path.exists(file_path):
+                saved = self.load(file_path, self.k)
+                for name, sketch in self._unsaved.items():
+                    saved.sketches.setdefault(name, KLLSketch(saved.k)).merge(sketch)
+                self.sketches = saved.sketches
+            self._unsaved = {}
+            state = {"k": self.k, "sketches": {name: sketch.to_dict() for name, sketch in self.sketches.items()}}
+            temporary = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(state, f)
+            os.replace(temporary, file_path)
+
+    @classmethod
+    def load(cls, file_path, k=200):
+        """
+        Load sketches saved with `save`, or start an empty population if the file does not exist.
+        """
+        if not os.path.exists(file_path):
+            return cls(k)
+        with open(file_path, "r") as f:
+            state = json.load(f)
+        population = cls(state["k"])
+        population.sketches = {name: KLLSketch.from_dict(sketch) for name, sketch in state["sketches"].items()}
+        return population
+
+
+def summarize_rank(ranks, min_users=0, users=None):
+    """
+    Describe the engagement of a user relative to the population.
+
+    Parameters
+    ----------
+    ranks : dict
+        Percentile ranks of the user, e.g. from `PopulationSketches.rank`.
+    min_users : int, optional
+        Population size below which no comparison is made, by default 0.
+    users : int, optional
+        Number of users in the population, by default unknown.
+
+    Returns
+    -------
+    str
+        A one-sentence summary for the dashboard.
+    """
+    if "total_likes" not in ranks or (users is not None and users < min_users):
+        return "Your Instagram engagement is being compared as more users join."
+    percentile = ranks["total_likes"]
+    if percentile > 50:
+        summary = "Your Instagram engagement is above average!"
+    elif percentile < 50:
+        summary = "Your Instagram engagement is below average."
+    else:
+        summary = "Your Instagram engagement is about average."
+    summary += f" You liked at least as many posts as {percentile:.0f}% of users"
+    if ranks.get("night_share", 0) >= 90:
+        summary += " and you are one of the biggest night owls"
+    return summary + "."
@@ -0,0 +1,274 @@
+import os
+import json
+import math
+import random
+import logging
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from .categories import PENDING
+
+SAMPLING_DESIGN_FILE = "sampling_design.json"
+
+# Row of the names in strata without any classified name, e.g. after a budget or cancellation
+UNESTIMATED = "Unestimated"
+
+
+def required_sample_size(population, margin=0.05, confidence=0.95, proportion=0.5):
+    """
+    Number of names to classify so that category shares meet an error bound.
+
+    Parameters
+    ----------
+    population : int
+        The number of distinct names.
+    margin : float, optional
+        Target half-width of the confidence interval of a category share, by default 0.05.
+    confidence : float, optional
+        Confidence level of the interval, by default 0.95.
+    proportion : float, optional
+        Assumed category share; 0.5 gives the most conservative size, by default 0.5.
+
+    Returns
+    -------
+    int
+        The sample size, including the finite population correction.
+    """
+    if population <= 0:
+        return 0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    n0 = z ** 2 * proportion * (1 - proportion) / margin ** 2
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population)))
+
+
+def stratify(weights, n_strata=4):
+    """
+    Assign names to strata by the order of magnitude of their weight.
+
+    Parameters
+    ----------
+    weights : dict
+        Weight of each name, e.g. the number of likes of an account.
+    n_strata : int, optional
+        Maximum number of strata, by default 4. Stratum `h` holds the names
+        with a weight in [2**h, 2**(h + 1)); the last stratum is open-ended.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each name to its stratum.
+    """
+    return {
+        name: min(int(math.log2(weight)) if weight >= 1 else 0, n_strata - 1)
+        for name, weight in weights.items()
+    }
+
+
+def stratified_sample(strata, sample_size, seed=None):
+    """
+    Draw a stratified random sample with proportional allocation.
+
+    Parameters
+    ----------
+    strata : dict
+        A dictionary mapping each name to its stratum, e.g. from `stratify`.
+    sample_size : int
+        The total number of names to draw.
+    seed : int, optional
+        Seed of the random number generator, by default None.
+
+    Returns
+    -------
+    list of str
+        The sampled names. Every stratum contributes at least two names (or
+        all of its names, if it has fewer) so that its variance can be estimated.
+    """
+    members = {}
+    for name, stratum in strata.items():
+        members.setdefault(stratum, []).append(name)
+
+    rng = random.Random(seed)
+    population = len(strata)
+    sample = []
+    for stratum in sorted(members):
+        names = members[stratum]
+        allocation = max(round(sample_size * len(names) / population), 2)
+        sample.extend(rng.sample(names, min(allocation, len(names))))
+    return sample
+
+
+def save_sampling_design(strata, sample, output_folder, confidence=0.95):
+    """
+    Save the strata of a sample so that the statistics can be extrapolated later.
+
+    Parameters
+    ----------
+    strata : dict
+        A dictionary mapping each name of the population to its stratum.
+    sample : list of str
+        The sampled names.
+    output_folder : str
+        The folder where 'sampling_design.json' will be saved.
+    confidence : float, optional
+        Confidence level of the reported intervals, by default 0.95.
+
+    Returns
+    -------
+    dict
+        The sampling design.
+    """
+    sizes = {}
+    for stratum in strata.values():
+        sizes[stratum] = sizes.get(stratum, 0) + 1
+    design = {
+        "confidence": confidence,
+        "strata_sizes": {str(stratum): size for stratum, size in sizes.items()},
+        "strata": {name: strata[name] for name in sample},
+    }
+    with open(os.path.join(output_folder, SAMPLING_DESIGN_FILE), "w") as f:
+        json.dump(design, f, indent=4)
+    return design
+
+
+def load_sampling_design(folder):
+    """
+    Load the sampling design saved in a folder.
+
+    Parameters
+    ----------
+    folder : str
+        The folder of an analysis.
+
+    Returns
+    -------
+    dict or None
+        The sampling design, or None if the analysis classified every name.
+    """
+    path = os.path.join(folder, SAMPLING_DESIGN_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def estimate_category_counts(categorized_data, design, vocabulary, broad=False):
+    """
+    Extrapolate category counts of the population from a classified sample.
+
+    Uses the stratified estimator of totals with its finite-population
+    variance and normal-approximation confidence intervals.
+
+    Parameters
+    ----------
+    categorized_data : dict
+        A dictionary mapping the classified sample names to categories.
+    design : dict
+        The sampling design, e.g. from `load_sampling_design`.
+    vocabulary : buda.analysis.categories.CategoryVocabulary
+        The vocabulary the answers are normalized onto.
+    broad : bool, optional
+        Whether to estimate broad category counts, by default False.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns 'Category', 'Estimate', 'Lower' and 'Upper', for every category
+        observed in the sample. Names in strata without any classified name
+        are reported in an `UNESTIMATED` row, and the upper bound of every
+        category includes them.
+
+    Notes
+    -----
+    The variance of a stratum with a single classified name cannot be
+    estimated; it is bounded with the worst-case share variance of 1/4.
+    """
+    # Names whose classification was cancelled count as not sampled
+    names = [name for name in categorized_data if name in design["strata"] and categorized_data[name] != PENDING]
+    codes = vocabulary.encode(categorized_data[name] for name in names)
+    categories = vocabulary.categories
+    if broad:
+        codes = vocabulary.to_broad(codes)
+        categories = vocabulary.broad_categories
+
+    strata_ids = sorted(design["strata_sizes"], key=int)
+    position = {int(stratum): i for i, stratum in enumerate(strata_ids)}
+    strata = np.array([position[design["strata"][name]] for name in names], dtype=np.int64)
+    sizes = np.array([design["strata_sizes"][stratum] for stratum in strata_ids], dtype=float)
+
+    n_categories = len(categories)
+    counts = np.bincount(strata * n_categories + codes, minlength=len(sizes) * n_categories)
+    counts = counts.reshape(len(sizes), n_categories).astype(float)
+    sampled = counts.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(sampled[:, None] > 0, counts / sampled[:, None], 0.0)
+        correction = np.where(sampled > 1, (1 - sampled / sizes) / (sampled - 1), 0.0)
+    share_variance = shares * (1 - shares)
+    # One classified name gives no variance estimate; a census of the stratum needs none
+    single = (sampled == 1) & (sizes > 1)
+    correction[single] = 1 - 1 / sizes[single]
+    share_variance[single] = 0.25
+
+    # Strata without any classified name carry no information about the categories
+    covered = sampled > 0
+    unestimated = sizes[~covered].sum()
+    if unestimated:
+        logging.warning(f"{int(unestimated)} names are in strata without a classified name and are not estimated")
+    estimate = sizes[covered] @ shares[covered]
+    variance = (sizes[covered] ** 2 * correction[covered]) @ share_variance[covered]
+
+    z = NormalDist().inv_cdf((1 + design.get("confidence", 0.95)) / 2)
+    half_width = z * np.sqrt(variance)
+    observed = np.flatnonzero(counts.sum(axis=0))
+    estimates = pd.DataFrame({
+        "Category": [categories[code] for code in observed],
+        "Estimate": estimate[observed],
+        "Lower": np.maximum(estimate[observed] - half_width[observed], 0),
+        # The unestimated names may all belong to any one category
+        "Upper": np.minimum(estimate[observed] + half_width[observed] + unestimated, sizes.sum()),
+    })
+    if unestimated:
+        row = pd.DataFrame({"Category": [UNESTIMATED], "Estimate": [unestimated], "Lower": [unestimated], "Upper": [unestimated]})
+        estimates = pd.concat([estimates, row], ignore_index=True)
+    return estimates
+
+
+def clear_sampling_design(folder):
+    """
+    Remove a sampling design left over from an earlier approximate run.
+
+    Parameters
+    ----------
+    folder : str
+        The folder of an analysis.
+    """
+    path = os.path.join(folder, SAMPLING_DESIGN_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def save_estimates(estimates, counts_path, intervals_path):
+    """
+    Save estimated category counts and their confidence intervals to JSON.
+
+    Parameters
+    ----------
+    estimates : pandas.DataFrame
+        Estimates as returned by `estimate_category_counts`.
+    counts_path : str
+        Path of the JSON file with the rounded estimated counts.
+    intervals_path : str
+        Path of the JSON file with the lower and upper bound of each count.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping categories to rounded estimated counts.
+    """
+    counts = {row.Category: int(round(row.Estimate)) for row in estimates.itertuples()}
+    intervals = {row.Category: [float(row.Lower), float(row.Upper)] for row in estimates.itertuples()}
+    with open(counts_path, "w") as f:
+        json.dump(counts, f, indent=4)
+    with open(intervals_path, "w") as f:
+        json.dump(intervals, f, indent=4)
+    return counts
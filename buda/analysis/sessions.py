@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+# Likes further apart than this (in seconds) belong to different sessions
+DEFAULT_SESSION_GAP = 10 * 60
+
+
+def extract_timestamps(data):
+    """
+    Extract the like timestamps as a sorted array.
+
+    Parameters
+    ----------
+    data : dict
+        The data containing likes information with timestamps.
+
+    Returns
+    -------
+    numpy.ndarray
+        A sorted `int64` array of Unix timestamps.
+    """
+    timestamps = np.fromiter(
+        (item["string_list_data"][0]["timestamp"] for item in data["likes_media_likes"]),
+        dtype=np.int64,
+        count=len(data["likes_media_likes"]),
+    )
+    timestamps.sort()
+    return timestamps
+
+
+def detect_sessions(timestamps, gap=DEFAULT_SESSION_GAP):
+    """
+    Split likes into scrolling sessions.
+
+    A session is a burst of likes in which consecutive likes are at most
+    `gap` seconds apart.
+
+    Parameters
+    ----------
+    timestamps : numpy.ndarray
+        Sorted Unix timestamps, e.g. from `extract_timestamps`.
+    gap : int, optional
+        Largest gap in seconds between two likes of the same session,
+        by default 10 minutes.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per session with the columns 'start', 'end' (Unix timestamps),
+        'likes', 'duration' (seconds) and 'intensity' (likes per minute).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(timestamps) > gap) + 1
+    starts = np.concatenate(([0], breaks)) if len(timestamps) else breaks
+    ends = np.concatenate((breaks, [len(timestamps)])) if len(timestamps) else breaks
+
+    sessions = pd.DataFrame({
+        "start": timestamps[starts],
+        "end": timestamps[ends - 1],
+        "likes": ends - starts,
+    })
+    sessions["duration"] = sessions["end"] - sessions["start"]
+    # A single like still spans a moment, so count sessions as at least one minute long
+    sessions["intensity"] = sessions["likes"] / np.maximum(sessions["duration"] / 60, 1)
+    return sessions
+
+
+def session_statistics(sessions, quantiles=(0.5, 0.9, 0.99)):
+    """
+    Summarize the length and intensity distributions of sessions.
+
+    Parameters
+    ----------
+    sessions : pandas.DataFrame
+        Sessions as returned by `detect_sessions`.
+    quantiles : tuple of float, optional
+        The quantiles reported for each distribution, by default (0.5, 0.9, 0.99).
+
+    Returns
+    -------
+    dict
+        The number of sessions and, for 'duration', 'likes' and 'intensity',
+        the mean and the requested quantiles.
+    """
+    statistics = {"sessions": len(sessions)}
+    for column in ("duration", "likes", "intensity"):
+        values = sessions[column].to_numpy(dtype=float)
+        summary = {"mean": float(values.mean()) if len(values) else 0.0}
+        for q, value in zip(quantiles, np.quantile(values, quantiles) if len(values) else [0.0] * len(quantiles)):
+            summary[f"p{round(q * 100)}"] = float(value)
+        statistics[column] = summary
+    return statistics
+
+
+def _period_edges(timestamps, freq):
+    """
+    Local-time period boundaries covering all sorted timestamps.
+    """
+    local = tz.tzlocal()
+    first, last = pd.to_datetime(timestamps[[0, -1]], unit="s", utc=True).tz_convert(local).tz_localize(None)
+    first = first.normalize()
+    if freq.startswith("W"):
+        first -= pd.Timedelta(days=first.weekday())
+    # Build the calendar on naive local dates so that DST changes keep periods aligned to midnight
+    edges = pd.date_range(first, last + pd.tseries.frequencies.to_offset(freq), freq=freq)
+    if edges[0] > first:
+        edges = edges.insert(0, first)
+    edges = edges.tz_localize(local, ambiguous=np.zeros(len(edges), dtype=bool), nonexistent="shift_forward")
+    seconds = ((edges - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    return edges, seconds
+
+
+def rolling_activity(timestamps, freq="D", window=7):
+    """
+    Count likes per calendar period and smooth them with a rolling mean.
+
+    Parameters
+    ----------
+    timestamps : numpy.ndarray
+        Sorted Unix timestamps, e.g. from `extract_timestamps`.
+    freq : str, optional
+        Period length, "D" for days or "W-MON" for weeks starting on Monday, by default "D".
+    window : int, optional
+        Number of periods in the rolling mean, by default 7.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Indexed by period start (local time) with the columns 'likes' and 'rolling_mean'.
+    """
+    if len(timestamps) == 0:
+        return pd.DataFrame(columns=["likes", "rolling_mean"])
+
+    edges, seconds = _period_edges(timestamps, freq)
+    counts = np.diff(np.searchsorted(timestamps, seconds))
+
+    # Rolling sums from differences of the cumulative sum
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    lagged = cumulative[np.maximum(np.arange(1, len(cumulative)) - window, 0)]
+    periods = np.minimum(np.arange(1, len(counts) + 1), window)
+    rolling_mean = (cumulative[1:] - lagged) / periods
+
+    return pd.DataFrame({"likes": counts, "rolling_mean": rolling_mean}, index=edges[:-1])
+
+
+def account_engagement_over_time(data, freq="W-MON", top=None):
+    """
+    Count likes per account and calendar period.
+
+    Parameters
+    ----------
+    data : dict
+        The data containing likes information with account titles and timestamps.
+    freq : str, optional
+        Period length, "D" for days or "W-MON" for weeks starting on Monday, by default "W-MON".
+    top : int, optional
+        Keep only the `top` most liked accounts, by default all accounts.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per account (most liked first) and one column per period start.
+    """
+    likes = data["likes_media_likes"]
+    if not likes:
+        return pd.DataFrame()
+
+    accounts, names = pd.factorize(pd.Series([item.get("title", "Unknown") for item in likes], dtype=object))
+    timestamps = np.fromiter(
+        (item["string_list_data"][0]["timestamp"] for item in likes), dtype=np.int64, count=len(likes)
+    )
+
+    edges, seconds = _period_edges(np.sort(timestamps), freq)
+    periods = np.searchsorted(seconds, timestamps, side="right") - 1
+    n_periods = len(edges) - 1
+    counts = np.bincount(accounts * n_periods + periods, minlength=len(names) * n_periods)
+    counts = counts.reshape(len(names), n_periods)
+
+    order = np.argsort(-counts.sum(axis=1), kind="stable")
+    if top is not None:
+        order = order[:top]
+    return pd.DataFrame(counts[order], index=names[order], columns=edges[:-1])
@@ -0,0 +1,12 @@
+# Classification answers that carry no category. This module has no
+# dependencies, so the category index and the work queue can use them
+# without importing the analysis package.
+
+# Category of names whose classification was cancelled before it finished
+PENDING = "Pending"
+
+# Category of names the API could not classify
+UNKNOWN = "Unknown"
+
+# Answers that say nothing about the category of a name
+UNRESOLVED = frozenset({UNKNOWN, PENDING})
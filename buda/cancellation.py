@@ -0,0 +1,143 @@
+import time
+import signal
+import logging
+import threading
+from weakref import WeakSet
+from contextlib import contextmanager
+
+
+class CancelToken:
+    """
+    Cooperative cancellation of a long-running analysis.
+
+    A token is cancelled explicitly, e.g. by a web request handler or a
+    signal handler, or implicitly when its time limit has passed. A child
+    token is also cancelled with its parent, but cancelling the child or
+    reaching its time limit leaves the parent alone.
+
+    Parameters
+    ----------
+    time_limit : float, optional
+        Seconds after which the token counts as cancelled, by default no limit.
+    parent : CancelToken, optional
+        A token whose cancellation cancels this one, by default None.
+    """
+
+    def __init__(self, time_limit=None, parent=None):
+        self._event = threading.Event()
+        self._deadline = None if time_limit is None else time.monotonic() + time_limit
+        self._parent = parent
+        self._children = WeakSet()
+        self._lock = threading.Lock()
+        self.reason = None
+        if parent is not None:
+            parent._adopt(self)
+
+    def child(self, time_limit=None):
+        """
+        Return a token that is cancelled with this one or after its own time limit.
+
+        Parameters
+        ----------
+        time_limit : float, optional
+            Seconds after which the child counts as cancelled, by default no limit.
+
+        Returns
+        -------
+        CancelToken
+            The child token.
+        """
+        return CancelToken(time_limit, parent=self)
+
+    def _adopt(self, child):
+        with self._lock:
+            self._children.add(child)
+            cancelled = self._event.is_set()
+        if cancelled:
+            child.cancel(self.reason)
+
+    def cancel(self, reason="cancelled"):
+        """
+        Cancel the analysis.
+
+        Parameters
+        ----------
+        reason : str, optional
+            Why the analysis was cancelled, by default "cancelled".
+        """
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+            self._event.set()
+            children = list(self._children)
+        for child in children:
+            child.cancel(reason)
+
+    def remaining(self):
+        """Seconds left until the time limit of this token or a parent, or None without a limit."""
+        limits = [max(self._deadline - time.monotonic(), 0.0)] if self._deadline is not None else []
+        if self._parent is not None and self._parent.remaining() is not None:
+            limits.append(self._parent.remaining())
+        return min(limits) if limits else None
+
+    @property
+    def cancelled(self):
+        """Whether the analysis was cancelled or ran out of time."""
+        if not self._event.is_set():
+            # A parent past its time limit only notices when it is checked
+            if self._parent is not None and self._parent.cancelled:
+                self.cancel(self._parent.reason)
+            elif self._deadline is not None and time.monotonic() >= self._deadline:
+                self.cancel("time limit reached")
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """
+        Sleep until the token is cancelled or the timeout has passed.
+
+        Returns
+        -------
+        bool
+            Whether the token is cancelled.
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+@contextmanager
+def cancel_on_signals(token, signals=(signal.SIGINT, signal.SIGTERM)):
+    """
+    Cancel a token instead of interrupting the process on the given signals.
+
+    Outside the main thread signal handlers cannot be installed, and the
+    block runs without them.
+
+    Parameters
+    ----------
+    token : CancelToken
+        The token to cancel.
+    signals : tuple, optional
+        The signals to handle, by default SIGINT and SIGTERM.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield token
+        return
+
+    def handler(signum, frame):
+        logging.warning(f"Received signal {signum}, stopping after the current requests")
+        token.cancel(f"signal {signum}")
+
+    previous = {}
+    for signum in signals:
+        try:
+            previous[signum] = signal.signal(signum, handler)
+        except (ValueError, OSError):
+            pass
+    try:
+        yield token
+    finally:
+        for signum, old_handler in previous.items():
+            signal.signal(signum, old_handler)
@@ -0,0 +1,191 @@
+import mmap
+import struct
+from collections import Counter, defaultdict
+from .answers import UNRESOLVED
+
+# Binary layout of an index file (all integers little-endian):
+#   header        magic, number of names, number of categories
+#   name offsets  (n_names + 1) x uint32, offsets into the name blob
+#   codes         n_names x uint16, category code of each name
+#   cat offsets   (n_categories + 1) x uint32, offsets into the category blob
+#   name blob     UTF-8 encoded normalized names, sorted bytewise
+#   category blob UTF-8 encoded category names
+_MAGIC = b"BUDACIX1"
+_HEADER = struct.Struct("<8sII")
+_OFFSET = struct.Struct("<I")
+_CODE = struct.Struct("<H")
+
+
+def normalize_name(name):
+    """
+    Normalize an advertiser or account name for index lookups.
+
+    Parameters
+    ----------
+    name : str
+        The raw name as it appears in the Instagram export.
+
+    Returns
+    -------
+    str
+        The name with collapsed whitespace and case folded.
+    """
+    return " ".join(name.split()).casefold()
+
+
+def build_category_index(classifications, file_path):
+    """
+    Build a read-only category index from past classifications.
+
+    Parameters
+    ----------
+    classifications : dict or list of dict
+        One or more mappings of names to categories, e.g. the contents of
+        several 'categorized_data.json' files. When a name was classified
+        differently across mappings, the most frequent category wins.
+    file_path : str
+        The path where the index file will be written.
+
+    Returns
+    -------
+    int
+        The number of names stored in the index.
+
+    Notes
+    -----
+    Names classified as 'Unknown' or still 'Pending' are left out so that they
+    are retried against the API instead of being resolved from the index.
+    """
+    if isinstance(classifications, dict):
+        classifications = [classifications]
+
+    votes = defaultdict(Counter)
+    for mapping in classifications:
+        for name, category in mapping.items():
+            if category in UNRESOLVED:
+                continue
+            votes[normalize_name(name).encode("utf-8")][category] += 1
+
+    names = sorted(votes)
+    best = [votes[name].most_common(1)[0][0] for name in names]
+    categories = sorted(set(best))
+    codes = {category: code for code, category in enumerate(categories)}
+    encoded_categories = [category.encode("utf-8") for category in categories]
+
+    def offsets(blobs):
+        position = 0
+        table = [0]
+        for blob in blobs:
+            position += len(blob)
+            table.append(position)
+        return b"".join(_OFFSET.pack(offset) for offset in table)
+
+    with open(file_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(names), len(categories)))
+        f.write(offsets(names))
+        f.write(b"".join(_CODE.pack(codes[category]) for category in best))
+        f.write(offsets(encoded_categories))
+        f.write(b"".join(names))
+        f.write(b"".join(encoded_categories))
+
+    return len(names)
+
+
+class CategoryIndex:
+    """
+    Memory-mapped lookup table from names to categories.
+
+    The index file is mapped read-only, so opening it costs only a header
+    read and the pages are shared between all processes that map the same
+    file. Lookups are a binary search over the sorted names.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to an index written by `build_category_index`.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a category index.
+    """
+
+    def __init__(self, file_path):
+        self._file = open(file_path, "rb")
+        try:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, self._size, n_categories = _HEADER.unpack_from(self._buffer, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{file_path} is not a category index")
+
+        self._name_offsets = _HEADER.size
+        self._codes = self._name_offsets + (self._size + 1) * _OFFSET.size
+        category_offsets = self._codes + self._size * _CODE.size
+        self._names = category_offsets + (n_categories + 1) * _OFFSET.size
+        names_end = self._names + self._offset(self._name_offsets, self._size)
+        self.categories = tuple(
+            self._buffer[
+                names_end + self._offset(category_offsets, i):
+                names_end + self._offset(category_offsets, i + 1)
+            ].decode("utf-8")
+            for i in range(n_categories)
+        )
+
+    def _offset(self, table, i):
+        return _OFFSET.unpack_from(self._buffer, table + i * _OFFSET.size)[0]
+
+    def _name(self, i):
+        start = self._offset(self._name_offsets, i)
+        end = self._offset(self._name_offsets, i + 1)
+        return self._buffer[self._names + start:self._names + end]
+
+    def lookup(self, name, default=None):
+        """
+        Look up the category of a name.
+
+        Parameters
+        ----------
+        name : str
+            The advertiser or account name.
+        default : object, optional
+            Value returned when the name is not in the index, by default None.
+
+        Returns
+        -------
+        str or object
+            The stored category, or `default`.
+        """
+        key = normalize_name(name).encode("utf-8")
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._size and self._name(low) == key:
+            code = _CODE.unpack_from(self._buffer, self._codes + low * _CODE.size)[0]
+            return self.categories[code]
+        return default
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        """Unmap the index and close the underlying file."""
+        self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,214 @@
+import json
+import logging
+import zipfile
+import threading
+import posixpath
+from fnmatch import fnmatch
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# File names of the JSON members of an Instagram export and the dataset they hold.
+# Members are matched by file name only, since the folder layout differs between
+# export versions (e.g. 'likes/' vs 'your_instagram_activity/likes/').
+EXPORT_SCHEMA = {
+    "liked_posts.json": "likes_media_likes",
+    "liked_comments.json": "likes_comment_likes",
+    "post_comments_*.json": "comments_media_comments",
+    "reels_comments.json": "comments_reels_comments",
+    "saved_posts.json": "saved_saved_media",
+    "saved_collections.json": "saved_saved_collections",
+    "story_likes.json": "story_activities_story_likes",
+    "polls.json": "story_activities_polls",
+    "quizzes.json": "story_activities_quizzes",
+    "questions.json": "story_activities_questions",
+    "emoji_sliders.json": "story_activities_emoji_sliders",
+    "countdowns.json": "story_activities_countdowns",
+    "posts_viewed.json": "impressions_history_posts_seen",
+    "videos_watched.json": "impressions_history_videos_watched",
+    "ads_viewed.json": "impressions_history_ads_seen",
+    "ads_clicked.json": "impressions_history_ads_clicked",
+    "advertisers_using_your_activity_or_information.json": "ig_custom_audiences_all_types",
+}
+
+
+def match_member(member):
+    """
+    Return the dataset held by a ZIP member, or None if it is not in the schema.
+
+    Parameters
+    ----------
+    member : str
+        The path of the member inside the archive.
+
+    Returns
+    -------
+    str or None
+        The dataset key, e.g. "likes_media_likes".
+    """
+    if member.startswith("__MACOSX/") or member.endswith("/"):
+        return None
+    name = posixpath.basename(member)
+    for pattern, key in EXPORT_SCHEMA.items():
+        if fnmatch(name, pattern):
+            return key
+    return None
+
+
+def _parse_member(content, key):
+    """
+    Return the entries of a dataset from the decoded JSON of a member.
+    """
+    if isinstance(content, list):
+        return content
+    if isinstance(content, dict) and key in content:
+        return content[key]
+    logging.warning(f"Unexpected layout of the {key} member, ignoring it")
+    return []
+
+
+def _read_member(file_path, member, key):
+    """
+    Decompress and parse one member; runs in a worker process.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        return _parse_member(json.loads(archive.read(member)), key)
+
+
+class InstagramExport(Mapping):
+    """
+    Lazily loaded datasets of an Instagram export ZIP archive.
+
+    The archive is indexed against `EXPORT_SCHEMA` when it is opened, but
+    nothing is decompressed until a dataset is accessed. A dataset split over
+    several members (e.g. 'post_comments_1.json', 'post_comments_2.json') is
+    returned as one list. `load` decompresses and parses many members
+    concurrently, each worker thread reading through its own archive handle.
+
+    The export behaves like the dictionary returned by `buda.utils.load_data`,
+    e.g. `export["likes_media_likes"]`. Close it, or use it as a context
+    manager, to release the archive handles.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the ZIP archive.
+    max_workers : int, optional
+        Number of workers used by `load`, by default chosen by the executor.
+    processes : bool, optional
+        Whether `load` parses members in worker processes instead of threads,
+        by default False. Processes parallelize JSON parsing itself but pay for
+        sending the parsed data back.
+
+    Raises
+    ------
+    zipfile.BadZipFile
+        If the file is not a ZIP archive.
+    """
+
+    def __init__(self, file_path, max_workers=None, processes=False):
+        self.file_path = file_path
+        self.max_workers = max_workers
+        self.processes = processes
+        self.members = {}
+        with zipfile.ZipFile(file_path) as archive:
+            for member in sorted(archive.namelist()):
+                key = match_member(member)
+                if key is not None:
+                    self.members.setdefault(key, []).append(member)
+        self._datasets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._archives = []
+
+    def _archive(self):
+        # ZipFile serializes reads on a shared handle, so every thread opens its own
+        archive = getattr(self._local, "archive", None)
+        if archive is None:
+            archive = self._local.archive = zipfile.ZipFile(self.file_path)
+            with self._lock:
+                self._archives.append(archive)
+        return archive
+
+    def close(self):
+        """
+        Close the archive handles of all threads.
+
+        Loaded datasets stay available; datasets accessed later are read
+        through newly opened handles.
+        """
+        with self._lock:
+            archives, self._archives = self._archives, []
+            self._local = threading.local()
+        for archive in archives:
+            archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read(self, member, key):
+        return _parse_member(json.loads(self._archive().read(member)), key)
+
+    def __getitem__(self, key):
+        if key not in self.members:
+            raise KeyError(key)
+        with self._lock:
+            if key in self._datasets:
+                return self._datasets[key]
+        # Members are decompressed without the lock, so other datasets load concurrently;
+        # if two threads load the same dataset, the first one stored wins
+        entries = []
+        for member in self.members[key]:
+            entries.extend(self._read(member, key))
+        with self._lock:
+            return self._datasets.setdefault(key, entries)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def load(self, keys=None):
+        """
+        Decompress and parse datasets concurrently.
+
+        Parameters
+        ----------
+        keys : iterable of str, optional
+            The datasets to load, by default all datasets in the archive.
+            Unknown keys are ignored and loaded datasets are not parsed again.
+
+        Returns
+        -------
+        InstagramExport
+            The export itself, so that calls can be chained.
+        """
+        keys = list(self.members if keys is None else keys)
+        with self._lock:
+            tasks = [
+                (key, member)
+                for key in keys if key in self.members and key not in self._datasets
+                for member in self.members[key]
+            ]
+        if not tasks:
+            return self
+
+        if self.processes:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(_read_member, self.file_path, member, key) for key, member in tasks]
+                results = [future.result() for future in futures]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self._read, member, key) for key, member in tasks]
+                results = [future.result() for future in futures]
+
+        loaded = {}
+        for (key, _), entries in zip(tasks, results):
+            loaded.setdefault(key, []).extend(entries)
+        with self._lock:
+            for key, entries in loaded.items():
+                self._datasets.setdefault(key, entries)
+        return self
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageProfiler:
+    """
+    Opt-in profiler that measures the stages of an analysis.
+
+    Each stage is run under cProfile and tracemalloc and reported with its
+    wall time, CPU time, peak traced memory, the lines that allocated the
+    most memory and the functions with the highest cumulative time. The
+    report is written as JSON when the profiler is closed.
+
+    Parameters
+    ----------
+    report_path : str, optional
+        Path of the JSON report. If None, profiling is disabled and stages
+        run without overhead, by default None.
+    top : int, optional
+        Number of allocating lines and functions listed per stage, by default 10.
+
+    Notes
+    -----
+    cProfile only sees the thread that runs the stage, so the function list
+    of stages that use a thread pool shows the waiting main thread. CPU time
+    and memory include all threads of the process.
+    """
+
+    def __init__(self, report_path=None, top=10):
+        self.report_path = report_path
+        self.top = top
+        self.stages = []
+
+    @property
+    def enabled(self):
+        return self.report_path is not None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the enclosed block as one stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage in the report.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        current_before = tracemalloc.get_traced_memory()[0]
+
+        profile = cProfile.Profile()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+            self.stages.append({
+                "name": name,
+                "wall_time": wall_time,
+                "cpu_time": cpu_time,
+                "peak_memory": peak - current_before,
+                "net_memory": current - current_before,
+                "top_lines": self._top_lines(before, after),
+                "top_functions": self._top_functions(profile),
+            })
+            logging.info(f"Stage {name}: {wall_time:.3f}s wall, {cpu_time:.3f}s CPU, {peak - current_before} bytes peak")
+
+    def _top_lines(self, before, after):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        statistics = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        return [
+            {
+                "file": statistic.traceback[0].filename,
+                "line": statistic.traceback[0].lineno,
+                "size": statistic.size_diff,
+                "count": statistic.count_diff,
+            }
+            for statistic in statistics[:self.top]
+        ]
+
+    def _top_functions(self, profile):
+        statistics = pstats.Stats(profile).stats
+        functions = sorted(statistics.items(), key=lambda entry: entry[1][3], reverse=True)
+        return [
+            {
+                "function": f"{os.path.basename(filename)}:{line}({function})",
+                "calls": calls,
+                "total_time": total_time,
+                "cumulative_time": cumulative_time,
+            }
+            for (filename, line, function), (_, calls, total_time, cumulative_time, _) in functions[:self.top]
+        ]
+
+    def write(self):
+        """Write the report of all profiled stages to `report_path`."""
+        if not self.enabled:
+            return
+        directory = os.path.dirname(self.report_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.report_path, "w") as f:
+            json.dump({"stages": self.stages}, f, indent=4, sort_keys=True)
+        logging.info(f"Profiling report saved to {self.report_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.write()
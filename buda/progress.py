@@ -0,0 +1,245 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+
+class ProgressTracker:
+    """
+    Emit structured progress events for one stage of an analysis.
+
+    Events are dictionaries with the keys 'stage', 'done', 'total',
+    'elapsed' (seconds), 'throughput' (items per second), 'eta' (seconds,
+    None while unknown) and 'finished'. They are passed to `sink`, which can
+    be any callable, e.g. `ProgressBroker.sink`.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage, e.g. "assign_categories".
+    total : int
+        Number of items the stage processes.
+    sink : callable, optional
+        Called with every event. If None, no events are emitted, by default None.
+    min_interval : float, optional
+        Minimum number of seconds between two events; the first and the last
+        event are always emitted, by default 0.5.
+    """
+
+    def __init__(self, stage, total, sink=None, min_interval=0.5):
+        self.stage = stage
+        self.total = total
+        self.sink = sink
+        self.min_interval = min_interval
+        self.done = 0
+        self._start = time.monotonic()
+        self._last_emit = None
+        self._lock = threading.Lock()
+        self._emit(force=True)
+
+    def advance(self, n=1):
+        """
+        Mark items as processed.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of newly processed items, by default 1.
+        """
+        with self._lock:
+            self.done += n
+            self._emit(force=self.done >= self.total)
+
+    def finish(self):
+        """Emit the final event of the stage, even if not all items were processed."""
+        with self._lock:
+            self._emit(force=True, finished=True)
+
+    def _emit(self, force=False, finished=None):
+        if self.sink is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_emit is not None and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+        elapsed = now - self._start
+        throughput = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.done, 0)
+        self.sink({
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": elapsed,
+            "throughput": throughput,
+            "eta": remaining / throughput if throughput > 0 else None,
+            "finished": self.done >= self.total if finished is None else finished,
+        })
+
+
+class ProgressBroker:
+    """
+    Thread-safe store of the latest progress event of many jobs.
+
+    Producers publish events through `sink(job_id)`; consumers block in
+    `wait` until a newer event than the one they have seen is available,
+    or await `wait_async` from an event loop without holding a thread.
+    Only the latest event per job is kept, so memory does not grow with
+    the number of events, and the final event of a job is forgotten
+    `retention` seconds after it was published, so memory does not grow
+    with the number of jobs either.
+
+    Parameters
+    ----------
+    retention : float, optional
+        Seconds the final event of a job stays available to late consumers,
+        by default 600.
+    """
+
+    def __init__(self, retention=600):
+        self.retention = retention
+        self._events = {}
+        # Expiry times of finished jobs, in the order they finished
+        self._expiry = {}
+        self._expiring = deque()
+        self._condition = threading.Condition()
+        # Futures of coroutines awaiting the next event of a job, with their event loops
+        self._watchers = {}
+
+    def publish(self, job_id, event, final=False):
+        """
+        Publish a progress event for a job.
+
+        Parameters
+        ----------
+        job_id : str
+            The job the event belongs to.
+        event : dict
+            The progress event.
+        final : bool, optional
+            Whether this is the last event of the job, after which the job
+            is forgotten once the retention has passed, by default False.
+        """
+        now = time.monotonic()
+        with self._condition:
+            self._expire(now)
+            sequence = self._events.get(job_id, (0, None))[0] + 1
+            self._events[job_id] = (sequence, event)
+            if final:
+                self._expiry[job_id] = now + self.retention
+                self._expiring.append((now + self.retention, job_id))
+            else:
+                self._expiry.pop(job_id, None)
+            self._condition.notify_all()
+            watchers = self._watchers.pop(job_id, [])
+        for loop, future in watchers:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def sink(self, job_id):
+        """
+        Return a progress sink that publishes events for a job.
+
+        Parameters
+        ----------
+        job_id : str
+            The job the events belong to.
+
+        Returns
+        -------
+        callable
+            A function taking a progress event.
+        """
+        return lambda event: self.publish(job_id, event)
+
+    def latest(self, job_id):
+        """
+        Return the latest event of a job, or None if it has not published any.
+        """
+        with self._condition:
+            return self._events.get(job_id, (0, None))[1]
+
+    def wait(self, job_id, seen=0, timeout=None):
+        """
+        Wait for an event newer than the last one seen.
+
+        Parameters
+        ----------
+        job_id : str
+            The job to wait for.
+        seen : int, optional
+            Sequence number of the last event seen, by default 0.
+        timeout : float, optional
+            Maximum number of seconds to wait, by default no limit.
+
+        Returns
+        -------
+        tuple
+            The sequence number and the latest event, or (`seen`, None) on timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._events.get(job_id, (0, None))[0] > seen, timeout)
+            sequence, event = self._events.get(job_id, (0, None))
+            if sequence > seen:
+                return sequence, event
+            return seen, None
+
+    async def wait_async(self, job_id, seen=0, timeout=None):
+        """
+        Await an event newer than the last one seen.
+
+        Parameters
+        ----------
+        job_id : str
+            The job to wait for.
+        seen : int, optional
+            Sequence number of the last event seen, by default 0.
+        timeout : float, optional
+            Maximum number of seconds to wait, by default no limit.
+
+        Returns
+        -------
+        tuple
+            The sequence number and the latest event, or (`seen`, None) on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            sequence, event = self._events.get(job_id, (0, None))
+            if sequence > seen:
+                return sequence, event
+            future = loop.create_future()
+            watcher = (loop, future)
+            self._watchers.setdefault(job_id, []).append(watcher)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                if watcher in self._watchers.get(job_id, []):
+                    self._watchers[job_id].remove(watcher)
+                    if not self._watchers[job_id]:
+                        del self._watchers[job_id]
+                sequence, event = self._events.get(job_id, (0, None))
+        if sequence > seen:
+            return sequence, event
+        return seen, None
+
+    def discard(self, job_id):
+        """Forget the events of a finished job."""
+        with self._condition:
+            self._events.pop(job_id, None)
+            self._expiry.pop(job_id, None)
+
+    def _expire(self, now):
+        # The retention is the same for all jobs, so the queue is ordered by expiry time
+        while self._expiring and self._expiring[0][0] <= now:
+            expiry, job_id = self._expiring.popleft()
+            # Jobs that published again or were discarded have no or a later expiry
+            if self._expiry.get(job_id) == expiry:
+                del self._expiry[job_id]
+                self._events.pop(job_id, None)
+
+
+def _wake(future):
+    # The awaiting coroutine may have timed out in the meantime
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,181 @@
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    user TEXT NOT NULL,
+    job TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user, job, stage)
+);
+CREATE INDEX IF NOT EXISTS results_recent ON results (user, updated_at DESC);
+"""
+
+
+def _to_json(value):
+    # DataFrames are stored as a list of row records
+    if hasattr(value, "to_dict"):
+        value = value.to_dict(orient="records")
+    return json.dumps(value)
+
+
+class ResultsStore:
+    """
+    SQLite store of analysis results, keyed by user, job and stage.
+
+    Every stage of an analysis (e.g. 'hourly_activity' or 'summary_categories')
+    is stored as one JSON value, so that serving all results of a job is a
+    single indexed query. Each call opens its own connection, so one store
+    can be shared by the threads of a web server.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the database, created if it does not exist.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def write(self, user, job, results):
+        """
+        Store the results of several stages in one transaction.
+
+        Parameters
+        ----------
+        user : str
+            The user the job belongs to.
+        job : str
+            The job id.
+        results : dict
+            A dictionary mapping stage names to JSON-serializable values or
+            DataFrames. Stored stages are replaced.
+        """
+        now = time.time()
+        rows = [(user, job, stage, _to_json(value), now) for stage, value in results.items()]
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+
+    def read(self, user, job, stages=None):
+        """
+        Load the results of a job.
+
+        Parameters
+        ----------
+        user : str
+            The user the job belongs to.
+        job : str
+            The job id.
+        stages : iterable of str, optional
+            The stages to load, by default all stages.
+
+        Returns
+        -------
+        dict
+            A dictionary mapping the stored stages to their values.
+        """
+        query = "SELECT stage, value FROM results WHERE user = ? AND job = ?"
+        parameters = [user, job]
+        if stages is not None:
+            stages = list(stages)
+            query += f" AND stage IN ({', '.join('?' * len(stages))})"
+            parameters += stages
+        with closing(self._connect()) as connection:
+            return {stage: json.loads(value) for stage, value in connection.execute(query, parameters)}
+
+    def jobs(self, user):
+        """
+        Return the jobs of a user, most recently updated first.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT job FROM results WHERE user = ? GROUP BY job ORDER BY MAX(updated_at) DESC", (user,)
+            )
+            return [job for job, in rows]
+
+    def latest_jobs(self):
+        """
+        Return the most recently updated job of every user.
+
+        The rows are fetched at once, so the connection is closed before the
+        caller processes them, however long that takes.
+
+        Returns
+        -------
+        list of tuple of str
+            The user and the job id, ordered by user.
+        """
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT user, job FROM results AS r WHERE updated_at = "
+                "(SELECT MAX(updated_at) FROM results WHERE user = r.user) GROUP BY user ORDER BY user"
+            ).fetchall()
+
+    def delete(self, user, job):
+        """Remove all results of a job."""
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM results WHERE user = ? AND job = ?", (user, job))
+
+
+class JobResults:
+    """
+    Collects the results of one job and writes them to a store in bulk.
+
+    Analysis functions `add` their results while they run; everything added
+    is written in a single transaction by `flush`, which is also called when
+    the context manager exits, even after an error, so partial results are kept.
+
+    Parameters
+    ----------
+    store : ResultsStore
+        The store the results are written to.
+    user : str
+        The user the job belongs to.
+    job : str
+        The job id.
+    """
+
+    def __init__(self, store, user, job):
+        self.store = store
+        self.user = user
+        self.job = job
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, value):
+        """
+        Add the result of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The stage name, e.g. 'hourly_activity'.
+        value : object
+            A JSON-serializable value or a DataFrame.
+        """
+        with self._lock:
+            self._pending[stage] = value
+
+    def flush(self):
+        """Write all results added since the last flush."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.store.write(self.user, self.job, pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
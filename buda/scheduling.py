@@ -0,0 +1,129 @@
+import os
+import json
+import math
+import logging
+from .answers import UNRESOLVED
+
+
+class RequestBudget:
+    """
+    Upper bound on the API spend of a classification run, counted in names.
+
+    The budget limits the names sent to the API, not single requests. Each
+    name costs two POST requests to the on-demand API (a session and a
+    query), and with hedging enabled a slow name can cost a duplicate of its
+    classification on top (see `buda.transport.RequestPolicy`);
+    `cost_per_name` should cover both.
+
+    Parameters
+    ----------
+    max_names : int, optional
+        Maximum number of names sent to the API, by default no limit.
+    max_cost : float, optional
+        Maximum total cost of the run, by default no limit.
+    cost_per_name : float, optional
+        Cost of classifying one name, i.e. of its requests, by default 1.0.
+    """
+
+    def __init__(self, max_names=None, max_cost=None, cost_per_name=1.0):
+        self.max_names = max_names
+        self.max_cost = max_cost
+        self.cost_per_name = cost_per_name
+
+    @property
+    def limit(self):
+        """The number of names that can be classified, or None if unlimited."""
+        limits = []
+        if self.max_names is not None:
+            limits.append(self.max_names)
+        if self.max_cost is not None:
+            limits.append(math.floor(self.max_cost / self.cost_per_name))
+        return max(min(limits), 0) if limits else None
+
+
+def prioritize(names, weights=None):
+    """
+    Order distinct names by descending weight.
+
+    Parameters
+    ----------
+    names : iterable of str
+        The names, possibly with duplicates.
+    weights : dict, optional
+        Weight of each name, e.g. the number of likes of an account. Names
+        without a weight count as 0. If None, the input order is kept.
+
+    Returns
+    -------
+    list of str
+        The distinct names, heaviest first. Ties keep their input order.
+    """
+    unique = list(dict.fromkeys(names))
+    if weights is None:
+        return unique
+    return sorted(unique, key=lambda name: -weights.get(name, 0))
+
+
+def plan_requests(names, budget=None):
+    """
+    Split prioritized names into the ones to classify and the ones to skip.
+
+    Parameters
+    ----------
+    names : list of str
+        Distinct names in priority order, e.g. from `prioritize`.
+    budget : RequestBudget, optional
+        The request budget, by default no limit.
+
+    Returns
+    -------
+    tuple of list
+        The names within the budget and the names beyond it.
+    """
+    limit = None if budget is None else budget.limit
+    if limit is None:
+        return names, []
+    return names[:limit], names[limit:]
+
+
+def save_coverage_report(categorized_data, weights, skipped, output_folder):
+    """
+    Report which share of the total weight the classified names cover.
+
+    Only names with a category count as covered; names left pending by a
+    cancelled run or answered with 'Unknown' are reported as unresolved.
+
+    Parameters
+    ----------
+    categorized_data : dict
+        A dictionary mapping the names sent for classification to categories.
+    weights : dict
+        Weight of each name, e.g. the number of likes of an account.
+    skipped : list of str
+        The names left out because of the budget.
+    output_folder : str
+        The folder where 'classification_coverage.json' will be saved.
+
+    Returns
+    -------
+    dict
+        The number of classified, unresolved and skipped names and the covered share of the weight.
+    """
+    total = sum(weights.values())
+    classified = [name for name, category in categorized_data.items() if category not in UNRESOLVED]
+    covered = sum(weights.get(name, 0) for name in classified)
+    report = {
+        "classified": len(classified),
+        "unresolved": len(categorized_data) - len(classified),
+        "skipped": len(skipped),
+        "covered_weight": covered,
+        "total_weight": total,
+        "coverage": covered / total if total else 1.0,
+    }
+    with open(os.path.join(output_folder, "classification_coverage.json"), "w") as f:
+        json.dump(report, f, indent=4)
+    logging.info(
+        f"Classified names cover {report['coverage']:.1%} of the total weight, "
+        f"{report['unresolved']} names unresolved, {len(skipped)} names skipped"
+    )
+    return report
@@ -0,0 +1,381 @@
+"""
+Pre-forked worker server for analysis jobs.
+
+The parent process imports the heavy modules (pandas, matplotlib, the
+category vocabularies, ...) and maps the category indexes once, freezes
+the garbage collector and forks workers that share these pages
+copy-on-write. Workers take jobs from a local UNIX socket, so a job pays
+neither for the imports nor for setting up HTTP connections.
+
+Start a server with e.g.
+
+    python -m buda.server --socket /tmp/buda.sock --workers 4 \
+        --index companies=companies.idx --index instagram_accounts=accounts.idx
+
+and submit jobs with `submit("/tmp/buda.sock", "activity", file_path="export.zip")`.
+"""
+import gc
+import os
+import json
+import signal
+import socket
+import logging
+import argparse
+import importlib
+import requests
+from .cancellation import CancelToken, cancel_on_signals
+from .category_index import CategoryIndex
+from .transport import RequestPolicy
+
+# Modules imported by the parent before forking, so workers start with them loaded
+PRELOAD_MODULES = (
+    "numpy",
+    "pandas",
+    "matplotlib.pyplot",
+    "seaborn",
+    "buda.utils",
+    "buda.export",
+    "buda.analysis",
+    "buda.analysis.categories",
+    "buda.analysis.events",
+    "buda.analysis.heavy_hitters",
+    "buda.analysis.companies",
+    "buda.analysis.instagram_accounts",
+)
+
+# Seconds a worker blocks in accept before checking whether it should stop
+_POLL_INTERVAL = 0.5
+
+# Seconds a worker waits for a client to send its request or take the response
+REQUEST_TIMEOUT = 30
+
+
+class JobFailed(RuntimeError):
+    """Raised by `submit` when a job raised an error in the worker."""
+
+
+class WorkerContext:
+    """
+    State a worker keeps across the jobs it runs.
+
+    Parameters
+    ----------
+    api_key : str
+        API key for authentication, used by jobs that classify names.
+    index_paths : dict
+        A dictionary mapping the queues ('companies', 'instagram_accounts') to category index paths.
+    indexes : dict, optional
+        A dictionary mapping the queues to category indexes mapped by the parent
+        before forking, used instead of opening `index_paths`, by default None.
+    """
+
+    def __init__(self, api_key, index_paths, indexes=None):
+        self.api_key = api_key
+        self.index_paths = index_paths
+        self.indexes = indexes or {}
+        # Connections are opened after the fork; sockets must not be shared between workers
+        self.policy = RequestPolicy(session=requests.Session())
+        self.jobs = 0
+
+
+def _ping_job(context):
+    return {"pid": os.getpid(), "jobs": context.jobs}
+
+
+def _activity_job(context, file_path):
+    from .utils import open_data
+    from .analysis.likes import get_activity
+    from .analysis.events import EventTable
+    from .analysis.heavy_hitters import get_like_stream_statistics
+
+    with open_data(file_path) as data:
+        # Building the event table loads the datasets of a ZIP export concurrently
+        events = EventTable.from_export(data)
+        hourly_activity, day_of_week_activity = get_activity(events)
+        statistics = get_like_stream_statistics(data)
+        return {
+            "hourly_activity": hourly_activity,
+            "day_of_week_activity": day_of_week_activity,
+            "top_liked_accounts": statistics.top_accounts(10),
+            "liked_content_types": dict(statistics.content_types),
+        }
+
+
+def _companies_job(context, file_path, output_folder, **kwargs):
+    from .utils import open_data
+    from .analysis.companies import map_companies
+
+    if "index_path" not in kwargs:
+        kwargs.setdefault("index", context.indexes.get("companies"))
+        kwargs["index_path"] = context.index_paths.get("companies")
+    with open_data(file_path) as data:
+        map_companies(data, context.api_key, output_folder, policy=context.policy, **kwargs)
+    return {"output_folder": output_folder}
+
+
+def _instagram_accounts_job(context, file_path, output_folder, **kwargs):
+    from .utils import open_data
+    from .analysis.instagram_accounts import analyze_instagram_accounts
+
+    if "index_path" not in kwargs:
+        kwargs.setdefault("index", context.indexes.get("instagram_accounts"))
+        kwargs["index_path"] = context.index_paths.get("instagram_accounts")
+    with open_data(file_path) as data:
+        analyze_instagram_accounts(data, context.api_key, output_folder, policy=context.policy, **kwargs)
+    return {"output_folder": output_folder}
+
+
+# Jobs a worker can run: functions of the worker context and the JSON arguments of the request
+JOBS = {
+    "ping": _ping_job,
+    "activity": _activity_job,
+    "companies": _companies_job,
+    "instagram_accounts": _instagram_accounts_job,
+}
+
+
+def _send(connection, message):
+    connection.sendall(json.dumps(message, default=str).encode("utf-8") + b"\n")
+
+
+def _receive(connection):
+    with connection.makefile("rb") as f:
+        line = f.readline()
+    if not line:
+        raise ConnectionError("Connection closed before a message was received")
+    return json.loads(line)
+
+
+class WorkerServer:
+    """
+    Pre-forked pool of warm workers listening on a UNIX socket.
+
+    Every connection carries one job: the client sends a JSON line
+    {"job": name, "args": {...}} and receives {"ok": true, "result": ...} or
+    {"ok": false, "error": ...}. Workers that exit, e.g. after `max_jobs`
+    jobs, are replaced by new forks of the warm parent.
+
+    Parameters
+    ----------
+    socket_path : str
+        Path of the UNIX socket; an existing file at this path is replaced.
+    workers : int, optional
+        Number of worker processes, by default the number of CPUs.
+    api_key : str, optional
+        API key passed to jobs that classify names, by default None.
+    index_paths : dict, optional
+        A dictionary mapping the queues ('companies', 'instagram_accounts') to
+        category index paths, mapped by the parent before forking, by default None.
+    preload : iterable of str, optional
+        Modules imported by the parent before forking, by default `PRELOAD_MODULES`.
+    jobs : dict, optional
+        Additional jobs, see `JOBS`, by default None.
+    max_jobs : int, optional
+        Number of jobs after which a worker is replaced, which bounds the memory a
+        worker can leak, by default no limit.
+    request_timeout : float, optional
+        Seconds a worker waits for a client to send its request or take the
+        response, so a stalled client cannot hold a worker, by default `REQUEST_TIMEOUT`.
+    """
+
+    def __init__(self, socket_path, workers=None, api_key=None, index_paths=None, preload=PRELOAD_MODULES,
+                 jobs=None, max_jobs=None, request_timeout=REQUEST_TIMEOUT):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("The worker server needs os.fork, which this platform does not provide")
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+        self.api_key = api_key
+        self.index_paths = dict(index_paths or {})
+        self.preload = tuple(preload)
+        self.jobs = dict(JOBS, **(jobs or {}))
+        self.max_jobs = max_jobs
+        self.request_timeout = request_timeout
+        self.indexes = {}
+        self.pids = set()
+        self._stop = CancelToken()
+        self._listener = None
+
+    def warm_up(self):
+        """Import the preloaded modules and map the category indexes."""
+        for module in self.preload:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                logging.warning(f"Could not preload {module}: {e}")
+        # Mapping the indexes fails early on a bad path and leaves their pages in the shared page cache
+        for queue, index_path in self.index_paths.items():
+            if queue not in self.indexes:
+                self.indexes[queue] = CategoryIndex(index_path)
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen(128)
+        return listener
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return pid
+        code = 0
+        try:
+            self._serve_jobs()
+        except BaseException:
+            logging.exception("Worker crashed")
+            code = 1
+        finally:
+            # Never return into the parent's stack, e.g. a test runner or the supervisor loop
+            os._exit(code)
+
+    def _serve_jobs(self):
+        stop = CancelToken()
+        # The indexes mapped by the parent are shared, not mapped again by every worker
+        context = WorkerContext(self.api_key, self.index_paths, self.indexes)
+        self._listener.settimeout(_POLL_INTERVAL)
+        with cancel_on_signals(stop):
+            while not stop.cancelled and (self.max_jobs is None or context.jobs < self.max_jobs):
+                try:
+                    connection, _ = self._listener.accept()
+                except socket.timeout:
+                    continue
+                with connection:
+                    connection.settimeout(self.request_timeout)
+                    self._handle(connection, context)
+                context.jobs += 1
+
+    def _handle(self, connection, context):
+        try:
+            try:
+                request = _receive(connection)
+            except OSError as e:
+                # e.g. a client that connected but sent nothing within the request timeout
+                logging.warning(f"Could not read the request: {e}")
+                return
+            job = self.jobs[request["job"]]
+            result = job(context, **request.get("args", {}))
+            response = {"ok": True, "result": result}
+        except Exception as e:
+            logging.exception("Job failed")
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        try:
+            _send(connection, response)
+        except OSError as e:
+            logging.warning(f"Could not answer the client: {e}")
+
+    def _reap(self):
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                return
+            if pid == 0:
+                return
+            if pid in self.pids:
+                self.pids.discard(pid)
+                if status:
+                    logging.warning(f"Worker {pid} exited with status {status}")
+
+    def serve_forever(self):
+        """
+        Warm up, fork the workers and replace exited workers until `stop` is
+        called or the process receives SIGINT or SIGTERM.
+        """
+        self.warm_up()
+        self._listener = self._bind()
+        # Objects created so far are never collected in the workers, so the
+        # collector does not write to (and thereby copy) the shared pages
+        gc.collect()
+        gc.freeze()
+        try:
+            with cancel_on_signals(self._stop):
+                while not self._stop.cancelled:
+                    self._reap()
+                    while len(self.pids) < self.workers and not self._stop.cancelled:
+                        self._spawn()
+                    self._stop.wait(_POLL_INTERVAL)
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        """Stop the server; the workers finish their current job first."""
+        self._stop.cancel("stopped")
+
+    def _shutdown(self):
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.pids.discard(pid)
+        for pid in list(self.pids):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids.clear()
+        gc.unfreeze()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        for index in self.indexes.values():
+            index.close()
+        self.indexes.clear()
+
+
+def submit(socket_path, job, timeout=None, **args):
+    """
+    Run a job on a worker server and wait for its result.
+
+    Parameters
+    ----------
+    socket_path : str
+        Path of the server's UNIX socket.
+    job : str
+        Name of the job, e.g. 'activity'.
+    timeout : float, optional
+        Seconds to wait for the result, by default no limit.
+    **args
+        JSON-serializable arguments of the job.
+
+    Returns
+    -------
+    object
+        The result of the job, decoded from JSON.
+
+    Raises
+    ------
+    JobFailed
+        If the job raised an error in the worker.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+        _send(connection, {"job": job, "args": args})
+        response = _receive(connection)
+    if not response["ok"]:
+        raise JobFailed(response["error"])
+    return response["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve analysis jobs from pre-forked warm workers.")
+    parser.add_argument("--socket", default="buda.sock", help="path of the UNIX socket")
+    parser.add_argument("--workers", type=int, help="number of worker processes, by default the number of CPUs")
+    parser.add_argument("--api-key", default=os.environ.get("BUDA_API_KEY"), help="API key, by default $BUDA_API_KEY")
+    parser.add_argument("--index", action="append", default=[], metavar="QUEUE=PATH",
+                        help="category index of a queue, e.g. companies=companies.idx")
+    parser.add_argument("--max-jobs", type=int, help="jobs after which a worker is replaced")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(process)d - %(levelname)s - %(message)s")
+    index_paths = dict(index.split("=", 1) for index in args.index)
+    WorkerServer(args.socket, args.workers, args.api_key, index_paths, max_jobs=args.max_jobs).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import os
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files of a snapshot inside its folder; the ETag file is written last and removed
+# first, so a snapshot counts as present only when all its encodings are complete
+SNAPSHOT_NAME = "results.html"
+_ETAG_FILE = SNAPSHOT_NAME + ".etag"
+_ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def _write_atomic(path, content):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def save_snapshot(folder, html):
+    """
+    Save a rendered page compressed with gzip and, if available, brotli.
+
+    Parameters
+    ----------
+    folder : str
+        The folder of the job the page belongs to.
+    html : str
+        The rendered page.
+
+    Returns
+    -------
+    str
+        The ETag of the snapshot, a hash of the page.
+    """
+    content = html.encode("utf-8")
+    etag = hashlib.sha256(content).hexdigest()[:32]
+    clear_snapshot(folder)
+    _write_atomic(os.path.join(folder, SNAPSHOT_NAME + ".gz"), gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write_atomic(os.path.join(folder, SNAPSHOT_NAME + ".br"), brotli.compress(content, mode=brotli.MODE_TEXT))
+    _write_atomic(os.path.join(folder, _ETAG_FILE), etag.encode("ascii"))
+    return etag
+
+
+def snapshot_etag(folder):
+    """
+    Return the ETag of the snapshot in a folder, or None if there is no snapshot.
+    """
+    try:
+        with open(os.path.join(folder, _ETAG_FILE), "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def clear_snapshot(folder):
+    """
+    Remove the snapshot of a folder, e.g. because its results are regenerated.
+
+    Parameters
+    ----------
+    folder : str
+        The folder of the job the page belongs to.
+    """
+    for suffix in (".etag", ".br", ".gz"):
+        try:
+            os.remove(os.path.join(folder, SNAPSHOT_NAME + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def accepted_encodings(header):
+    """
+    Parse an Accept-Encoding header.
+
+    Parameters
+    ----------
+    header : str
+        The header value, e.g. "gzip, deflate, br;q=0.8".
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each encoding to its quality. Encodings with
+        quality 0 are left out.
+    """
+    encodings = {}
+    for part in (header or "").split(","):
+        encoding, _, parameters = part.strip().partition(";")
+        quality = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if encoding and quality > 0:
+            encodings[encoding.lower()] = quality
+    return encodings
+
+
+def load_snapshot(folder, accept_encoding):
+    """
+    Load the snapshot of a folder in the best encoding the client accepts.
+
+    Parameters
+    ----------
+    folder : str
+        The folder of the job the page belongs to.
+    accept_encoding : str
+        The Accept-Encoding header of the request.
+
+    Returns
+    -------
+    tuple or None
+        The compressed or plain page, its Content-Encoding (None for plain)
+        and the ETag of this encoding of the page; None if there is no snapshot.
+
+    Notes
+    -----
+    The encodings of a page are different representations, so each gets its
+    own strong ETag: the snapshot's ETag suffixed with the encoding.
+    """
+    etag = snapshot_etag(folder)
+    if etag is None:
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    candidates = sorted(
+        (encoding for encoding in _ENCODINGS if accepted.get(encoding, accepted.get("*", 0)) > 0),
+        key=lambda encoding: -accepted.get(encoding, accepted.get("*", 0)),
+    )
+    try:
+        for encoding in candidates:
+            path = os.path.join(folder, SNAPSHOT_NAME + _ENCODINGS[encoding])
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return f.read(), encoding, f"{etag}-{encoding}"
+        with open(os.path.join(folder, SNAPSHOT_NAME + ".gz"), "rb") as f:
+            return gzip.decompress(f.read()), None, f"{etag}-identity"
+    except FileNotFoundError:
+        # The snapshot was cleared while it was read
+        return None
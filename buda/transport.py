@@ -0,0 +1,429 @@
+import os
+import re
+import copy
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import requests
+
+# Connect and read timeout in seconds of every request to the on-demand API
+DEFAULT_TIMEOUT = (3.05, 30)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request is not answered before its deadline."""
+
+
+class CassetteMiss(LookupError):
+    """Raised when a replayed request is not on the cassette."""
+
+
+# Session ids differ between runs, so they are left out of the cassette keys
+_SESSION_ID = re.compile(r"/sessions/[^/]+/")
+
+
+class Cassette:
+    """
+    Recorded answers of the on-demand API, keyed by request.
+
+    Requests are identified by their URL, with session ids normalized, and
+    their JSON body; headers, which carry the API key, are never stored.
+    The cassette is a gzip-compressed JSON file that is loaded into memory,
+    so replayed answers cost no network round trip.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the cassette file.
+    mode : {"replay", "record", "mixed"}, optional
+        "replay" answers only from the cassette and raises `CassetteMiss` for
+        unknown requests; "record" sends every request and records its answer;
+        "mixed" answers from the cassette and sends and records only the
+        requests it does not know, by default "replay".
+
+    Raises
+    ------
+    FileNotFoundError
+        If the cassette does not exist in replay mode.
+    """
+
+    MODES = ("replay", "record", "mixed")
+
+    def __init__(self, file_path, mode="replay"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {self.MODES}")
+        self.file_path = file_path
+        self.mode = mode
+        self._answers = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        if mode == "replay" or os.path.exists(file_path):
+            with gzip.open(file_path, "rt", encoding="utf-8") as f:
+                self._answers = json.load(f)
+
+    @staticmethod
+    def key(url, body):
+        """
+        Return the key of a request.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the request.
+        body : dict
+            The JSON body.
+
+        Returns
+        -------
+        str
+            A hash of the normalized URL and the body.
+        """
+        request = json.dumps([_SESSION_ID.sub("/sessions/{id}/", url), body], sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()[:32]
+
+    def lookup(self, url, body):
+        """
+        Return the recorded answer of a request, or None if the request must be sent.
+
+        Raises
+        ------
+        CassetteMiss
+            If the request is not on the cassette in replay mode.
+        """
+        if self.mode == "record":
+            return None
+        key = self.key(url, body)
+        with self._lock:
+            answer = self._answers.get(key)
+        if answer is None and self.mode == "replay":
+            raise CassetteMiss(f"No recorded answer for {url}")
+        # Callers may modify the answer, the recording must stay intact
+        return copy.deepcopy(answer)
+
+    def record(self, url, body, answer):
+        """Record the answer of a request that was sent."""
+        with self._lock:
+            self._answers[self.key(url, body)] = answer
+            self._changed = True
+
+    def __len__(self):
+        return len(self._answers)
+
+    def save(self):
+        """Write the recorded answers to the cassette file if any were added."""
+        with self._lock:
+            if not self._changed:
+                return
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary = f"{self.file_path}.tmp"
+            with gzip.open(temporary, "wt", encoding="utf-8") as f:
+                json.dump(self._answers, f, sort_keys=True, separators=(",", ":"))
+            os.replace(temporary, self.file_path)
+            self._changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+
+
+class RunStatistics:
+    """
+    Thread-safe counters describing the requests of a classification run.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, n=1):
+        """
+        Increase a counter.
+
+        Parameters
+        ----------
+        name : str
+            The counter, e.g. "deadline_hits".
+        n : int, optional
+            The increment, by default 1.
+        """
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def as_dict(self):
+        """Return a copy of all counters."""
+        with self._lock:
+            return dict(self._counts)
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent request latencies.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of latencies kept, by default 200.
+    """
+
+    def __init__(self, size=200):
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Record the latency of a completed request."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, q):
+        """
+        Return the `q`-th percentile of the recorded latencies, or None if there are none.
+        """
+        with self._lock:
+            if not self._latencies:
+                return None
+            return float(np.percentile(self._latencies, q))
+
+
+class RequestPolicy:
+    """
+    Deadlines and hedging for the requests of a classification run.
+
+    Every request gets a connect and read timeout, capped by the time left
+    until the deadline of the whole run. With hedging enabled, a duplicate
+    of a classification is started when the first attempt takes longer than
+    the recent latency percentile; the first answer wins and the other
+    attempt is cancelled or, if already in flight, its answer is discarded.
+
+    Parameters
+    ----------
+    timeout : tuple of float, optional
+        Connect and read timeout of each request in seconds, by default `DEFAULT_TIMEOUT`.
+    run_timeout : float, optional
+        Maximum duration of the whole run in seconds, by default no limit.
+    hedge : bool, optional
+        Whether to issue hedged duplicate requests, by default False.
+    hedge_percentile : float, optional
+        Latency percentile after which a duplicate is issued, by default 95.
+    min_hedge_delay : float, optional
+        Hedge delay in seconds used until enough latencies are known, and the
+        lower bound of the delay, by default 1.0.
+    max_workers : int, optional
+        Number of threads running first attempts, and as many again running the
+        duplicates. It should be at least the number of threads calling `call`
+        concurrently, by default 10.
+    cassette : Cassette, optional
+        Recorded answers that are replayed instead of sending requests, and
+        where the answers of sent requests are recorded, by default None.
+    session : requests.Session, optional
+        Session whose pooled connections are reused across requests and runs,
+        by default every request opens its own connection.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, run_timeout=None, hedge=False, hedge_percentile=95,
+                 min_hedge_delay=1.0, max_workers=10, cassette=None, session=None):
+        self.timeout = timeout
+        self.run_timeout = run_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_workers = max_workers
+        self.cassette = cassette
+        self.session = session
+        self.latency = LatencyTracker()
+        self._executor = None
+        self._backup_executor = None
+        self._executor_lock = threading.Lock()
+        self.start_run()
+
+    def start_run(self, cancel=None):
+        """
+        Reset the run deadline and statistics; called at the start of every run.
+
+        Parameters
+        ----------
+        cancel : buda.cancellation.CancelToken, optional
+            Token of the run. Its time limit caps the deadline, and once it is
+            cancelled no more requests are sent, by default None.
+        """
+        self.statistics = RunStatistics()
+        self._deadline = None if self.run_timeout is None else time.monotonic() + self.run_timeout
+        self._cancel = cancel
+
+    def remaining(self):
+        """Seconds left until the run deadline or the time limit of the run's token, or None without either."""
+        limits = [] if self._deadline is None else [max(self._deadline - time.monotonic(), 0.0)]
+        if self._cancel is not None:
+            if self._cancel.cancelled:
+                return 0.0
+            if self._cancel.remaining() is not None:
+                limits.append(self._cancel.remaining())
+        return min(limits) if limits else None
+
+    def request_timeout(self):
+        """
+        Return the timeout of the next request.
+
+        Returns
+        -------
+        tuple of float
+            Connect and read timeout, capped by the time left in the run.
+
+        Raises
+        ------
+        DeadlineExceeded
+            If the run deadline has passed.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise DeadlineExceeded("Run deadline exceeded")
+        connect, read = self.timeout
+        return min(connect, remaining), min(read, remaining)
+
+    def post(self, url, headers, body):
+        """
+        Send a POST request with a JSON body and decode the JSON answer.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the request.
+        headers : dict
+            The request headers.
+        body : dict
+            The JSON body.
+
+        Returns
+        -------
+        dict
+            The decoded JSON answer.
+
+        Raises
+        ------
+        DeadlineExceeded
+            If the request timed out or the run deadline has passed.
+        CassetteMiss
+            If the request is not on a cassette in replay mode.
+        """
+        if self.cassette is not None:
+            try:
+                answer = self.cassette.lookup(url, body)
+            except CassetteMiss:
+                self.statistics.increment("cassette_misses")
+                raise
+            if answer is not None:
+                self.statistics.increment("replayed_requests")
+                return answer
+        try:
+            response = (self.session or requests).post(url, headers=headers, json=body, timeout=self.request_timeout())
+        except (requests.Timeout, DeadlineExceeded) as e:
+            self.statistics.increment("deadline_hits")
+            raise DeadlineExceeded(str(e)) from e
+        self.statistics.increment("requests")
+        answer = response.json()
+        if self.cassette is not None and response.ok:
+            self.cassette.record(url, body, answer)
+        return answer
+
+    def _timed(self, func, *args, **kwargs):
+        start = time.monotonic()
+        result = func(*args, **kwargs)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run a classification, hedging it if enabled.
+
+        Parameters
+        ----------
+        func : callable
+            The classification, e.g. `query_on_demand_api`.
+        *args, **kwargs
+            Arguments passed to `func`.
+
+        Returns
+        -------
+        object
+            The result of the first attempt to finish.
+
+        Raises
+        ------
+        DeadlineExceeded
+            If no attempt finishes before the run deadline.
+        """
+        if not self.hedge:
+            return self._timed(func, *args, **kwargs)
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                # Backups get their own threads, so they start at once even when every
+                # primary thread is busy with a slow attempt
+                self._backup_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            executor, backup_executor = self._executor, self._backup_executor
+        primary = executor.submit(self._timed, func, *args, **kwargs)
+        delay = max(self.latency.percentile(self.hedge_percentile) or 0.0, self.min_hedge_delay)
+        remaining = self.remaining()
+        done, _ = wait([primary], timeout=delay if remaining is None else min(delay, remaining))
+        if done:
+            return primary.result()
+
+        self.statistics.increment("hedged_requests")
+        backup = backup_executor.submit(self._timed, func, *args, **kwargs)
+        done, pending = wait([primary, backup], timeout=self.remaining(), return_when=FIRST_COMPLETED)
+        for future in pending:
+            future.cancel()
+        if not done:
+            self.statistics.increment("deadline_hits")
+            raise DeadlineExceeded("Run deadline exceeded")
+        winner = primary if primary in done else backup
+        if winner is backup:
+            self.statistics.increment("hedge_wins")
+        return winner.result()
+
+    def save_statistics(self, output_folder):
+        """
+        Save the run statistics to 'run_statistics.json'.
+
+        Parameters
+        ----------
+        output_folder : str
+            The folder where the statistics will be saved.
+
+        Returns
+        -------
+        dict
+            The run statistics.
+        """
+        statistics = self.statistics.as_dict()
+        statistics["p95_latency"] = self.latency.percentile(95)
+        with open(os.path.join(output_folder, "run_statistics.json"), "w") as f:
+            json.dump(statistics, f, indent=4)
+        if statistics.get("deadline_hits"):
+            logging.warning(f"{statistics['deadline_hits']} requests hit their deadline")
+        return statistics
+
+    def close(self):
+        """
+        Shut down the threads of hedged attempts without waiting for abandoned ones,
+        and save the answers recorded on the cassette.
+        """
+        with self._executor_lock:
+            for executor in (self._executor, self._backup_executor):
+                if executor is not None:
+                    executor.shutdown(wait=False)
+            self._executor = self._backup_executor = None
+        if self.cassette is not None:
+            self.cassette.save()
@@ -1,18 +1,23 @@
+import os
 import json
+from contextlib import contextmanager
+from .export import InstagramExport
 
 def load_data(file_path):
     """
-    Load data from a JSON file.
+    Load data from a JSON file or an Instagram export ZIP archive.
 
     Parameters
     ----------
-    file_path : str
-        The path to the JSON file to be loaded.
+    file_path : str or os.PathLike
+        The path to the JSON file to be loaded, or to a ZIP archive as
+        delivered by Instagram.
 
     Returns
     -------
-    dict
-        The data loaded from the JSON file.
+    dict or buda.export.InstagramExport
+        The data loaded from the JSON file, or the lazily loaded datasets
+        of the archive.
 
     Raises
     ------
@@ -20,6 +25,33 @@ def load_data(file_path):
         If the file does not exist.
     json.JSONDecodeError
         If the file is not a valid JSON.
+    zipfile.BadZipFile
+        If a file ending in '.zip' is not a ZIP archive.
     """
+    if os.fspath(file_path).lower().endswith(".zip"):
+        return InstagramExport(file_path)
     with open(file_path, "r") as f:
-        return json.load(f)
\ No newline at end of file
+        return json.load(f)
+
+
+@contextmanager
+def open_data(file_path):
+    """
+    Load data with `load_data` and release the archive handles of a ZIP export afterwards.
+
+    Parameters
+    ----------
+    file_path : str or os.PathLike
+        The path to the JSON file or the ZIP archive.
+
+    Yields
+    ------
+    dict or buda.export.InstagramExport
+        The loaded data.
+    """
+    data = load_data(file_path)
+    try:
+        yield data
+    finally:
+        if isinstance(data, InstagramExport):
+            data.close()
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import multiprocessing
+from contextlib import contextmanager, nullcontext
+from .answers import PENDING, UNKNOWN
+from .category_index import CategoryIndex
+from .transport import RequestPolicy
+
+# Names of the classification queues and the categories of names that never got a result
+QUEUES = ("companies", "instagram_accounts")
+UNFINISHED = PENDING
+FAILED = UNKNOWN
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    queue TEXT NOT NULL,
+    name TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (queue, name)
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (queue, state, priority DESC);
+CREATE TABLE IF NOT EXISTS results (
+    queue TEXT NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (queue, name)
+);
+"""
+
+
+def worker_name():
+    """Return a name identifying this worker process across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class WorkQueue:
+    """
+    Durable classification queue shared by worker processes.
+
+    Names are leased to workers for a limited time. A worker that crashes
+    or hangs loses its lease, and its names are handed to the next worker
+    asking for work. Results are written at most once per name: the first
+    result wins and later ones, e.g. from a worker whose lease had already
+    expired, are discarded.
+
+    The queue is a SQLite database in WAL mode, so workers on one machine
+    can share it directly. Workers on several machines need the database on
+    a file system with working POSIX locks.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the database, created if it does not exist.
+    lease_timeout : float, optional
+        Seconds a worker may hold a name before it is requeued, by default 120.
+    max_attempts : int, optional
+        Number of leases after which a name is given up, by default 3.
+    """
+
+    def __init__(self, db_path, lease_timeout=120, max_attempts=3):
+        self.db_path = db_path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never lease the same rows
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def enqueue(self, queue, names, weights=None):
+        """
+        Add names to a queue; names already in it are left unchanged.
+
+        Parameters
+        ----------
+        queue : str
+            The queue, one of `QUEUES`.
+        names : iterable of str
+            The names to classify.
+        weights : dict, optional
+            Priority of each name; names with a higher weight are leased first,
+            by default all names have the same priority.
+
+        Returns
+        -------
+        int
+            The number of names added.
+        """
+        if queue not in QUEUES:
+            raise ValueError(f"Unknown queue {queue!r}, expected one of {QUEUES}")
+        weights = weights or {}
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (queue, name, priority) VALUES (?, ?, ?)",
+                ((queue, name, weights.get(name, 0)) for name in names),
+            )
+            return connection.total_changes - before
+
+    def lease(self, queue, worker, n=1):
+        """
+        Lease the next names of a queue, including names whose lease expired.
+
+        Parameters
+        ----------
+        queue : str
+            The queue.
+        worker : str
+            The name of the worker, e.g. from `worker_name`.
+        n : int, optional
+            Maximum number of names, by default 1.
+
+        Returns
+        -------
+        list of str
+            The leased names, highest priority first; empty if there is no work left.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            names = [row[0] for row in connection.execute(
+                "SELECT name FROM tasks WHERE queue = ? AND attempts < ? "
+                "AND (state = 'queued' OR (state = 'leased' AND lease_expires < ?)) "
+                "ORDER BY priority DESC, name LIMIT ?",
+                (queue, self.max_attempts, now, n),
+            )]
+            connection.executemany(
+                "UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE queue = ? AND name = ?",
+                ((worker, now + self.lease_timeout, queue, name) for name in names),
+            )
+        return names
+
+    def extend(self, queue, worker, names):
+        """
+        Renew the leases a worker still holds on some names.
+
+        Returns
+        -------
+        int
+            The number of leases renewed.
+        """
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE queue = ? AND name = ? AND lease_owner = ? AND state = 'leased'",
+                ((time.time() + self.lease_timeout, queue, name, worker) for name in names),
+            )
+            return connection.total_changes - before
+
+    def complete(self, queue, worker, results):
+        """
+        Record the categories of leased names.
+
+        Parameters
+        ----------
+        queue : str
+            The queue.
+        worker : str
+            The name of the worker.
+        results : dict
+            A dictionary mapping names to categories.
+
+        Returns
+        -------
+        int
+            The number of results recorded; results of names that already
+            have one are discarded.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO results (queue, name, category, worker, finished_at) VALUES (?, ?, ?, ?, ?)",
+                ((queue, name, category, worker, now) for name, category in results.items()),
+            )
+            recorded = connection.total_changes - before
+            connection.executemany(
+                "UPDATE tasks SET state = 'done', lease_owner = NULL, lease_expires = NULL WHERE queue = ? AND name = ?",
+                ((queue, name) for name in results),
+            )
+        return recorded
+
+    def release(self, queue, worker, names):
+        """Give names back to the queue without a result, e.g. when a worker is cancelled."""
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE tasks SET state = 'queued', lease_owner = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                "WHERE queue = ? AND name = ? AND lease_owner = ? AND state = 'leased'",
+                ((queue, name, worker) for name in names),
+            )
+
+    def status(self, queue):
+        """
+        Count the names of a queue by state.
+
+        Returns
+        -------
+        dict
+            Number of 'queued', 'leased', 'done' and 'failed' names. Names whose
+            leases are used up without a result count as failed.
+        """
+        counts = {"queued": 0, "leased": 0, "done": 0, "failed": 0}
+        rows = self._connection.execute(
+            "SELECT CASE WHEN state != 'done' AND attempts >= ? AND (state = 'queued' OR lease_expires < ?) "
+            "THEN 'failed' ELSE state END, COUNT(*) FROM tasks WHERE queue = ? GROUP BY 1",
+            (self.max_attempts, time.time(), queue),
+        )
+        for state, count in rows:
+            counts[state] += count
+        return counts
+
+    def categorized_data(self, queue):
+        """
+        Return the categories of all names of a queue.
+
+        Returns
+        -------
+        dict
+            A dictionary mapping every enqueued name to its category. Names
+            given up after `max_attempts` leases are 'Unknown', names still
+            queued or leased are 'Pending'.
+        """
+        rows = self._connection.execute(
+            "SELECT tasks.name, COALESCE(results.category, CASE WHEN tasks.attempts >= ? "
+            "AND (tasks.state = 'queued' OR tasks.lease_expires < ?) THEN ? ELSE ? END) FROM tasks "
+            "LEFT JOIN results ON results.queue = tasks.queue AND results.name = tasks.name "
+            "WHERE tasks.queue = ? ORDER BY tasks.priority DESC, tasks.name",
+            (self.max_attempts, time.time(), FAILED, UNFINISHED, queue),
+        )
+        return dict(rows.fetchall())
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _classifier(queue, api_key, index, policy):
+    """
+    Return a function classifying one name of a queue.
+    """
+    if queue == "companies":
+        from .analysis.companies import identify_market_category
+        return lambda name: identify_market_category(name, api_key, index=index, policy=policy)
+
+    from .analysis.instagram_accounts import query_instagram_api
+
+    def classify(name):
+        category = index.lookup(name) if index is not None else None
+        return category or policy.call(query_instagram_api, api_key, name, policy=policy)
+    return classify
+
+
+def run_worker(db_path, queue, api_key, worker=None, batch_size=5, lease_timeout=120, max_attempts=3, index_path=None, policy=None, cancel=None):
+    """
+    Classify names leased from a work queue until the queue is empty.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the queue database.
+    queue : str
+        The queue, one of `QUEUES`.
+    api_key : str
+        API key for authentication.
+    worker : str, optional
+        The name of the worker, by default from `worker_name`.
+    batch_size : int, optional
+        Number of names leased at once, by default 5.
+    lease_timeout : float, optional
+        Seconds the worker may take to classify one name; the leases of the
+        batch are renewed after every name, by default 120.
+    max_attempts : int, optional
+        Number of leases after which a name is given up, by default 3.
+    index_path : str, optional
+        Path to a category index consulted before the API, by default None.
+    policy : buda.transport.RequestPolicy, optional
+        Timeouts, run deadline and hedging of the requests, by default the default timeouts.
+    cancel : buda.cancellation.CancelToken, optional
+        Stops the worker after the current name; unfinished names of the batch
+        are given back to the queue, by default None.
+
+    Returns
+    -------
+    int
+        The number of results this worker recorded.
+    """
+    worker = worker or worker_name()
+    policy = policy or RequestPolicy()
+    recorded = 0
+    with WorkQueue(db_path, lease_timeout=lease_timeout, max_attempts=max_attempts) as work_queue, \
+            (CategoryIndex(index_path) if index_path is not None else nullcontext()) as index:
+        classify = _classifier(queue, api_key, index, policy)
+        while cancel is None or not cancel.cancelled:
+            names = work_queue.lease(queue, worker, batch_size)
+            if not names:
+                break
+            results = {}
+            for name in names:
+                if cancel is not None and cancel.cancelled:
+                    break
+                results[name] = classify(name)
+                # Results are recorded per batch, so a slow batch renews the leases
+                # of all its names, finished or not, to keep them from other workers
+                work_queue.extend(queue, worker, names)
+            recorded += work_queue.complete(queue, worker, results)
+            work_queue.release(queue, worker, [name for name in names if name not in results])
+    policy.close()
+    logging.info(f"Worker {worker} recorded {recorded} results")
+    return recorded
+
+
+def start_workers(db_path, queue, api_key, processes=4, **kwargs):
+    """
+    Run several workers in separate processes on this machine and wait for them.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the queue database.
+    queue : str
+        The queue, one of `QUEUES`.
+    api_key : str
+        API key for authentication.
+    processes : int, optional
+        Number of worker processes, by default 4.
+    **kwargs
+        Further arguments of `run_worker`.
+
+    Returns
+    -------
+    list of int
+        The exit codes of the worker processes.
+    """
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(db_path, queue, api_key), kwargs=kwargs)
+        for _ in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    return [process.exitcode for process in workers]
+
+
+def rebuild_results(db_path, queue, output_folder):
+    """
+    Rebuild 'categorized_data.json' and the statistics of a queue from its results.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the queue database.
+    queue : str
+        The queue, one of `QUEUES`.
+    output_folder : str
+        The folder of the analysis.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping names to categories, as saved.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    with WorkQueue(db_path) as work_queue:
+        data = work_queue.categorized_data(queue)
+        status = work_queue.status(queue)
+    with open(os.path.join(output_folder, "categorized_data.json"), "w") as f:
+        json.dump(data, f, indent=4)
+
+    if queue == "companies":
+        from .analysis.companies import generate_statistics, create_broad_category_summary
+        generate_statistics(data, output_folder)
+        create_broad_category_summary(output_folder)
+    else:
+        from .analysis.instagram_accounts import generate_statistics, analyze_categories
+        generate_statistics(data, output_folder)
+        analyze_categories(data, output_folder)
+
+    if status["queued"] or status["leased"]:
+        logging.warning(f"{status['queued'] + status['leased']} names of {queue} are still pending")
+    return data
@@ -0,0 +1,27 @@
+import pytest
+
+
+@pytest.fixture
+def flask_app(tmp_path, monkeypatch):
+    """The Flask app module with its jobs, results and shared state in a temporary folder."""
+    pytest.importorskip("flask")
+    from buda.analysis.advice import AdviceCache
+    from buda.analysis.population import PopulationSketches
+    from buda.results_store import ResultsStore
+    from app import app as flask_app
+
+    # The stores are created when the app is imported, so they are replaced along with the config
+    jobs_folder = tmp_path / "jobs"
+    jobs_folder.mkdir()
+    config = {
+        "JOBS_FOLDER": str(jobs_folder),
+        "RESULTS_DB": str(jobs_folder / "results.sqlite"),
+        "POPULATION_SKETCHES": str(jobs_folder / "population_sketches.json"),
+        "ADVICE_CACHE": str(jobs_folder / "advice_cache.json"),
+    }
+    for key, value in config.items():
+        monkeypatch.setitem(flask_app.app.config, key, value)
+    monkeypatch.setattr(flask_app, "results_store", ResultsStore(config["RESULTS_DB"]))
+    monkeypatch.setattr(flask_app, "population", PopulationSketches())
+    monkeypatch.setattr(flask_app, "advice_cache", AdviceCache(config["ADVICE_CACHE"]))
+    return flask_app
@@ -0,0 +1,95 @@
+import json
+import pytest
+import pandas as pd
+from buda.analysis.advice import (
+    RULES, DEFAULT_ADVICE, AdviceCache, advice_statistics, evaluate_rules, generate_advice,
+)
+
+
+def statistics(**kwargs):
+    hourly = kwargs.pop("hourly", {"1": 40, "14": 60})
+    daily = kwargs.pop("daily", {"5": 50, "6": 50})
+    return advice_statistics(hourly, daily, **kwargs)
+
+
+def test_advice_statistics():
+    sessions = pd.DataFrame({"start": [0, 3600, 86400], "duration": [600, 1800, 3600]})
+    stats = statistics(category_shares={"Art": 3, "Friends": 1}, sessions=sessions)
+    assert stats["total"] == 100
+    assert stats["peak_hour"] == 14
+    assert stats["night_share"] == 0.4 and stats["night_percent"] == 40
+    assert stats["weekend_share"] == 1.0
+    assert stats["busiest_day"] == "Saturday"
+    assert stats["top_category"] == "Art" and stats["top_category_percent"] == 75
+    assert stats["median_session_minutes"] == 30
+    assert stats["sessions_per_day"] == 1.5
+
+
+def test_empty_statistics_give_default_advice():
+    stats = advice_statistics({}, {})
+    assert evaluate_rules(stats) == []
+    assert generate_advice(stats) == DEFAULT_ADVICE
+
+
+def test_generate_advice_fills_templates():
+    advice = generate_advice(statistics())
+    assert [rule.name for rule in evaluate_rules(statistics())] == ["night_owl", "peak_hour", "weekend_scroller"]
+    assert advice[0].startswith("40% of your likes")
+    assert "14:00" in advice[1]
+
+
+def test_rewrite_is_cached_by_rules(mocker, tmp_path):
+    rewrite = mocker.Mock(side_effect=lambda templates: [t.upper() if "{" not in t else "Hi! " + t for t in templates])
+    cache = AdviceCache(str(tmp_path / "cache.json"))
+    first = generate_advice(statistics(), rewrite=rewrite, cache=cache)
+    second = generate_advice(statistics(hourly={"2": 40, "15": 60}), rewrite=rewrite, cache=cache)
+    assert rewrite.call_count == 1
+    assert first[1] == "Hi! Your activity peaks around 14:00. Post during this window to reach people with habits like yours."
+    assert "15:00" in second[1]
+    # The cache is persisted and shared with new processes
+    with open(tmp_path / "cache.json") as f:
+        assert len(json.load(f)) == 1
+    assert len(AdviceCache(str(tmp_path / "cache.json"))) == 1
+
+
+def test_rewrite_keeping_wrong_placeholders_is_discarded(mocker):
+    rewrite = mocker.Mock(return_value=["{unknown} likes", "Peak at {peak_hour}h", "Weekends!"])
+    advice = generate_advice(statistics(), rewrite=rewrite)
+    assert advice[0] == generate_advice(statistics())[0]
+    assert advice[1] == "Peak at 14h"
+    assert advice[2] == generate_advice(statistics())[2]
+
+
+def test_failed_rewrite_falls_back_to_rules(mocker):
+    rewrite = mocker.Mock(side_effect=RuntimeError("API down"))
+    cache = AdviceCache()
+    assert generate_advice(statistics(), rewrite=rewrite, cache=cache) == generate_advice(statistics())
+    assert len(cache) == 0
+
+
+def test_rules_are_named_uniquely():
+    assert len({rule.name for rule in RULES}) == len(RULES)
+
+
+@pytest.mark.parametrize("rewording", [
+    "{night_percent}% at night :-}",
+    "{night_percent.__class__}% at night",
+    "{night_percent!r}% at night",
+    "{night_percent:>1000000000}% at night",
+    "{night_percent[0]}% at night",
+])
+def test_malformed_rewording_is_not_cached(mocker, rewording):
+    rewrite = mocker.Mock(return_value=[rewording, "Peak at {peak_hour}h", "Weekends!"])
+    cache = AdviceCache()
+    advice = generate_advice(statistics(), rewrite=rewrite, cache=cache)
+    assert advice[0] == generate_advice(statistics())[0]
+    assert cache.get(evaluate_rules(statistics()))[0] == RULES[0].text
+
+
+def test_malformed_cached_rewording_falls_back(tmp_path):
+    cache = AdviceCache(str(tmp_path / "cache.json"))
+    triggered = evaluate_rules(statistics())
+    cache.put(triggered, ["{night_percent}% :-}", "{peak_hour.real}", "{weekend_percent}% on weekends!"])
+    advice = generate_advice(statistics(), rewrite=lambda templates: templates, cache=cache)
+    assert advice[:2] == generate_advice(statistics())[:2]
+    assert advice[2] == "100% on weekends!"
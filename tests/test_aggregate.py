@@ -0,0 +1,72 @@
+import json
+import random
+import pytest
+from buda.analysis.aggregate import PopulationAggregator, aggregate_results_store
+from buda.results_store import ResultsStore
+
+CATEGORIES = ["Technology", "Finance", "Retail", "Unknown", "Pending"]
+
+
+def make_users(n, seed=0):
+    rng = random.Random(seed)
+    users = []
+    for _ in range(n):
+        companies = {f"company{rng.randrange(300)}": rng.choice(CATEGORIES) for _ in range(rng.randrange(1, 20))}
+        hourly = {str(rng.randrange(24)): rng.randrange(1, 5) for _ in range(3)}
+        users.append({"company_categories": companies, "hourly_activity": hourly, "day_of_week_activity": {"0": 1}})
+    return users
+
+
+def aggregate(users, **kwargs):
+    with PopulationAggregator(**kwargs) as aggregator:
+        for user in users:
+            aggregator.add_user(**user)
+        return aggregator.result(), aggregator.spills
+
+
+def test_counts():
+    result, spills = aggregate([
+        {"company_categories": {"a": "Technology", "b": "Unknown"}, "hourly_activity": {"5": 2}},
+        {"company_categories": {"a": "Finance", "c": "Finance"}, "day_of_week_activity": {"6": 3}},
+    ])
+    assert spills == 0
+    assert result["users"] == 2
+    assert result["companies_categories"] == {"Technology": 1, "Finance": 2, "Unknown": 1}
+    assert result["companies_broad_categories"] == {"Technology": 1, "Business": 2, "Uncategorized": 1}
+    # 'a' is tied between Technology and Finance; the lower category code wins
+    assert sum(result["distinct_companies"].values()) == 2
+    assert result["hourly_activity"] == {"5": 2}
+    assert result["day_of_week_activity"] == {"6": 3}
+
+
+@pytest.mark.parametrize("activity", [{"hourly_activity": {"24": 1}}, {"day_of_week_activity": {"-1": 1}},
+                                      {"hourly_activity": {"noon": 1}}])
+def test_invalid_activity_skips_user(activity, caplog):
+    result, _ = aggregate([{"company_categories": {"a": "Technology"}, **activity}, {"hourly_activity": {"5": 2}}])
+    assert result["users"] == 1
+    assert result["companies_categories"] == {}
+    assert result["hourly_activity"] == {"5": 2}
+    assert "Skipping a user" in caplog.text
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7])
+def test_spilling_gives_exact_results(chunk_size, tmp_path):
+    users = make_users(200)
+    in_memory, _ = aggregate(users)
+    spilled, spills = aggregate(users, memory_budget=2000, chunk_size=chunk_size, n_partitions=4,
+                                spill_dir=str(tmp_path / "spill"))
+    assert spills > 1
+    assert spilled == in_memory
+    assert list((tmp_path / "spill").iterdir()) == []
+
+
+def test_aggregate_results_store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.write("u1", "old", {"hourly_activity": {"1": 100}})
+    store.write("u1", "new", {"hourly_activity": {"1": 1}})
+    store.write("u2", "job", {"hourly_activity": {"2": 1}, "company_categories": {"a": "Retail"}})
+    result = aggregate_results_store(store, output_folder=str(tmp_path))
+    assert result["users"] == 2
+    assert result["hourly_activity"] == {"1": 1, "2": 1}
+    with open(tmp_path / "population_statistics.json") as f:
+        assert json.load(f) == result
@@ -0,0 +1,13 @@
+import pytest
+
+pytest.importorskip("flask")
+from markupsafe import escape
+
+
+def test_results_without_job_show_the_mock_advice(flask_app):
+    response = flask_app.app.test_client().get("/results")
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    for advice in flask_app.mock_data["advice"]:
+        assert str(escape(advice)) in page
+    assert "<li class=\"mb-2\">message</li>" not in page
@@ -0,0 +1,49 @@
+import io
+import json
+import asyncio
+import pytest
+
+pytest.importorskip("quart")
+from werkzeug.datastructures import FileStorage
+
+LIKES = {"likes_media_likes": [
+    {"title": "alice", "string_list_data": [{"href": "https://www.instagram.com/p/1/", "timestamp": 1700000000}]},
+]}
+
+
+@pytest.fixture
+def asgi_app(flask_app):
+    # The ASGI app runs the jobs of the Flask app and shares its stores
+    from app import asgi_app
+    return asgi_app
+
+
+def test_upload_progress_results(asgi_app):
+    async def scenario():
+        client = asgi_app.app.test_client()
+        upload = FileStorage(io.BytesIO(json.dumps(LIKES).encode("utf-8")), filename="liked_posts.json")
+        response = await client.post("/upload", files={"file": upload})
+        assert response.status_code == 302
+        job_id = response.headers["Location"].split("job=")[1]
+
+        response = await client.get(f"/progress/{job_id}")
+        assert response.status_code == 200
+        body = await response.get_data()
+        assert b'"stage": "done"' in body
+
+        response = await client.get("/results", query_string={"job": job_id}, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        etag = response.headers["ETag"]
+        response = await client.get("/results", query_string={"job": job_id},
+                                    headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert response.status_code == 304
+
+        response = await client.get("/progress/" + "0" * 32)
+        assert response.status_code == 404
+
+    asyncio.run(scenario())
+
+
+def test_jobs_do_not_use_the_default_executor(asgi_app):
+    assert asgi_app.job_executor._max_workers == asgi_app.app.config["JOB_WORKERS"]
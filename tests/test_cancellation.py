@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import signal
+import pytest
+import requests
+from buda.analysis import companies
+from buda.cancellation import CancelToken, cancel_on_signals
+from buda.transport import RequestPolicy
+
+
+def test_time_limit():
+    token = CancelToken(time_limit=0)
+    assert token.cancelled
+    assert token.reason == "time limit reached"
+    assert CancelToken().remaining() is None
+
+
+def test_cancel_keeps_first_reason():
+    token = CancelToken()
+    token.cancel("first")
+    token.cancel("second")
+    assert token.cancelled
+    assert token.reason == "first"
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGINT") or os.name == "nt", reason="needs POSIX signals")
+def test_signal_cancels_token():
+    token = CancelToken()
+    with cancel_on_signals(token):
+        os.kill(os.getpid(), signal.SIGINT)
+        token.wait(1)
+    assert token.cancelled
+
+
+def test_partial_results_are_pending(tmp_path, mocker):
+    def classify(api_key, company_name, policy=None):
+        if company_name != "fast":
+            time.sleep(2)
+        return "Retail"
+
+    mocker.patch.object(companies, "query_on_demand_api", side_effect=classify)
+    data = [{"advertiser_name": name} for name in ["fast", "slow1", "slow2"]]
+    result = companies.assign_categories_async(data, "key", False, str(tmp_path), cancel=CancelToken(time_limit=0.5))
+    assert result == {"fast": "Retail", "slow1": "Pending", "slow2": "Pending"}
+    assert json.loads((tmp_path / "categorized_data.json").read_text()) == result
+
+
+def test_child_token():
+    parent = CancelToken()
+    child = parent.child(time_limit=0)
+    assert child.cancelled
+    # The child's time limit does not cancel the parent
+    assert not parent.cancelled
+    sibling = parent.child()
+    parent.cancel("stopped")
+    assert sibling.cancelled and sibling.reason == "stopped"
+    assert parent.child().cancelled
+
+
+def test_in_flight_requests_stop_at_the_time_limit(tmp_path, mocker):
+    timeouts = []
+
+    def post(url, headers, json, timeout):
+        # A request that is answered only after its read timeout
+        timeouts.append(timeout)
+        time.sleep(timeout[1])
+        raise requests.Timeout("read timed out")
+
+    session = mocker.Mock(post=post)
+    data = [{"advertiser_name": f"company{i}"} for i in range(3)]
+    start = time.monotonic()
+    result = companies.assign_categories_async(data, "key", False, str(tmp_path), policy=RequestPolicy(session=session),
+                                               cancel=CancelToken(time_limit=0.3))
+    assert set(result.values()) <= {"Unknown", "Pending"}
+    assert max(read for _, read in timeouts) <= 0.3
+    assert time.monotonic() - start < 2
@@ -0,0 +1,46 @@
+from buda.analysis.categories import ACCOUNT_CATEGORIES, COMPANY_CATEGORIES
+
+
+def test_normalize_variants():
+    technology = COMPANY_CATEGORIES.categories.index("Technology")
+    for answer in ["Technology", "Technology.", "technology", " 'Technology' ", "3. Technology", "Category: Technology"]:
+        assert COMPANY_CATEGORIES.normalize(answer) == technology
+
+
+def test_normalize_fallback():
+    assert COMPANY_CATEGORIES.categories[COMPANY_CATEGORIES.normalize("no idea")] == "Other"
+    assert COMPANY_CATEGORIES.categories[COMPANY_CATEGORIES.normalize("Unknown")] == "Unknown"
+    assert COMPANY_CATEGORIES.categories[COMPANY_CATEGORIES.normalize("Food & Beverage")] == "Food and Beverage"
+
+
+def test_count_and_broad_count():
+    codes = COMPANY_CATEGORIES.encode(["Technology.", "technology", "Retail", "Gaming", "Unknown"])
+    assert COMPANY_CATEGORIES.counts_to_dict(COMPANY_CATEGORIES.count(codes)) == {
+        "Technology": 2,
+        "Retail": 1,
+        "Gaming": 1,
+        "Unknown": 1,
+    }
+    broad = COMPANY_CATEGORIES.count_broad(codes)
+    assert COMPANY_CATEGORIES.counts_to_dict(broad, broad=True) == {
+        "Media": 1,
+        "Technology": 3,
+        "Uncategorized": 1,
+    }
+
+
+def test_account_broad_default():
+    codes = ACCOUNT_CATEGORIES.encode(["Cats", "Brand", "Unknown"])
+    broad = ACCOUNT_CATEGORIES.counts_to_dict(ACCOUNT_CATEGORIES.count_broad(codes), broad=True)
+    assert broad == {"Friends": 1, "Other": 1, "Pets": 1}
+
+
+def test_encode_empty():
+    codes = ACCOUNT_CATEGORIES.encode([])
+    assert ACCOUNT_CATEGORIES.count(codes).sum() == 0
+
+
+def test_petsafe_brand_is_health():
+    codes = COMPANY_CATEGORIES.encode(["PetSafe Brand"])
+    assert COMPANY_CATEGORIES.counts_to_dict(COMPANY_CATEGORIES.count(codes)) == {"PetSafe Brand": 1}
+    assert COMPANY_CATEGORIES.counts_to_dict(COMPANY_CATEGORIES.count_broad(codes), broad=True) == {"Health": 1}
@@ -0,0 +1,45 @@
+import sys
+import subprocess
+import pytest
+from buda.category_index import CategoryIndex, build_category_index
+
+
+def test_lookup(tmp_path):
+    path = tmp_path / "index.bin"
+    count = build_category_index({"ADARA": "Technology", "Liquid I.V.": "Food and Beverage", "Code3": "Unknown"}, path)
+    assert count == 2
+    with CategoryIndex(path) as index:
+        assert len(index) == 2
+        assert index.lookup("ADARA") == "Technology"
+        assert index.lookup("  liquid   i.v. ") == "Food and Beverage"
+        assert index.lookup("Code3") is None
+        assert "Missing" not in index
+
+
+def test_majority_vote(tmp_path):
+    path = tmp_path / "index.bin"
+    build_category_index([{"ADARA": "Technology"}, {"adara": "Technology"}, {"ADARA": "Consulting"}], path)
+    with CategoryIndex(path) as index:
+        assert index.lookup("Adara") == "Technology"
+        assert index.categories == ("Technology",)
+
+
+def test_empty_index(tmp_path):
+    path = tmp_path / "index.bin"
+    build_category_index({}, path)
+    with CategoryIndex(path) as index:
+        assert len(index) == 0
+        assert index.lookup("ADARA") is None
+
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"not an index at all")
+    with pytest.raises(ValueError):
+        CategoryIndex(path)
+
+
+def test_import_does_not_load_the_analysis_package():
+    # Loading an index must stay cheap, without pandas, matplotlib and the analysis modules
+    code = "import sys, buda.category_index; assert 'buda.analysis' not in sys.modules and 'pandas' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,90 @@
+from datetime import datetime
+from buda.analysis.events import EventTable, EVENT_KINDS, NO_TIMESTAMP, export_kind
+from buda.analysis.likes import count_activity, extract_hours, get_hourly_activity, get_days_of_week_activity, get_activity, analyze_likes
+
+EXPORT = {
+    "likes_media_likes": [
+        {"title": "alice", "string_list_data": [{"href": "https://www.instagram.com/p/1/", "timestamp": 1700000000}]},
+        {"title": "bob", "string_list_data": [{"href": "https://www.instagram.com/reel/2/", "timestamp": 1700003600}]},
+    ],
+    "likes_comment_likes": [
+        {"title": "alice", "string_list_data": [{"href": "https://www.instagram.com/p/3/", "timestamp": 1700007200}]},
+    ],
+    "comments_reels_comments": [
+        {"string_map_data": {"Comment": {"value": "nice"}, "Media Owner": {"value": "carol"},
+                             "Time": {"timestamp": 1700010800}}},
+    ],
+    "saved_saved_media": [
+        {"title": "bob", "string_map_data": {"Saved on": {"href": "https://www.instagram.com/p/4/",
+                                                          "timestamp": 1700014400}}},
+    ],
+    "story_activities_polls": [
+        {"title": "carol", "string_list_data": [{"timestamp": 1700018000}]},
+    ],
+    "ig_custom_audiences_all_types": [
+        {"advertiser_name": "Shop", "has_data_file_custom_audience": True},
+    ],
+    "profile_user": [{"title": "ignored"}],
+}
+
+
+def test_export_kind():
+    assert export_kind("likes_media_likes") == "post_like"
+    assert export_kind("story_activities_quizzes") == "story_interaction"
+    assert export_kind("profile_user") is None
+
+
+def test_from_export():
+    events = EventTable.from_export(EXPORT)
+    assert len(events) == 7
+    frame = events.to_frame()
+    assert frame["kind"].value_counts()["post_like"] == 2
+    assert list(frame["account"][frame["kind"] == "comment"]) == ["carol"]
+    assert list(frame["url_kind"][:2]) == ["post", "reel"]
+    audience = frame[frame["kind"] == "ad_audience"].iloc[0]
+    assert audience["account"] == "Shop"
+    assert audience["timestamp"] == NO_TIMESTAMP
+
+
+def test_select():
+    events = EventTable.from_export(EXPORT)
+    assert len(events.select(["post_like", "comment_like"])) == 3
+    assert len(events.select(timed=True)) == 6
+
+
+def test_extract_hours_matches_local_time():
+    expected = [datetime.fromtimestamp(item["string_list_data"][0]["timestamp"]).hour
+                for item in EXPORT["likes_media_likes"]]
+    assert extract_hours(EXPORT) == expected
+    assert len(extract_hours(EventTable.from_export(EXPORT), kinds=None)) == 6
+
+
+def test_count_activity_per_kind():
+    hourly, daily = count_activity(EXPORT)
+    assert list(hourly.index) == list(EVENT_KINDS)
+    assert hourly.shape == (len(EVENT_KINDS), 24)
+    assert hourly.loc["post_like"].sum() == 2
+    assert hourly.loc["ad_audience"].sum() == 0
+    assert daily.values.sum() == 6
+    hourly_likes = get_hourly_activity(EXPORT)
+    assert dict(hourly_likes) == {hour: count for hour, count in hourly.loc["post_like"].items() if count}
+
+
+def test_get_activity_builds_the_table_once(mocker):
+    from_export = mocker.spy(EventTable, "from_export")
+    events = EventTable.from_export(EXPORT)
+    hourly, daily = get_activity(events, kinds=None)
+    assert from_export.call_count == 1
+    assert hourly == get_hourly_activity(EXPORT, kinds=None)
+    assert daily == get_days_of_week_activity(EXPORT, kinds=None)
+
+
+def test_analyze_likes_collects_results(mocker):
+    for name in ("display_hourly_statistics", "plot_hourly_activity", "plot_hourly_activity_circle"):
+        mocker.patch(f"buda.analysis.likes.{name}")
+    results = mocker.Mock()
+    analyze_likes(EXPORT, results=results)
+    added = {call.args[0]: call.args[1] for call in results.add.call_args_list}
+    assert added["liked_posts"] == 2
+    assert added["hourly_activity"] == get_hourly_activity(EXPORT)
+    assert added["day_of_week_activity"] == get_days_of_week_activity(EXPORT)
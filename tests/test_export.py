@@ -0,0 +1,79 @@
+import json
+import zipfile
+import pytest
+from buda.export import InstagramExport, match_member
+from buda.utils import load_data
+from buda.analysis.events import EventTable
+
+LIKES = {"likes_media_likes": [
+    {"title": "alice", "string_list_data": [{"href": "https://www.instagram.com/p/1/", "timestamp": 1700000000}]},
+]}
+COMMENTS = [
+    {"string_map_data": {"Media Owner": {"value": "bob"}, "Time": {"timestamp": 1700003600}}},
+]
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    path = tmp_path / "instagram-export.zip"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("your_instagram_activity/likes/liked_posts.json", json.dumps(LIKES))
+        archive.writestr("your_instagram_activity/comments/post_comments_1.json", json.dumps(COMMENTS))
+        archive.writestr("your_instagram_activity/comments/post_comments_2.json", json.dumps(COMMENTS))
+        archive.writestr("personal_information/personal_information.json", json.dumps({}))
+        archive.writestr("__MACOSX/likes/liked_posts.json", "not json")
+    return str(path)
+
+
+def test_match_member():
+    assert match_member("likes/liked_posts.json") == "likes_media_likes"
+    assert match_member("your_instagram_activity/comments/post_comments_3.json") == "comments_media_comments"
+    assert match_member("media/posts/photo.jpg") is None
+    assert match_member("__MACOSX/likes/liked_posts.json") is None
+
+
+def test_lazy_datasets(export_path):
+    export = InstagramExport(export_path)
+    assert set(export) == {"likes_media_likes", "comments_media_comments"}
+    assert not export._datasets
+    assert export["likes_media_likes"] == LIKES["likes_media_likes"]
+    assert list(export._datasets) == ["likes_media_likes"]
+    assert len(export["comments_media_comments"]) == 2
+    with pytest.raises(KeyError):
+        export["saved_saved_media"]
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_concurrent_load(export_path, processes):
+    export = InstagramExport(export_path, max_workers=2, processes=processes).load()
+    assert set(export._datasets) == {"likes_media_likes", "comments_media_comments"}
+    assert len(export["comments_media_comments"]) == 2
+
+
+def test_load_data_zip(export_path, mocker):
+    export = load_data(export_path)
+    assert isinstance(export, InstagramExport)
+    load = mocker.spy(export, "load")
+    assert len(EventTable.from_export(export)) == 3
+    # The event datasets are loaded in one concurrent pass
+    load.assert_called_once()
+    assert set(export._datasets) == {"likes_media_likes", "comments_media_comments"}
+
+
+def test_close_releases_handles(export_path):
+    from buda.utils import open_data
+
+    with open_data(export_path) as export:
+        export.load()
+        archives = list(export._archives)
+        assert archives
+    assert all(archive.fp is None for archive in archives)
+    # Loaded datasets survive closing, and later reads reopen the archive
+    assert export["likes_media_likes"] == LIKES["likes_media_likes"]
+
+
+def test_load_data_accepts_paths(export_path):
+    import pathlib
+
+    with load_data(pathlib.Path(export_path)) as export:
+        assert export["likes_media_likes"] == LIKES["likes_media_likes"]
@@ -0,0 +1,55 @@
+import json
+import random
+from collections import Counter
+from buda.analysis.heavy_hitters import SpaceSaving, content_type, get_like_stream_statistics, save_like_stream_statistics
+
+
+def test_exact_mode():
+    sketch = SpaceSaving()
+    for item in "abacabad":
+        sketch.update(item)
+    assert sketch.top(2) == [("a", 4, 0), ("b", 2, 0)]
+    assert sketch.total == 8
+
+
+def test_bounded_sketch_finds_heavy_hitters():
+    rng = random.Random(0)
+    stream = ["heavy1"] * 500 + ["heavy2"] * 300 + [f"noise{rng.randrange(2000)}" for _ in range(2000)]
+    rng.shuffle(stream)
+    sketch = SpaceSaving(capacity=50)
+    for item in stream:
+        sketch.update(item)
+    assert len(sketch) <= 50
+    top = sketch.top(2)
+    assert [item for item, _, _ in top] == ["heavy1", "heavy2"]
+    true_counts = Counter(stream)
+    for item, estimate, error in top:
+        assert estimate - error <= true_counts[item] <= estimate
+
+
+def test_content_type():
+    assert content_type("https://www.instagram.com/p/examplepost1/") == "post"
+    assert content_type("https://www.instagram.com/reel/examplepost2/") == "reel"
+    assert content_type("") == "other"
+
+
+def test_save_like_stream_statistics(tmp_path):
+    data = {
+        "likes_media_likes": [
+            {"title": "a", "string_list_data": [{"href": "https://www.instagram.com/p/1/"}]},
+            {"title": "a", "string_list_data": [{"href": "https://www.instagram.com/reel/2/"}]},
+            {"title": "b", "string_list_data": [{"href": "https://www.instagram.com/reel/3/"}]},
+        ]
+    }
+    save_like_stream_statistics(data, tmp_path, k=1)
+    assert json.loads((tmp_path / "top_liked_accounts.json").read_text()) == [
+        {"name": "a", "value": 2},
+        {"name": "Others", "value": 1},
+    ]
+    assert json.loads((tmp_path / "liked_content_types.json").read_text()) == {"post": 1, "reel": 2}
+
+
+def test_large_input_is_bounded():
+    likes = [{"title": f"user{i % 5000}", "string_list_data": [{"href": ""}]} for i in range(20)]
+    statistics = get_like_stream_statistics({"likes_media_likes": likes}, capacity=5, exact_threshold=10)
+    assert len(statistics.accounts) == 5
@@ -0,0 +1,50 @@
+import io
+import json
+import zipfile
+import pytest
+from app.loadtest import Recorder, export_file, synthetic_export
+from buda.analysis.events import EventTable
+from buda.utils import load_data
+
+
+def test_synthetic_export():
+    data = synthetic_export(500, n_accounts=20, seed=1)
+    likes = data["likes_media_likes"]
+    assert len(likes) == 500
+    assert len({item["title"] for item in likes}) <= 20
+    assert synthetic_export(500, n_accounts=20, seed=1)["likes_media_likes"][0]["title"] == likes[0]["title"]
+    # The likes parse like a real export
+    assert len(EventTable.from_export(data).select(("post_like",), timed=True)) == 500
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_export_file(tmp_path, compress):
+    data = synthetic_export(10)
+    name, content = export_file(data, compress=compress)
+    path = tmp_path / name
+    path.write_bytes(content)
+    if compress:
+        assert name.endswith(".zip")
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            assert archive.namelist() == ["your_instagram_activity/likes/liked_posts.json"]
+    else:
+        assert json.loads(content) == data
+    assert load_data(path)["likes_media_likes"] == data["likes_media_likes"]
+
+
+def test_recorder_summary():
+    recorder = Recorder()
+    for i in range(1, 101):
+        recorder.record("results", i / 1000, ok=i % 10 != 0)
+    recorder.record("upload", 0.5, ok=True)
+    summary = recorder.summary(elapsed=2.0)
+    assert list(summary) == ["results", "upload"]
+    results = summary["results"]
+    assert results["requests"] == 100
+    assert results["throughput"] == 50
+    assert results["error_rate"] == pytest.approx(0.1)
+    assert results["p50_ms"] == pytest.approx(50.5)
+    assert results["p99_ms"] == pytest.approx(99.01)
+    assert results["max_ms"] == pytest.approx(100)
+    assert summary["upload"]["error_rate"] == 0
+    assert summary["upload"]["p95_ms"] == pytest.approx(500)
@@ -0,0 +1,47 @@
+import json
+from collections import Counter
+import numpy as np
+from buda.analysis.likes import get_hourly_activity, get_days_of_week_activity
+from buda.analysis.parallel import SharedCounts, parallel_activity, split_timestamps
+
+
+def make_export(n, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = rng.integers(1_600_000_000, 1_700_000_000, n)
+    return {"likes_media_likes": [
+        {"title": f"a{i % 7}", "string_list_data": [{"href": "https://www.instagram.com/p/x/", "timestamp": int(t)}]}
+        for i, t in enumerate(timestamps)
+    ]}
+
+
+def test_shared_counts_partitions():
+    with SharedCounts(2) as counts:
+        counts.add(0, np.array([1, 1, 23]), np.array([0, 0, 6]))
+        attached = SharedCounts(2, counts.name)
+        attached.add(1, np.array([1]), np.array([0]))
+        attached.close()
+        assert counts.counts[0, 0, 1] == 2 and counts.counts[1, 0, 1] == 1
+        heatmap = counts.reduce()
+    assert heatmap.shape == (7, 24)
+    assert heatmap[0, 1] == 3 and heatmap[6, 23] == 1 and heatmap.sum() == 4
+
+
+def test_parallel_activity_matches_serial():
+    data = make_export(1000)
+    result = parallel_activity(split_timestamps(data, 5), processes=2)
+    assert result["events"] == 1000
+    assert result["hourly_activity"] == get_hourly_activity(data)
+    assert result["day_of_week_activity"] == get_days_of_week_activity(data)
+    assert result["heatmap"].sum() == 1000
+
+
+def test_parallel_activity_over_users(tmp_path):
+    paths = []
+    for seed in range(3):
+        path = tmp_path / f"user{seed}.json"
+        path.write_text(json.dumps(make_export(50, seed)))
+        paths.append(str(path))
+    result = parallel_activity(paths, processes=2)
+    expected = sum((get_hourly_activity(make_export(50, seed)) for seed in range(3)), Counter())
+    assert result["hourly_activity"] == expected
+    assert result["events"] == 150
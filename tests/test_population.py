@@ -0,0 +1,69 @@
+import math
+import random
+import numpy as np
+from buda.analysis.population import KLLSketch, PopulationSketches, user_metrics, summarize_rank
+
+
+def test_sketch_is_small_and_accurate():
+    rng = random.Random(0)
+    values = [rng.expovariate(1 / 500) for _ in range(50_000)]
+    sketch = KLLSketch(k=200, seed=1)
+    for value in values:
+        sketch.update(value)
+    assert sketch.n == 50_000
+    assert len(sketch) < 1000
+    values.sort()
+    for q in (0.1, 0.5, 0.9, 0.99):
+        assert abs(sketch.rank(values[int(q * len(values))]) - q) < 0.02
+        assert abs(np.searchsorted(values, sketch.quantile(q)) / len(values) - q) < 0.02
+
+
+def test_merge_matches_single_stream():
+    left, right = KLLSketch(seed=1), KLLSketch(seed=2)
+    for value in range(10_000):
+        (left if value % 2 else right).update(value)
+    left.merge(right)
+    assert left.n == 10_000
+    assert abs(left.rank(2_500) - 0.25) < 0.02
+    restored = KLLSketch.from_dict(left.to_dict())
+    assert restored.rank(2_500) == left.rank(2_500)
+
+
+def test_empty_sketch():
+    assert math.isnan(KLLSketch().rank(1))
+
+
+def test_user_metrics():
+    likes = [{"title": "a", "string_list_data": [{"timestamp": 1700000000 + 3600 * i}]} for i in range(24)]
+    metrics = user_metrics({"likes_media_likes": likes}, {"a": "Art"})
+    assert metrics["total_likes"] == 24
+    assert metrics["night_share"] == 0.25
+    assert metrics["category_share:Art"] == 1.0
+
+
+def test_population_rank_and_persistence(tmp_path):
+    population = PopulationSketches()
+    for total in range(100):
+        population.add({"total_likes": total, "night_share": 0.1})
+    ranks = population.rank({"total_likes": 89, "peak_hour": 3})
+    assert ranks == {"total_likes": 90.0}
+    assert summarize_rank(ranks).startswith("Your Instagram engagement is above average!")
+    assert "compared" in summarize_rank(ranks, min_users=1000, users=population.users())
+
+    path = str(tmp_path / "population.json")
+    population.save(path)
+    assert PopulationSketches.load(path).rank({"total_likes": 89}) == ranks
+    assert PopulationSketches.load(str(tmp_path / "missing.json")).users() == 0
+
+
+def test_rank_and_add_merges_saves(tmp_path):
+    path = str(tmp_path / "population.json")
+    first, second = PopulationSketches.load(path), PopulationSketches.load(path)
+    assert first.rank_and_add({"total_likes": 10}, path) == ({}, 0)
+    ranks, users = second.rank_and_add({"total_likes": 20}, path)
+    # The second process ranks against its own view, but its save keeps the first process's user
+    assert users == 0 and ranks == {}
+    assert second.users() == 2
+    ranks, users = first.rank_and_add({"total_likes": 30}, path)
+    assert users == 1
+    assert PopulationSketches.load(path).users() == 3
@@ -0,0 +1,26 @@
+import json
+from buda.profiling import StageProfiler
+
+
+def test_report(tmp_path):
+    path = tmp_path / "profile.json"
+    with StageProfiler(str(path)) as profiler:
+        with profiler.stage("allocate"):
+            data = [list(range(100)) for _ in range(100)]
+        with profiler.stage("sum"):
+            sum(map(sum, data))
+    report = json.loads(path.read_text())
+    assert [stage["name"] for stage in report["stages"]] == ["allocate", "sum"]
+    allocate = report["stages"][0]
+    assert allocate["peak_memory"] > 0
+    assert allocate["wall_time"] >= 0
+    assert allocate["top_lines"]
+    assert set(allocate["top_functions"][0]) == {"function", "calls", "total_time", "cumulative_time"}
+
+
+def test_disabled(tmp_path):
+    with StageProfiler() as profiler:
+        with profiler.stage("noop"):
+            pass
+    assert profiler.stages == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from buda.progress import ProgressBroker, ProgressTracker
+
+
+def test_tracker_events():
+    events = []
+    tracker = ProgressTracker("stage", 3, events.append, min_interval=0)
+    for _ in range(3):
+        tracker.advance()
+    assert [event["done"] for event in events] == [0, 1, 2, 3]
+    assert events[-1]["finished"]
+    assert events[-1]["eta"] == 0
+    assert not events[1]["finished"]
+
+
+def test_tracker_throttles():
+    events = []
+    tracker = ProgressTracker("stage", 100, events.append, min_interval=60)
+    for _ in range(100):
+        tracker.advance()
+    assert [event["done"] for event in events] == [0, 100]
+
+
+def test_broker_wait():
+    broker = ProgressBroker()
+    assert broker.wait("job", 0, timeout=0) == (0, None)
+    threading.Timer(0.05, broker.publish, args=("job", {"stage": "done"})).start()
+    seen, event = broker.wait("job", 0, timeout=5)
+    assert seen == 1
+    assert event == {"stage": "done"}
+    assert broker.latest("job") == {"stage": "done"}
+    broker.discard("job")
+    assert broker.latest("job") is None
+
+
+def test_broker_forgets_finished_jobs():
+    broker = ProgressBroker(retention=0)
+    broker.publish("running", {"stage": "activity"})
+    broker.publish("finished", {"stage": "done"}, final=True)
+    assert broker.latest("finished") == {"stage": "done"}
+    # Expired jobs are forgotten when the next event is published
+    broker.publish("other", {"stage": "activity"})
+    assert broker.latest("finished") is None
+    assert broker.latest("running") == {"stage": "activity"}
+
+
+def test_broker_wait_async():
+    broker = ProgressBroker()
+
+    async def follow():
+        assert await broker.wait_async("job", 0, timeout=0.01) == (0, None)
+        # Published from another thread while the coroutine awaits it
+        threading.Timer(0.05, broker.publish, args=("job", {"stage": "done"})).start()
+        return await broker.wait_async("job", 0, timeout=5)
+
+    assert asyncio.run(follow()) == (1, {"stage": "done"})
+    assert broker._watchers == {}
@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+from buda.results_store import ResultsStore, JobResults
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultsStore(str(tmp_path / "results.sqlite"))
+
+
+def test_write_and_read(store):
+    store.write("u", "job1", {"hourly_activity": {"5": 3}, "liked_posts": 12})
+    store.write("u", "job1", {"liked_posts": 13})
+    assert store.read("u", "job1") == {"hourly_activity": {"5": 3}, "liked_posts": 13}
+    assert store.read("u", "job1", ["liked_posts", "missing"]) == {"liked_posts": 13}
+    assert store.read("other", "job1") == {}
+
+
+def test_dataframes_are_stored_as_records(store):
+    frame = pd.DataFrame({"Category": ["Technology"], "Number of Companies": [2]})
+    store.write("u", "job1", {"company_category_statistics": frame})
+    assert store.read("u", "job1")["company_category_statistics"] == [
+        {"Category": "Technology", "Number of Companies": 2}
+    ]
+
+
+def test_jobs_and_delete(store):
+    store.write("u", "old", {"a": 1})
+    store.write("u", "new", {"a": 2})
+    assert store.jobs("u") == ["new", "old"]
+    store.delete("u", "old")
+    assert store.jobs("u") == ["new"]
+
+
+def test_job_results_flush_on_error(store):
+    with pytest.raises(RuntimeError):
+        with JobResults(store, "u", "job1") as results:
+            results.add("hourly_activity", {"1": 1})
+            assert store.read("u", "job1") == {}
+            raise RuntimeError("stage failed")
+    assert store.read("u", "job1") == {"hourly_activity": {"1": 1}}
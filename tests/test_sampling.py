@@ -0,0 +1,68 @@
+import random
+import pytest
+from buda.analysis.categories import ACCOUNT_CATEGORIES
+from buda.analysis.sampling import (
+    estimate_category_counts,
+    load_sampling_design,
+    required_sample_size,
+    save_sampling_design,
+    stratified_sample,
+    stratify,
+)
+
+
+def test_required_sample_size():
+    assert required_sample_size(0) == 0
+    assert required_sample_size(10) == 10
+    assert required_sample_size(1_000_000) == 384
+    assert required_sample_size(1_000_000, margin=0.01) > required_sample_size(1_000_000, margin=0.05)
+
+
+def test_stratify_and_sample():
+    weights = {f"a{i}": 1 for i in range(100)}
+    weights.update({f"b{i}": 50 for i in range(3)})
+    strata = stratify(weights)
+    assert strata["a0"] == 0
+    assert strata["b0"] == 3
+    sample = stratified_sample(strata, 20, seed=0)
+    assert len(set(sample)) == len(sample)
+    assert sum(name.startswith("b") for name in sample) == 2
+
+
+def test_full_sample_is_exact(tmp_path):
+    categorized = {f"a{i}": "Cats" if i % 4 == 0 else "Music" for i in range(40)}
+    strata = stratify({name: 1 for name in categorized})
+    design = save_sampling_design(strata, list(categorized), tmp_path)
+    assert load_sampling_design(tmp_path) == design
+    estimates = estimate_category_counts(categorized, design, ACCOUNT_CATEGORIES).set_index("Category")
+    assert estimates.loc["Cats", "Estimate"] == pytest.approx(10)
+    assert estimates.loc["Cats", "Lower"] == pytest.approx(10)
+    assert estimates.loc["Music", "Upper"] == pytest.approx(30)
+
+
+def test_estimate_covers_truth():
+    rng = random.Random(1)
+    population = {f"a{i}": "Cats" if rng.random() < 0.3 else "Music" for i in range(5000)}
+    strata = stratify({name: 1 for name in population})
+    sample = stratified_sample(strata, required_sample_size(len(population)), seed=2)
+    design = {"confidence": 0.95, "strata_sizes": {"0": len(population)}, "strata": {name: 0 for name in sample}}
+    estimates = estimate_category_counts({name: population[name] for name in sample}, design, ACCOUNT_CATEGORIES, broad=True)
+    pets = estimates.set_index("Category").loc["Pets"]
+    truth = sum(category == "Cats" for category in population.values())
+    assert pets["Lower"] <= truth <= pets["Upper"]
+
+
+def test_uncovered_stratum_is_reported(caplog):
+    design = {"confidence": 0.95, "strata_sizes": {"0": 10, "1": 5}, "strata": {f"a{i}": 0 for i in range(10)}}
+    categorized = {f"a{i}": "Cats" for i in range(10)}
+    estimates = estimate_category_counts(categorized, design, ACCOUNT_CATEGORIES).set_index("Category")
+    assert estimates.loc["Unestimated", "Estimate"] == 5
+    assert estimates.loc["Cats", "Estimate"] == pytest.approx(10)
+    assert estimates.loc["Cats", "Upper"] == pytest.approx(15)
+    assert "5 names" in caplog.text
+
+
+def test_single_sample_is_not_exact():
+    design = {"confidence": 0.95, "strata_sizes": {"0": 100}, "strata": {"a0": 0}}
+    estimates = estimate_category_counts({"a0": "Cats"}, design, ACCOUNT_CATEGORIES).set_index("Category")
+    assert estimates.loc["Cats", "Lower"] < estimates.loc["Cats", "Estimate"] - 50
@@ -0,0 +1,33 @@
+import json
+from buda.scheduling import RequestBudget, plan_requests, prioritize, save_coverage_report
+
+
+def test_budget_limit():
+    assert RequestBudget().limit is None
+    assert RequestBudget(max_names=5).limit == 5
+    assert RequestBudget(max_names=5, max_cost=1.0, cost_per_name=0.25).limit == 4
+    assert RequestBudget(max_cost=-1).limit == 0
+
+
+def test_prioritize():
+    assert prioritize(["b", "a", "b", "c"]) == ["b", "a", "c"]
+    assert prioritize(["b", "a", "c"], {"a": 3, "c": 3, "b": 1}) == ["a", "c", "b"]
+
+
+def test_plan_requests():
+    assert plan_requests(["a", "b", "c"]) == (["a", "b", "c"], [])
+    assert plan_requests(["a", "b", "c"], RequestBudget(max_names=2)) == (["a", "b"], ["c"])
+
+
+def test_coverage_report(tmp_path):
+    report = save_coverage_report({"a": "Art"}, {"a": 3, "b": 1}, ["b"], tmp_path)
+    assert report["coverage"] == 0.75
+    assert json.loads((tmp_path / "classification_coverage.json").read_text()) == report
+
+
+def test_coverage_counts_only_resolved_names(tmp_path):
+    categorized = {"a": "Art", "b": "Pending", "c": "Unknown"}
+    report = save_coverage_report(categorized, {"a": 1, "b": 6, "c": 4}, [], tmp_path)
+    assert report["classified"] == 1
+    assert report["unresolved"] == 2
+    assert report["coverage"] == 1 / 11
@@ -0,0 +1,92 @@
+import os
+import json
+import socket
+import time
+import threading
+import pytest
+from buda.server import WorkerServer, JobFailed, submit
+
+
+def failing_job(context, message):
+    raise ValueError(message)
+
+
+@pytest.fixture
+def serve(tmp_path):
+    servers = []
+
+    def start(**kwargs):
+        socket_path = str(tmp_path / "buda.sock")
+        server = WorkerServer(socket_path, preload=(), jobs={"fail": failing_job}, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append((server, thread))
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.01)
+        return server, socket_path
+
+    yield start
+    for server, thread in servers:
+        server.stop()
+        thread.join(10)
+
+
+def test_jobs_run_in_forked_workers(serve, tmp_path):
+    server, socket_path = serve(workers=2)
+    answer = submit(socket_path, "ping", timeout=10)
+    assert answer["pid"] != os.getpid()
+
+    file_path = tmp_path / "liked_posts.json"
+    likes = [{"title": "a", "string_list_data": [{"href": "https://www.instagram.com/p/x/", "timestamp": 0}]}]
+    file_path.write_text(json.dumps({"likes_media_likes": likes}))
+    result = submit(socket_path, "activity", timeout=10, file_path=str(file_path))
+    assert sum(result["hourly_activity"].values()) == 1
+    assert result["top_liked_accounts"][0]["name"] == "a"
+
+
+def test_failed_job(serve):
+    server, socket_path = serve(workers=1)
+    with pytest.raises(JobFailed, match="ValueError: broken"):
+        submit(socket_path, "fail", timeout=10, message="broken")
+    # The worker survives a failed job
+    assert submit(socket_path, "ping", timeout=10)["jobs"] == 1
+
+
+def test_exited_workers_are_replaced(serve):
+    server, socket_path = serve(workers=1, max_jobs=1)
+    first = submit(socket_path, "ping", timeout=10)["pid"]
+    second = submit(socket_path, "ping", timeout=10)["pid"]
+    assert first != second
+
+
+def test_stop_removes_socket(serve):
+    server, socket_path = serve(workers=1)
+    submit(socket_path, "ping", timeout=10)
+    server.stop()
+    for _ in range(100):
+        if not os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+    assert not os.path.exists(socket_path)
+    assert server.pids == set()
+
+
+def test_stalled_client_does_not_hold_worker(serve):
+    server, socket_path = serve(workers=1, request_timeout=0.2)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+        stalled.connect(socket_path)
+        # The only worker gives up on the silent client and takes the next job
+        assert submit(socket_path, "ping", timeout=10)["jobs"] == 1
+
+
+def test_worker_context_uses_mapped_indexes(mocker):
+    from buda import server
+
+    map_companies = mocker.patch("buda.analysis.companies.map_companies")
+    mocker.patch("buda.utils.open_data")
+    index = object()
+    context = server.WorkerContext(None, {"companies": "companies.idx"}, {"companies": index})
+    server._companies_job(context, "export.zip", "output")
+    assert map_companies.call_args.kwargs["index"] is index
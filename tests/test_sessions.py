@@ -0,0 +1,55 @@
+import numpy as np
+from buda.analysis.sessions import (
+    account_engagement_over_time,
+    detect_sessions,
+    extract_timestamps,
+    rolling_activity,
+    session_statistics,
+)
+
+
+def make_likes(entries):
+    return {
+        "likes_media_likes": [
+            {"title": title, "string_list_data": [{"href": "", "value": "", "timestamp": ts}]}
+            for title, ts in entries
+        ]
+    }
+
+
+def test_detect_sessions():
+    timestamps = np.array([0, 60, 120, 5000, 5030, 20000])
+    sessions = detect_sessions(timestamps, gap=600)
+    assert sessions["likes"].tolist() == [3, 2, 1]
+    assert sessions["start"].tolist() == [0, 5000, 20000]
+    assert sessions["duration"].tolist() == [120, 30, 0]
+    assert session_statistics(sessions)["sessions"] == 3
+
+
+def test_detect_sessions_empty():
+    sessions = detect_sessions(np.array([], dtype=np.int64))
+    assert len(sessions) == 0
+    assert session_statistics(sessions)["likes"]["mean"] == 0.0
+
+
+def test_extract_timestamps_sorted():
+    data = make_likes([("a", 30), ("b", 10), ("a", 20)])
+    assert extract_timestamps(data).tolist() == [10, 20, 30]
+
+
+def test_rolling_activity_counts_all_likes():
+    day = 86400
+    timestamps = np.sort(np.array([0, 10, day * 2 + 5, day * 9, day * 9 + 1]) + 1_700_000_000)
+    daily = rolling_activity(timestamps, freq="D", window=3)
+    assert daily["likes"].sum() == len(timestamps)
+    assert daily["rolling_mean"].iloc[0] == daily["likes"].iloc[0]
+    weekly = rolling_activity(timestamps, freq="W-MON")
+    assert weekly["likes"].sum() == len(timestamps)
+
+
+def test_account_engagement_over_time():
+    start = 1_700_000_000
+    data = make_likes([("a", start), ("b", start + 1), ("a", start + 86400 * 8), ("a", start + 2)])
+    engagement = account_engagement_over_time(data, freq="D", top=1)
+    assert engagement.index.tolist() == ["a"]
+    assert engagement.values.sum() == 3
@@ -0,0 +1,33 @@
+import gzip
+from buda import snapshots
+from buda.snapshots import accepted_encodings, save_snapshot, load_snapshot, clear_snapshot, snapshot_etag
+
+HTML = "<html><body>results</body></html>"
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br;q=0.5, identity;q=0") == {"gzip": 1.0, "deflate": 1.0, "br": 0.5}
+    assert accepted_encodings(None) == {}
+
+
+def test_gzip_and_plain(tmp_path, mocker):
+    mocker.patch.object(snapshots, "brotli", None)
+    etag = save_snapshot(str(tmp_path), HTML)
+    assert snapshot_etag(str(tmp_path)) == etag
+    body, encoding, gzip_etag = load_snapshot(str(tmp_path), "gzip, br")
+    assert encoding == "gzip" and gzip_etag == f"{etag}-gzip"
+    assert gzip.decompress(body).decode() == HTML
+    # Each encoding is its own representation with its own strong ETag
+    assert load_snapshot(str(tmp_path), "") == (HTML.encode(), None, f"{etag}-identity")
+
+
+def test_etag_changes_with_content(tmp_path):
+    assert save_snapshot(str(tmp_path), HTML) == save_snapshot(str(tmp_path), HTML)
+    assert save_snapshot(str(tmp_path), HTML + " ") != save_snapshot(str(tmp_path), HTML)
+
+
+def test_clear_snapshot(tmp_path):
+    save_snapshot(str(tmp_path), HTML)
+    clear_snapshot(str(tmp_path))
+    assert load_snapshot(str(tmp_path), "gzip") is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,158 @@
+import time
+import pytest
+import requests
+from buda.cancellation import CancelToken
+from buda.transport import DeadlineExceeded, RequestPolicy, Cassette, CassetteMiss
+
+
+def test_post_sets_timeout(mocker):
+    post = mocker.patch("requests.post")
+    post.return_value.json.return_value = {"data": {"id": "1"}}
+    policy = RequestPolicy(timeout=(1, 2))
+    assert policy.post("https://example.com", {}, {}) == {"data": {"id": "1"}}
+    assert post.call_args.kwargs["timeout"] == (1, 2)
+    assert policy.statistics.as_dict() == {"requests": 1}
+
+
+def test_post_counts_deadline_hits(mocker):
+    mocker.patch("requests.post", side_effect=requests.Timeout("read timed out"))
+    policy = RequestPolicy()
+    with pytest.raises(DeadlineExceeded):
+        policy.post("https://example.com", {}, {})
+    assert policy.statistics.as_dict() == {"deadline_hits": 1}
+
+
+def test_run_deadline_caps_timeout():
+    policy = RequestPolicy(timeout=(3, 30), run_timeout=0.5)
+    connect, read = policy.request_timeout()
+    assert connect <= 0.5 and read <= 0.5
+    policy.run_timeout = 0
+    policy.start_run()
+    with pytest.raises(DeadlineExceeded):
+        policy.request_timeout()
+
+
+def test_run_token_caps_timeout():
+    policy = RequestPolicy(timeout=(3, 30))
+    token = CancelToken(time_limit=0.5)
+    policy.start_run(token)
+    connect, read = policy.request_timeout()
+    assert connect <= 0.5 and read <= 0.5
+    token.cancel()
+    with pytest.raises(DeadlineExceeded):
+        policy.request_timeout()
+
+
+def test_hedged_call_takes_first_answer():
+    calls = []
+
+    def classify():
+        calls.append(None)
+        # The first attempt hangs, the duplicate answers immediately
+        if len(calls) == 1:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    policy = RequestPolicy(hedge=True, min_hedge_delay=0.05)
+    assert policy.call(classify) == "fast"
+    statistics = policy.statistics.as_dict()
+    assert statistics["hedged_requests"] == 1
+    assert statistics["hedge_wins"] == 1
+    policy.close()
+
+
+def test_backups_start_while_all_primaries_are_slow():
+    from concurrent.futures import ThreadPoolExecutor
+
+    attempts = {}
+
+    def classify(name):
+        attempts[name] = attempts.get(name, 0) + 1
+        if attempts[name] == 1:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    policy = RequestPolicy(hedge=True, min_hedge_delay=0.05)
+    start = time.monotonic()
+    # As many callers as primary threads, as in the company classifier
+    with ThreadPoolExecutor(max_workers=10) as callers:
+        answers = list(callers.map(lambda name: policy.call(classify, name), range(10)))
+    assert answers == ["fast"] * 10
+    assert time.monotonic() - start < 0.8
+    assert policy.statistics.as_dict()["hedge_wins"] == 10
+    policy.close()
+
+
+def test_hedged_call_without_duplicate():
+    policy = RequestPolicy(hedge=True, min_hedge_delay=5)
+    assert policy.call(lambda: "answer") == "answer"
+    assert policy.statistics.as_dict() == {}
+    assert policy.latency.percentile(95) is not None
+    policy.close()
+
+
+def test_cassette_key_ignores_session_id():
+    body = {"query": "Company: Acme"}
+    assert Cassette.key("https://api.on-demand.io/chat/v1/sessions/abc/query", body) == \
+        Cassette.key("https://api.on-demand.io/chat/v1/sessions/xyz/query", body)
+    assert Cassette.key("https://example.com", body) != Cassette.key("https://example.com", {"query": "Other"})
+
+
+def test_record_then_replay(tmp_path, mocker):
+    path = str(tmp_path / "cassettes" / "api.json.gz")
+    post = mocker.patch("requests.post")
+    post.return_value.json.return_value = {"data": {"answer": "Technology"}}
+    with Cassette(path, mode="record") as cassette:
+        policy = RequestPolicy(cassette=cassette)
+        assert policy.post("https://example.com/sessions/1/query", {"apikey": "secret"}, {"q": 1})["data"]["answer"] == "Technology"
+    assert post.call_count == 1
+
+    post.reset_mock()
+    policy = RequestPolicy(cassette=Cassette(path))
+    answer = policy.post("https://example.com/sessions/2/query", {}, {"q": 1})
+    assert answer == {"data": {"answer": "Technology"}}
+    answer["data"]["answer"] = "changed"
+    assert policy.post("https://example.com/sessions/3/query", {}, {"q": 1})["data"]["answer"] == "Technology"
+    assert policy.statistics.as_dict() == {"replayed_requests": 2}
+    with pytest.raises(CassetteMiss):
+        policy.post("https://example.com/sessions/2/query", {}, {"q": 2})
+    post.assert_not_called()
+    with open(path, "rb") as f:
+        assert b"secret" not in f.read()
+
+
+def test_mixed_mode_sends_only_misses(tmp_path, mocker):
+    path = str(tmp_path / "api.json.gz")
+    post = mocker.patch("requests.post")
+    post.return_value.json.return_value = {"data": {"id": "1"}}
+    policy = RequestPolicy(cassette=Cassette(path, mode="mixed"))
+    policy.post("https://example.com", {}, {"a": 1})
+    policy.post("https://example.com", {}, {"a": 1})
+    policy.close()
+    assert post.call_count == 1
+    assert policy.statistics.as_dict() == {"requests": 1, "replayed_requests": 1}
+    assert len(Cassette(path)) == 1
+
+
+def test_replay_requires_cassette(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Cassette(str(tmp_path / "missing.json.gz"))
+
+
+def test_replay_miss_fails_the_run(tmp_path, mocker):
+    from buda.analysis.companies import assign_categories_async
+
+    path = str(tmp_path / "api.json.gz")
+    with Cassette(path, mode="record") as cassette:
+        cassette.record("https://example.com", {}, {})
+    post = mocker.patch("requests.post")
+    policy = RequestPolicy(cassette=Cassette(path))
+    close = mocker.spy(policy, "close")
+    with pytest.raises(CassetteMiss, match="2 requests"):
+        assign_categories_async([{"advertiser_name": "a"}, {"advertiser_name": "b"}], "key", False,
+                                str(tmp_path), policy=policy)
+    post.assert_not_called()
+    close.assert_called_once()
+    assert (tmp_path / "run_statistics.json").exists()
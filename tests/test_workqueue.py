@@ -0,0 +1,104 @@
+import json
+import time
+import pytest
+from buda.workqueue import WorkQueue, run_worker, rebuild_results
+from buda.cancellation import CancelToken
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "queue.sqlite")
+
+
+def test_lease_by_priority(db_path):
+    with WorkQueue(db_path) as queue:
+        assert queue.enqueue("companies", ["a", "b", "c"], {"b": 5, "c": 1}) == 3
+        assert queue.enqueue("companies", ["a"]) == 0
+        assert queue.lease("companies", "w1", 2) == ["b", "c"]
+        assert queue.lease("companies", "w2", 2) == ["a"]
+        assert queue.lease("companies", "w3", 2) == []
+
+
+def test_expired_lease_is_requeued(db_path):
+    with WorkQueue(db_path, lease_timeout=0.01) as queue:
+        queue.enqueue("companies", ["a"])
+        assert queue.lease("companies", "crashed") == ["a"]
+        time.sleep(0.02)
+        assert queue.lease("companies", "w2") == ["a"]
+
+
+def test_results_are_written_once(db_path):
+    with WorkQueue(db_path, lease_timeout=0.01) as queue:
+        queue.enqueue("companies", ["a", "b"])
+        queue.lease("companies", "slow", 2)
+        time.sleep(0.02)
+        queue.lease("companies", "fast", 2)
+        assert queue.complete("companies", "fast", {"a": "Technology", "b": "Finance"}) == 2
+        assert queue.complete("companies", "slow", {"a": "Retail"}) == 0
+        assert queue.categorized_data("companies") == {"a": "Technology", "b": "Finance"}
+        assert queue.status("companies")["done"] == 2
+
+
+def test_names_are_given_up_after_max_attempts(db_path):
+    with WorkQueue(db_path, lease_timeout=0.01, max_attempts=2) as queue:
+        queue.enqueue("companies", ["poison", "fine"])
+        for worker in ("w1", "w2"):
+            queue.lease("companies", worker, 2)
+            time.sleep(0.02)
+        assert queue.lease("companies", "w3") == []
+        assert queue.status("companies")["failed"] == 2
+        assert queue.categorized_data("companies") == {"fine": "Unknown", "poison": "Unknown"}
+
+
+def test_worker_and_coordinator(db_path, tmp_path, mocker):
+    mocker.patch("buda.analysis.companies.query_on_demand_api", side_effect=lambda api_key, name, policy: "Technology")
+    with WorkQueue(db_path) as queue:
+        queue.enqueue("companies", ["a", "b", "c"])
+    assert run_worker(db_path, "companies", "key", batch_size=2) == 3
+
+    output_folder = tmp_path / "output"
+    data = rebuild_results(db_path, "companies", str(output_folder))
+    assert data == {"a": "Technology", "b": "Technology", "c": "Technology"}
+    with open(output_folder / "categorized_data.json") as f:
+        assert json.load(f) == data
+    with open(output_folder / "summary_categories.json") as f:
+        assert json.load(f) == {"Technology": 3}
+
+
+def test_cancelled_worker_releases_its_names(db_path):
+    cancel = CancelToken()
+    cancel.cancel()
+    with WorkQueue(db_path) as queue:
+        queue.enqueue("instagram_accounts", ["a"])
+    assert run_worker(db_path, "instagram_accounts", "key", cancel=cancel) == 0
+    with WorkQueue(db_path) as queue:
+        assert queue.status("instagram_accounts")["queued"] == 1
+        assert queue.categorized_data("instagram_accounts") == {"a": "Pending"}
+
+
+def test_slow_batch_keeps_its_leases(db_path, mocker):
+    other = WorkQueue(db_path)
+    stolen = []
+
+    def classify(api_key, name, policy):
+        time.sleep(0.2)
+        stolen.extend(other.lease("companies", "other", 5))
+        return "Technology"
+
+    mocker.patch("buda.analysis.companies.query_on_demand_api", side_effect=classify)
+    with WorkQueue(db_path) as queue:
+        queue.enqueue("companies", ["a", "b", "c"])
+    # The batch takes twice the lease timeout, but every name finishes within it
+    assert run_worker(db_path, "companies", "key", batch_size=3, lease_timeout=0.3) == 3
+    assert stolen == []
+    other.close()
+
+
+def test_rebuild_account_results(db_path, tmp_path):
+    with WorkQueue(db_path) as queue:
+        queue.enqueue("instagram_accounts", ["a", "b"])
+        queue.lease("instagram_accounts", "w1", 2)
+        queue.complete("instagram_accounts", "w1", {"a": "Art", "b": "Art"})
+    rebuild_results(db_path, "instagram_accounts", str(tmp_path))
+    with open(tmp_path / "liked_posts_category_counts.json") as f:
+        assert json.load(f)["Art"] == 2